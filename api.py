@@ -0,0 +1,496 @@
+"""Headless JSON API over the game logic, for clients that should not drive Streamlit.
+
+Runs as its own process next to the Streamlit app, against the same database:
+
+    python api.py --port 8502
+
+Requests are parsed on an asyncio event loop and each action runs on a small pool
+of worker threads, each holding one pooled database connection. Clients log in
+once for a bearer token and send it as "Authorization: Bearer <token>". Behind a
+reverse proxy, list its address in RPGLIFE_TRUSTED_PROXIES so login throttling
+sees the client address it appends to X-Forwarded-For.
+
+    POST /v1/login                 {"username", "password"} -> {"token", "user_id"}
+    POST /v1/logout
+    GET  /v1/me                    stats, level progress and task slots
+    POST /v1/me/time-zone          {"time_zone"} -> {"time_zone", "current_streak", "longest_streak"}
+    GET  /v1/tasks                 due tasks with the points each would earn; ?all=1 adds scheduled
+                                   tasks that are not due yet
+    POST /v1/tasks/<id>/complete   -> {"points", "unlocked"}
+    POST /v1/tasks/complete        {"task_ids"} -> {"completed", "points", "unlocked"}
+    POST /v1/xp                    {"amount"} -> {"converted", "unlocked"}
+    GET  /v1/rewards
+    POST /v1/rewards/<id>/redeem   -> {"redeemed", "unlocked"}
+    GET  /v1/achievements
+    GET  /v1/leaderboard           ?board=all|weekly|monthly&limit=  -> {"top", "rank", ...}
+    GET  /v1/completions           ?limit=&cursor=  keyset pages of history
+    GET  /v1/transactions          ?limit=&cursor=
+    GET  /v1/redemptions           ?limit=&cursor=
+    POST /v1/batch                 {"requests": [{"method", "path", "body"}], "atomic": false}
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import secrets
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlsplit
+
+import credentials
+import database as db
+import models
+
+API_HOST = "127.0.0.1"
+API_PORT = 8502
+API_WORKERS = db.MAX_IDLE_CONNECTIONS  # one pooled connection per worker thread
+TOKEN_TTL = timedelta(days=30)
+MAX_BODY_BYTES = 1 << 20
+MAX_BATCH_REQUESTS = 50
+MAX_PAGE_SIZE = 100
+IDLE_TIMEOUT = 30  # seconds a keep-alive connection may sit between requests
+REQUEST_TIMEOUT = 30  # seconds to send a whole request once it has started
+MAX_HEADERS = 100
+MAX_HEADER_BYTES = 16 << 10
+
+STATUS_TEXT = {
+    200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed",
+    408: "Request Timeout", 409: "Conflict", 411: "Length Required", 413: "Payload Too Large",
+    429: "Too Many Requests", 431: "Request Header Fields Too Large", 500: "Internal Server Error",
+}
+
+log = logging.getLogger("rpglife.api")
+_executor = None
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class _Rollback(Exception):
+    # Raised out of an atomic batch so db.transaction() undoes every request in it.
+    pass
+
+
+# --- Routing ---
+
+ROUTES = []  # (method, compiled path pattern, handler, needs_token)
+
+
+def route(method, pattern, needs_token=True):
+    def register(fn):
+        ROUTES.append((method, re.compile(pattern + "$"), fn, needs_token))
+        return fn
+    return register
+
+
+def _hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _authenticate(headers):
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise ApiError(401, "Missing bearer token")
+    user_id = db.get_api_token_user(_hash_token(token.strip()))
+    if user_id is None:
+        raise ApiError(401, "Invalid or expired token")
+    return user_id
+
+
+def _match(method, path):
+    allowed = False
+    for route_method, pattern, handler, needs_token in ROUTES:
+        match = pattern.match(path)
+        if match:
+            if route_method == method:
+                return handler, match.groups(), needs_token
+            allowed = True
+    raise ApiError(405 if allowed else 404, "Method not allowed" if allowed else "Not found")
+
+
+def dispatch(request):
+    # Runs one request on a worker thread. request: method, path, query, headers, body, ip.
+    handler, args, needs_token = _match(request["method"], request["path"])
+    user_id = _authenticate(request["headers"]) if needs_token else None
+    return handler(request, user_id, *args)
+
+
+def _handle(request):
+    try:
+        return 200, dispatch(request)
+    except ApiError as e:
+        return e.status, {"error": e.message}
+    except credentials.AuthThrottled as e:
+        return 429, {"error": str(e)}
+    except Exception:
+        log.exception("Unhandled error in %s %s", request["method"], request["path"])
+        return 500, {"error": "Internal server error"}
+
+
+# --- Request helpers ---
+
+def _int_field(body, name, minimum=1):
+    value = body.get(name) if isinstance(body, dict) else None
+    if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+        raise ApiError(400, f"'{name}' must be an integer >= {minimum}")
+    return value
+
+
+def _page_args(request):
+    query = request["query"]
+    try:
+        limit = int(query.get("limit", 20))
+    except ValueError:
+        raise ApiError(400, "'limit' must be an integer") from None
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    cursor = query.get("cursor")
+    if cursor:
+        try:
+            db.decode_cursor(cursor)
+        except ValueError as e:
+            raise ApiError(400, str(e)) from None
+    return limit, cursor
+
+
+def _rows(rows):
+    return [dict(row) for row in rows]
+
+
+def _achievement_names(unlocked):
+    return [{"id": a["id"], "name": a["name"], "icon": a["icon"]} for a in unlocked]
+
+
+# --- Endpoints ---
+
+@route("POST", "/v1/login", needs_token=False)
+def login(request, user_id):
+    body = request["body"] or {}
+    username, password = body.get("username"), body.get("password")
+    if not isinstance(username, str) or not isinstance(password, str):
+        raise ApiError(400, "'username' and 'password' are required")
+    user = credentials.login(username, password, request["ip"])
+    if user is None:
+        raise ApiError(401, "Invalid username or password")
+    token = secrets.token_urlsafe(32)
+    expires_at = (datetime.now(timezone.utc) + TOKEN_TTL).strftime("%Y-%m-%d %H:%M:%S")
+    db.create_api_token(user["id"], _hash_token(token), expires_at)
+    return {"token": token, "user_id": user["id"], "expires_at": expires_at}
+
+
+@route("POST", "/v1/logout")
+def logout(request, user_id):
+    _, _, token = request["headers"]["authorization"].partition(" ")
+    db.delete_api_token(_hash_token(token.strip()))
+    return {"ok": True}
+
+
+@route("GET", "/v1/me")
+def me(request, user_id):
+    stats = dict(db.get_user_stats(user_id))
+    stats["xp_progress"] = models.xp_progress(stats["total_xp"], stats["level"])
+    stats["next_level_xp"] = models.xp_for_level(stats["level"] + 1)
+    stats["task_slots"] = models.get_task_slots(stats["level"])
+    return stats
+
+
+@route("POST", "/v1/me/time-zone")
+def set_time_zone(request, user_id):
+    name = (request["body"] or {}).get("time_zone")
+    if name is not None and not isinstance(name, str):
+        raise ApiError(400, "'time_zone' must be a string or null")
+    try:
+        models.set_time_zone(user_id, name)
+    except ValueError as e:
+        raise ApiError(400, str(e)) from None
+    return db.get_user_stats(user_id, ("time_zone", "current_streak", "longest_streak"))._asdict()
+
+
+@route("GET", "/v1/tasks")
+def tasks(request, user_id):
+    level = db.get_user_stats(user_id, ("level",)).level
+    rows = _rows(db.get_active_tasks(user_id) if request["query"].get("all") else db.get_due_tasks(user_id))
+    for task in rows:
+        task["points"] = models.calc_points_earned(task["difficulty"], level)
+    return rows
+
+
+@route("POST", r"/v1/tasks/(\d+)/complete")
+@db.queued_write
+def complete_task(request, user_id, task_id):
+    task_id = int(task_id)
+    with db.transaction(db.shard_path(user_id)):
+        # Checked inside the write transaction so two clients cannot both complete a task.
+        active = db.get_active_tasks(user_id, ("id", "difficulty", "next_due_at"))
+        task = next((t for t in active if t.id == task_id), None)
+        if task is None:
+            raise ApiError(404, "No such active task")
+        points = models.calc_points_earned(task.difficulty, db.get_user_stats(user_id, ("level",)).level)
+        unlocked = models.complete_task(user_id, task_id, points)
+        if unlocked is None:
+            due = datetime.fromtimestamp(task.next_due_at, timezone.utc).isoformat()
+            raise ApiError(409, f"Task is not due until {due}")
+    return {"points": points, "unlocked": _achievement_names(unlocked)}
+
+
+@route("POST", "/v1/tasks/complete")
+def complete_tasks(request, user_id):
+    task_ids = (request["body"] or {}).get("task_ids")
+    if not isinstance(task_ids, list) or not all(isinstance(t, int) and not isinstance(t, bool) for t in task_ids):
+        raise ApiError(400, "'task_ids' must be a list of integers")
+    completed, points, unlocked = models.complete_tasks(user_id, task_ids)
+    return {"completed": completed, "points": points, "unlocked": _achievement_names(unlocked)}
+
+
+@route("POST", "/v1/xp")
+def spend_xp(request, user_id):
+    amount = _int_field(request["body"], "amount")
+    converted, unlocked = models.convert_points_to_xp(user_id, amount)
+    if not converted:
+        raise ApiError(409, "Not enough points")
+    return {"converted": amount, "unlocked": _achievement_names(unlocked)}
+
+
+@route("GET", "/v1/rewards")
+def rewards(request, user_id):
+    return _rows(db.get_rewards(user_id))
+
+
+@route("POST", r"/v1/rewards/(\d+)/redeem")
+def redeem_reward(request, user_id, reward_id):
+    reward_id = int(reward_id)
+    reward = next((r for r in db.get_rewards(user_id, ("id", "point_cost")) if r.id == reward_id), None)
+    if reward is None:
+        raise ApiError(404, "No such reward")
+    redeemed, unlocked = models.redeem_reward(user_id, reward_id, reward.point_cost)
+    if not redeemed:
+        raise ApiError(409, "Not enough points")
+    return {"redeemed": reward_id, "points_spent": reward.point_cost, "unlocked": _achievement_names(unlocked)}
+
+
+@route("GET", "/v1/achievements")
+def achievements(request, user_id):
+    unlocked = db.get_user_achievements(user_id)
+    progress = models.get_achievement_progress(user_id)
+    return [
+        dict(a, unlocked_at=unlocked.get(a["id"]), progress=progress(a["requirement_type"], a["requirement_value"]))
+        for a in db.get_all_achievements()
+    ]
+
+
+@route("GET", "/v1/leaderboard")
+def leaderboard(request, user_id):
+    board = request["query"].get("board", "all")
+    limit, _ = _page_args(request)
+    if board == "all":
+        rank, total = models.get_rank(user_id)
+        return {"board": board, "top": models.get_top_players(limit), "rank": rank, "players": total,
+                "neighbors": models.get_neighbors(user_id)}
+    if board not in db.LEADERBOARDS:
+        raise ApiError(400, "'board' must be all, weekly or monthly")
+    top = models.get_period_leaderboard(board, limit)
+    rank = next((e["rank"] for e in top if e["user_id"] == user_id), None)
+    return {"board": board, "top": top, "rank": rank}
+
+
+def _page(fetch):
+    def handler(request, user_id):
+        limit, cursor = _page_args(request)
+        rows, next_cursor = fetch(user_id, limit, cursor)
+        return {"items": _rows(rows), "next_cursor": next_cursor}
+    return handler
+
+
+route("GET", "/v1/completions")(_page(db.get_task_completions_page))
+route("GET", "/v1/transactions")(_page(db.get_point_transactions_page))
+route("GET", "/v1/redemptions")(_page(db.get_redemption_history_page))
+
+
+@route("POST", "/v1/batch")
+def batch(request, user_id):
+    # Runs several requests in one round trip and one worker hop. With "atomic": true
+    # they share a single transaction and the first failure rolls all of them back.
+    body = request["body"] or {}
+    items = body.get("requests")
+    if not isinstance(items, list) or not items:
+        raise ApiError(400, "'requests' must be a non-empty list")
+    if len(items) > MAX_BATCH_REQUESTS:
+        raise ApiError(413, f"At most {MAX_BATCH_REQUESTS} requests per batch")
+
+    subrequests = []
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get("path"), str):
+            raise ApiError(400, "Each request needs a 'path'")
+        url = urlsplit(item["path"])
+        if url.path in ("/v1/batch", "/v1/login", "/v1/logout"):
+            raise ApiError(400, f"{url.path} cannot be batched")
+        subrequests.append(dict(
+            request,
+            method=str(item.get("method", "GET")).upper(),
+            path=url.path,
+            query={k: v[-1] for k, v in parse_qs(url.query).items()},
+            body=item.get("body"),
+        ))
+
+    if not body.get("atomic"):
+        return [dict(zip(("status", "body"), _handle(sub))) for sub in subrequests]
+
+    results = []
+    try:
+        _run_atomic(user_id, subrequests, results)
+    except _Rollback:
+        return {"committed": False, "results": results}
+    return {"committed": True, "results": results}
+
+
+@db.queued_write
+def _run_atomic(user_id, subrequests, results):
+    with db.transaction(db.shard_path(user_id)):
+        for sub in subrequests:
+            status, payload = _handle(sub)
+            results.append({"status": status, "body": payload})
+            if status != 200:
+                raise _Rollback()
+
+
+# --- HTTP server ---
+
+async def _read_request(reader, peer_ip):
+    # Returns the parsed request, or None when the client closed the connection. Once the
+    # first line arrives the rest must follow within REQUEST_TIMEOUT, so a client trickling
+    # headers or body cannot hold the connection open.
+    try:
+        line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+    except ValueError:
+        raise ApiError(431, "Request line too long") from None
+    if not line:
+        return None
+    try:
+        return await asyncio.wait_for(_read_rest(reader, line, peer_ip), REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise ApiError(408, "Request not received in time") from None
+
+
+async def _read_rest(reader, line, peer_ip):
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise ApiError(400, "Malformed request line") from None
+
+    headers = {}
+    header_lines = header_bytes = 0
+    while True:
+        try:
+            line = await reader.readline()  # ValueError past the stream limit, MAX_HEADER_BYTES
+        except ValueError:
+            raise ApiError(431, "Request headers too large") from None
+        if line in (b"\r\n", b"\n", b""):
+            break
+        header_lines += 1
+        header_bytes += len(line)
+        if header_lines > MAX_HEADERS or header_bytes > MAX_HEADER_BYTES:
+            raise ApiError(431, "Request headers too large")
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise ApiError(411, "Send a Content-Length instead of chunked encoding")
+    length = headers.get("content-length") or "0"
+    if not re.fullmatch(r"[0-9]+", length):
+        raise ApiError(400, "Invalid Content-Length")
+    length = int(length)
+    if length > MAX_BODY_BYTES:
+        raise ApiError(413, "Request body too large")
+    body = None
+    if length:
+        try:
+            body = json.loads(await reader.readexactly(length))
+        except (ValueError, RecursionError):
+            raise ApiError(400, "Body must be JSON") from None
+
+    url = urlsplit(target)
+    keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+    return {
+        "method": method.upper(),
+        "path": url.path,
+        "query": {k: v[-1] for k, v in parse_qs(url.query).items()},
+        "headers": headers,
+        "body": body,
+        "ip": credentials.forwarded_ip(peer_ip, headers.get("x-forwarded-for")),
+        "keep_alive": keep_alive,
+    }
+
+
+def _response(status, payload, keep_alive):
+    body = json.dumps(payload, ensure_ascii=False, default=str).encode()
+    head = (
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("latin-1") + body
+
+
+async def _serve_client(reader, writer):
+    peer = writer.get_extra_info("peername")
+    peer_ip = peer[0] if peer else "unknown"
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                request = await _read_request(reader, peer_ip)
+            except ApiError as e:
+                writer.write(_response(e.status, {"error": e.message}, False))
+                break
+            if request is None:
+                break
+            status, payload = await loop.run_in_executor(_executor, _handle, request)
+            writer.write(_response(status, payload, request["keep_alive"]))
+            await writer.drain()
+            if not request["keep_alive"]:
+                break
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host=API_HOST, port=API_PORT):
+    global _executor
+    db.init_db()
+    db.delete_expired_api_tokens()
+    models.start_leaderboard_refresh()
+    models.start_schedule_materializer()
+    _executor = ThreadPoolExecutor(API_WORKERS, thread_name_prefix="api")
+    server = await asyncio.start_server(_serve_client, host, port, limit=MAX_HEADER_BYTES)
+    log.info("RPG Life API listening on http://%s:%d", host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        _executor.shutdown(wait=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the RPG Life JSON API")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--db", help="database file (defaults to rpglife.db next to the app)")
+    args = parser.parse_args(argv)
+    if args.db:
+        db.DB_PATH = args.db
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
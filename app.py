@@ -1,8 +1,10 @@
+from importlib import import_module
+
 import streamlit as st
 import database as db
+import models
 import auth
-from components.sidebar import render_sidebar
-from views import dashboard, tasks, rewards, achievements, categories, settings
+from components.sidebar import render_sidebar, render_debug_panel
 
 st.set_page_config(
     page_title="RPG Life",
@@ -11,24 +13,33 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
-# Initialize database
+# Initialize database (applies pending migrations once per process; a no-op on reruns)
 db.init_db()
+models.start_leaderboard_refresh()
+models.start_schedule_materializer()
 
 # Auth gate
 if not auth.is_logged_in():
     auth.render_auth_page()
 else:
     user_id = auth.get_current_user_id()
-    current_page = render_sidebar(user_id)
-
+    # Page modules are imported on first visit, so a worker serving the login or tasks
+    # page never loads the dashboard's charting stack.
     page_map = {
-        "dashboard": dashboard.render,
-        "tasks": tasks.render,
-        "rewards": rewards.render,
-        "achievements": achievements.render,
-        "categories": categories.render,
-        "settings": settings.render,
+        "dashboard": "views.dashboard",
+        "tasks": "views.tasks",
+        "rewards": "views.rewards",
+        "achievements": "views.achievements",
+        "leaderboard": "views.leaderboard",
+        "categories": "views.categories",
+        "settings": "views.settings",
     }
 
-    render_fn = page_map.get(current_page, dashboard.render)
-    render_fn(user_id)
+    # Every statement this rerun runs is recorded for the admin query panel.
+    with db.record_queries() as query_log:
+        current_page = render_sidebar(user_id)
+        page = import_module(page_map.get(current_page, page_map["dashboard"]))
+        page.render(user_id)
+
+    if auth.is_admin():
+        render_debug_panel(query_log)
@@ -1,30 +1,28 @@
-import hashlib
 import os
 import streamlit as st
-import database as db
+from credentials import TRUSTED_PROXIES, AuthThrottled, forwarded_ip, login, signup
 
+# Usernames that see admin-only tools such as the query debug panel.
+ADMIN_USERNAMES = {name.strip() for name in os.environ.get("RPGLIFE_ADMINS", "").split(",") if name.strip()}
 
-def _hash_password(password, salt=None):
-    if salt is None:
-        salt = os.urandom(32).hex()
-    hashed = hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), 100_000).hex()
-    return hashed, salt
+# Address of connections Streamlit reports without one (it leaves local ones blank).
+LOOPBACK = "127.0.0.1"
 
 
-def signup(username, password):
-    password_hash, salt = _hash_password(password)
-    user_id = db.create_user(username, password_hash, salt)
-    return user_id
-
-
-def login(username, password):
-    user = db.get_user_by_username(username)
-    if user is None:
-        return None
-    hashed, _ = _hash_password(password, user["salt"])
-    if hashed == user["password_hash"]:
-        return user
-    return None
+def _client_ip():
+    context = getattr(st, "context", None)
+    if context is None:
+        return "unknown"
+    ip = getattr(context, "ip_address", None)
+    forwarded_for = context.headers.get("X-Forwarded-For")
+    if not ip:
+        # Streamlit has no address for local connections, such as a reverse proxy on this host.
+        # Its X-Forwarded-For counts only with the loopback address listed as a trusted proxy;
+        # otherwise every such connection shares one bucket.
+        if LOOPBACK not in TRUSTED_PROXIES:
+            return "unknown"
+        ip = LOOPBACK
+    return forwarded_ip(ip, forwarded_for)
 
 
 def get_current_user_id():
@@ -35,6 +33,10 @@ def is_logged_in():
     return "user_id" in st.session_state
 
 
+def is_admin():
+    return is_logged_in() and st.session_state.get("username") in ADMIN_USERNAMES
+
+
 def logout():
     for key in ["user_id", "username"]:
         st.session_state.pop(key, None)
@@ -58,13 +60,17 @@ def render_auth_page():
                 if not username or not password:
                     st.error("Please fill in all fields.")
                 else:
-                    user = login(username, password)
-                    if user:
-                        st.session_state["user_id"] = user["id"]
-                        st.session_state["username"] = user["username"]
-                        st.rerun()
+                    try:
+                        user = login(username, password, _client_ip())
+                    except AuthThrottled as e:
+                        st.error(str(e))
                     else:
-                        st.error("Invalid username or password.")
+                        if user:
+                            st.session_state["user_id"] = user["id"]
+                            st.session_state["username"] = user["username"]
+                            st.rerun()
+                        else:
+                            st.error("Invalid username or password.")
 
     with tab_signup:
         with st.form("signup_form"):
@@ -80,10 +86,14 @@ def render_auth_page():
                 elif password != confirm:
                     st.error("Passwords do not match.")
                 else:
-                    user_id = signup(username, password)
-                    if user_id:
-                        st.session_state["user_id"] = user_id
-                        st.session_state["username"] = username
-                        st.rerun()
+                    try:
+                        user_id = signup(username, password, _client_ip())
+                    except AuthThrottled as e:
+                        st.error(str(e))
                     else:
-                        st.error("Username already taken.")
+                        if user_id:
+                            st.session_state["user_id"] = user_id
+                            st.session_state["username"] = username
+                            st.rerun()
+                        else:
+                            st.error("Username already taken.")
@@ -1,11 +1,15 @@
-import plotly.graph_objects as go
 import database as db
 
+# plotly.graph_objects is imported inside each chart function: it is the slowest import in
+# the app, and only the dashboard with some history to plot needs it.
+
 
 def xp_over_time_chart(user_id):
     rows = db.get_xp_over_time(user_id)
     if not rows:
         return None
+    import plotly.graph_objects as go
+
     days = [r["day"] for r in rows]
     totals = [r["total"] for r in rows]
     # Cumulative
@@ -27,6 +31,8 @@ def category_distribution_chart(user_id):
     rows = db.get_category_completion_counts(user_id)
     if not rows:
         return None
+    import plotly.graph_objects as go
+
     names = [f"{r['icon']} {r['name']}" for r in rows]
     counts = [r["count"] for r in rows]
     colors = [r["color"] for r in rows]
@@ -42,6 +48,8 @@ def weekly_completions_chart(user_id):
     rows = db.get_weekly_completions(user_id)
     if not rows:
         return None
+    import plotly.graph_objects as go
+
     days = [r["day"] for r in rows]
     counts = [r["count"] for r in rows]
 
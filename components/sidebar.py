@@ -9,15 +9,15 @@ def render_sidebar(user_id):
 
     with st.sidebar:
         st.markdown(f"### ⚔️ {username}")
-        st.markdown(f"**Level {stats['level']}**")
+        st.markdown(f"**Level {stats.level}**")
 
-        progress = models.xp_progress(stats["total_xp"], stats["level"])
-        next_xp = models.xp_for_level(stats["level"] + 1)
-        st.progress(progress, text=f"XP: {stats['total_xp']:,} / {next_xp:,}")
+        progress = models.xp_progress(stats.total_xp, stats.level)
+        next_xp = models.xp_for_level(stats.level + 1)
+        st.progress(progress, text=f"XP: {stats.total_xp:,} / {next_xp:,}")
 
         col1, col2 = st.columns(2)
-        col1.metric("Points", f"{stats['available_points']:,}")
-        col2.metric("Streak", f"{stats['current_streak']}🔥")
+        col1.metric("Points", f"{stats.available_points:,}")
+        col2.metric("Streak", f"{stats.current_streak}🔥")
 
         st.divider()
 
@@ -26,6 +26,7 @@ def render_sidebar(user_id):
             "📋 Tasks": "tasks",
             "🎁 Rewards": "rewards",
             "🏆 Achievements": "achievements",
+            "🥇 Leaderboard": "leaderboard",
             "📁 Categories": "categories",
             "⚙️ Settings": "settings",
         }
@@ -44,3 +45,31 @@ def render_sidebar(user_id):
             st.rerun()
 
     return st.session_state.get("current_page", "dashboard")
+
+
+def render_debug_panel(query_log):
+    # Admin-only: what this rerun asked of the database. A statement repeated many
+    # times in one rerun is usually a query inside a loop.
+    groups = db.summarize_queries(query_log)
+    total_ms = sum(g["ms"] for g in groups)
+    slow = sum(1 for r in query_log if r["slow"])
+
+    with st.sidebar:
+        with st.expander("🛠️ Query debug", expanded=False):
+            col1, col2 = st.columns(2)
+            col1.metric("Queries", len(query_log))
+            col2.metric("DB time", f"{total_ms:.1f} ms")
+            if slow:
+                st.caption(f"{slow} slow (≥ {db.SLOW_QUERY_MS:g} ms)")
+            writer = db.get_writer_stats()
+            if writer["batches"]:
+                st.caption(
+                    f"Writer: {writer['writes']:,} writes in {writer['batches']:,} commits "
+                    f"({writer['mean_batch']:.1f}/commit, {writer['mean_commit_ms']:.1f} ms/commit), "
+                    f"queue {writer['queue_depth']}"
+                )
+            st.dataframe(
+                [{"count": g["count"], "ms": round(g["ms"], 2), "rows": g["rows"], "sql": g["sql"]} for g in groups],
+                hide_index=True,
+                use_container_width=True,
+            )
@@ -0,0 +1,113 @@
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import database as db
+
+# Parameters for new hashes. Stored per user, so changing them upgrades accounts on their next login.
+KDF_ALGORITHM = "pbkdf2_sha256"
+KDF_ITERATIONS = 100_000
+KDF_HASHES = {"pbkdf2_sha256": "sha256", "pbkdf2_sha512": "sha512"}
+LOGIN_COLUMNS = ("id", "username", "password_hash", "salt", "kdf_algorithm", "kdf_iterations")
+
+HASH_WORKERS = min(4, os.cpu_count() or 1)
+MAX_PENDING_HASHES = 32
+
+# Token buckets: (burst capacity, tokens refilled per second).
+USERNAME_RATE = (5, 5 / 60)
+IP_RATE = (20, 20 / 60)
+MAX_TRACKED_BUCKETS = 50_000
+
+# Reverse proxies whose X-Forwarded-For is believed: their rightmost entry, the one they appended.
+TRUSTED_PROXIES = {ip.strip() for ip in os.environ.get("RPGLIFE_TRUSTED_PROXIES", "").split(",") if ip.strip()}
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending_hashes = threading.BoundedSemaphore(MAX_PENDING_HASHES)
+_buckets = OrderedDict()  # (scope, key) -> [tokens, last_refill]
+_buckets_lock = threading.Lock()
+
+
+class AuthThrottled(Exception):
+    pass
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: forking the multi-threaded Streamlit server is not safe.
+            _executor = ProcessPoolExecutor(HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def _hash_password(password, salt=None, algorithm=None, iterations=None):
+    if salt is None:
+        salt = os.urandom(32).hex()
+    algorithm = algorithm or KDF_ALGORITHM
+    iterations = iterations or KDF_ITERATIONS
+    if not _pending_hashes.acquire(blocking=False):
+        raise AuthThrottled("The server is busy. Please try again in a moment.")
+    try:
+        future = _get_executor().submit(
+            hashlib.pbkdf2_hmac, KDF_HASHES[algorithm], password.encode(), salt.encode(), iterations
+        )
+        hashed = future.result().hex()
+    finally:
+        _pending_hashes.release()
+    return hashed, salt
+
+
+def _take_token(scope, key, rate):
+    capacity, refill = rate
+    now = time.monotonic()
+    with _buckets_lock:
+        bucket = _buckets.pop((scope, key), None) or [capacity, now]
+        bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill)
+        bucket[1] = now
+        allowed = bucket[0] >= 1
+        if allowed:
+            bucket[0] -= 1
+        _buckets[(scope, key)] = bucket
+        while len(_buckets) > MAX_TRACKED_BUCKETS:
+            _buckets.popitem(last=False)
+    return allowed
+
+
+def _throttle(username, ip):
+    # Checked before any hashing so floods are refused cheaply.
+    if not _take_token("user", username.lower(), USERNAME_RATE) or not _take_token("ip", ip, IP_RATE):
+        raise AuthThrottled("Too many attempts. Please wait a minute and try again.")
+
+
+def forwarded_ip(peer_ip, forwarded_for):
+    # The address for the per-IP bucket. Every X-Forwarded-For entry but the last is whatever
+    # the client sent, so one that rotated them would never fill a bucket.
+    if peer_ip in TRUSTED_PROXIES and forwarded_for:
+        return forwarded_for.rsplit(",", 1)[-1].strip() or peer_ip
+    return peer_ip or "unknown"
+
+
+def signup(username, password, ip="unknown"):
+    _throttle(username, ip)
+    password_hash, salt = _hash_password(password)
+    user_id = db.create_user(username, password_hash, salt, KDF_ALGORITHM, KDF_ITERATIONS)
+    return user_id
+
+
+def login(username, password, ip="unknown"):
+    _throttle(username, ip)
+    user = db.get_user_by_username(username, LOGIN_COLUMNS)
+    if user is None:
+        return None
+    hashed, _ = _hash_password(password, user["salt"], user["kdf_algorithm"], user["kdf_iterations"])
+    if not hmac.compare_digest(hashed, user["password_hash"]):
+        return None
+    if (user["kdf_algorithm"], user["kdf_iterations"]) != (KDF_ALGORITHM, KDF_ITERATIONS):
+        new_hash, new_salt = _hash_password(password)
+        db.update_password_hash(user["id"], new_hash, new_salt, KDF_ALGORITHM, KDF_ITERATIONS)
+    return user
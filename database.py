@@ -1,130 +1,845 @@
+import base64
+import heapq
+import inspect
+import json
+import logging
 import sqlite3
 import os
-from datetime import datetime
+import queue
+import threading
+import time
+import weakref
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import lru_cache, partial, wraps
+from datetime import date, datetime, timedelta, timezone
+from itertools import count, groupby
+from operator import itemgetter, sub
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rpglife.db")
 
-
-def get_connection():
-    conn = sqlite3.connect(DB_PATH)
+# Applied once when a connection is opened; pooled connections keep them for their lifetime.
+PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("foreign_keys", "ON"),
+    ("busy_timeout", 5000),
+    ("cache_size", -16000),  # negative = KiB, so ~16 MB of page cache
+    ("mmap_size", 128 * 1024 * 1024),
+    ("temp_store", "MEMORY"),
+)
+STATEMENT_CACHE_SIZE = 256
+MAX_IDLE_CONNECTIONS = 8
+READ_CACHE_SIZE = 4096
+SLOW_QUERY_MS = float(os.environ.get("RPGLIFE_SLOW_QUERY_MS", 100))
+SLOW_QUERY_LOG = os.environ.get("RPGLIFE_SLOW_QUERY_LOG")  # file path; unset logs to stderr
+SINGLE_WRITER = os.environ.get("RPGLIFE_SINGLE_WRITER", "1") != "0"
+WRITE_BATCH_SIZE = 256  # most queued writes one group commit takes
+# Per-user data can be spread over several shard files (separated by os.pathsep). DB_PATH
+# keeps users, API tokens and the user -> shard directory, plus the data of users not
+# yet moved to a shard. Shards may be appended but not reordered: the directory stores
+# their indexes.
+SHARD_PATHS = [path for path in os.environ.get("RPGLIFE_SHARDS", "").split(os.pathsep) if path]
+
+_local = threading.local()
+_pool_lock = threading.Lock()
+_idle = {}  # path -> [connection, ...]
+_pool_stats = {"hits": 0, "misses": 0}
+_init_lock = threading.Lock()
+_initialized = set()  # database paths migrated by this process
+
+_cache_lock = threading.Lock()
+_read_cache = OrderedDict()  # (path, function, args, kwargs) -> (epoch, version, value)
+_user_versions = {}  # (path, user_id) -> bumped after every committed write for that user
+_cache_epoch = 0  # bumped when another connection's writes make every entry suspect
+_cache_stats = {"hits": 0, "misses": 0, "flushes": 0}
+
+_shard_paths = {}  # (DB_PATH, user_id) -> database holding that user's data
+
+_writers_lock = threading.Lock()
+_writers = {}  # path -> _Writer
+_writer_stats = {
+    "batches": 0, "writes": 0, "failed": 0, "max_batch": 0, "max_queue_depth": 0,
+    "commit_ms": 0.0, "max_commit_ms": 0.0, "wait_ms": 0.0,
+}
+
+_slow_log = logging.getLogger("rpglife.slow_queries")
+if SLOW_QUERY_LOG:
+    _handler = logging.FileHandler(SLOW_QUERY_LOG, encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    _slow_log.addHandler(_handler)
+
+
+# --- Query instrumentation ---
+#
+# Every statement run through a pooled connection is timed, including the time spent
+# fetching its rows. Statements slower than SLOW_QUERY_MS go to the slow-query log;
+# inside record_queries() each one is also appended to that block's log.
+
+class _BatchShape(list):
+    # executemany() parameters, logged as a batch size plus the first row's shape.
+    pass
+
+
+def _params_shape(params):
+    # Types only, never values: the log must not leak passwords or usernames.
+    if isinstance(params, _BatchShape):
+        return {"batch": len(params), "row": _params_shape(params[0]) if params else []}
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in sorted(params.items())}
+    return [type(value).__name__ for value in params]
+
+
+class _Cursor(sqlite3.Cursor):
+    # Timing state of the last statement: sql, parameters, elapsed ms, rows fetched,
+    # and its record_queries() entry if one is being collected.
+    _stmt = None
+
+    def _started(self, sql, parameters, started):
+        ms = (time.perf_counter() - started) * 1000
+        log = getattr(_local, "query_log", None)
+        record = None
+        if log is not None:
+            record = {"sql": sql, "params": _params_shape(parameters), "rows": 0, "ms": ms, "slow": False}
+            log.append(record)
+        self._stmt = [sql, parameters, ms, 0, record]
+        if ms >= SLOW_QUERY_MS:
+            self._slow()
+
+    def _fetched(self, started, rows):
+        stmt = self._stmt
+        if stmt is None:
+            return
+        was_slow = stmt[2] >= SLOW_QUERY_MS
+        stmt[2] += (time.perf_counter() - started) * 1000
+        stmt[3] += rows
+        record = stmt[4]
+        if record is not None:
+            record["ms"] = stmt[2]
+            record["rows"] = stmt[3]
+        if not was_slow and stmt[2] >= SLOW_QUERY_MS:
+            self._slow()
+
+    def _slow(self):
+        sql, parameters, ms, rows, record = self._stmt
+        if record is not None:
+            record["slow"] = True
+        _slow_log.warning("%.1f ms rows=%d params=%s %s", ms, rows, _params_shape(parameters), " ".join(sql.split()))
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._started(sql, parameters, started)
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._started(sql, _BatchShape(seq_of_parameters), started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __iter__(self):
+        # Iterating row by row through a Python __next__ would cost a timer call per row.
+        while True:
+            rows = self.fetchmany(256)
+            if not rows:
+                return
+            yield from rows
+
+
+class _Connection(sqlite3.Connection):
+    # PRAGMA data_version last seen on this connection; None until its first cached read.
+    seen_data_version = None
+
+    def cursor(self, factory=_Cursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return sqlite3.Connection.cursor(self, _Cursor).execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return sqlite3.Connection.cursor(self, _Cursor).executemany(sql, seq_of_parameters)
+
+
+@contextmanager
+def record_queries():
+    # Collects a record per statement this thread runs until the block exits. Streamlit
+    # runs each rerun of a session on one thread, so wrapping a rerun captures exactly
+    # its queries. Records: sql, params (shape), rows, ms, slow.
+    outer = getattr(_local, "query_log", None)
+    log = _local.query_log = []
+    try:
+        yield log
+    finally:
+        _local.query_log = outer
+        if outer is not None:
+            outer.extend(log)
+
+
+def summarize_queries(log):
+    # Groups a record_queries() log by statement text, most expensive first; a statement
+    # with a high count in one rerun is usually an N+1 loop.
+    groups = {}
+    for record in log:
+        sql = " ".join(record["sql"].split())
+        group = groups.setdefault(sql, {"sql": sql, "count": 0, "rows": 0, "ms": 0.0})
+        group["count"] += 1
+        group["rows"] += record["rows"]
+        group["ms"] += record["ms"]
+    return sorted(groups.values(), key=lambda g: g["ms"], reverse=True)
+
+
+class _Lease:
+    # Holds a thread's connection; when the thread exits the lease is collected
+    # and the finalizer hands the connection back to the idle pool.
+    __slots__ = ("conn", "finalizer", "__weakref__")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.finalizer = None
+
+
+def _open_connection(path):
+    conn = sqlite3.connect(
+        path,
+        factory=_Connection,
+        isolation_level=None,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON")
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
     return conn
 
 
-def init_db():
-    conn = get_connection()
-    c = conn.cursor()
+def _release(path, conn):
+    if conn.in_transaction:
+        conn.rollback()
+    with _pool_lock:
+        idle = _idle.setdefault(path, [])
+        if len(idle) < MAX_IDLE_CONNECTIONS:
+            idle.append(conn)
+            return
+    conn.close()
 
-    c.executescript("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            salt TEXT NOT NULL,
-            created_at TEXT NOT NULL DEFAULT (datetime('now'))
-        );
 
-        CREATE TABLE IF NOT EXISTS user_stats (
-            user_id INTEGER PRIMARY KEY,
-            total_xp INTEGER NOT NULL DEFAULT 0,
-            level INTEGER NOT NULL DEFAULT 1,
-            available_points INTEGER NOT NULL DEFAULT 0,
-            current_streak INTEGER NOT NULL DEFAULT 0,
-            longest_streak INTEGER NOT NULL DEFAULT 0,
-            last_completion_date TEXT,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
+def get_connection(path=None):
+    path = path or DB_PATH
+    leases = getattr(_local, "leases", None)
+    if leases is None:
+        leases = _local.leases = {}
+    lease = leases.get(path)
+    if lease is not None:
+        with _pool_lock:
+            _pool_stats["hits"] += 1
+        return lease.conn
+
+    with _pool_lock:
+        idle = _idle.get(path)
+        conn = idle.pop() if idle else None
+        _pool_stats["hits" if conn is not None else "misses"] += 1
+    if conn is None:
+        conn = _open_connection(path)
+    lease = leases[path] = _Lease(conn)
+    lease.finalizer = weakref.finalize(lease, _release, path, conn)
+    return conn
 
-        CREATE TABLE IF NOT EXISTS categories (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            name TEXT NOT NULL,
-            icon TEXT NOT NULL DEFAULT '📋',
-            color TEXT NOT NULL DEFAULT '#4A90D9',
-            is_default INTEGER NOT NULL DEFAULT 0,
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
 
-        CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            category_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            description TEXT NOT NULL DEFAULT '',
-            difficulty INTEGER NOT NULL DEFAULT 1 CHECK(difficulty BETWEEN 1 AND 5),
-            is_recurring INTEGER NOT NULL DEFAULT 0,
-            is_active INTEGER NOT NULL DEFAULT 1,
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (category_id) REFERENCES categories(id)
-        );
+def get_pool_stats():
+    with _pool_lock:
+        stats = dict(_pool_stats)
+        stats["idle"] = sum(len(conns) for conns in _idle.values())
+    return stats
 
-        CREATE TABLE IF NOT EXISTS task_completions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            task_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            points_earned INTEGER NOT NULL,
-            completed_at TEXT NOT NULL DEFAULT (datetime('now')),
-            FOREIGN KEY (task_id) REFERENCES tasks(id),
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
 
-        CREATE TABLE IF NOT EXISTS rewards (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            description TEXT NOT NULL DEFAULT '',
-            value INTEGER NOT NULL DEFAULT 1 CHECK(value BETWEEN 1 AND 5),
-            point_cost INTEGER NOT NULL,
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
+def close_connections():
+    _stop_writers()
+    leases = getattr(_local, "leases", None) or {}
+    for lease in leases.values():
+        lease.finalizer.detach()
+        lease.conn.close()
+    leases.clear()
+    with _pool_lock:
+        for conns in _idle.values():
+            for conn in conns:
+                conn.close()
+        _idle.clear()
+
+
+@contextmanager
+def transaction(path=None):
+    path = path or DB_PATH
+    conn = get_connection(path)
+    if conn.in_transaction:
+        # Nested: the outermost block owns the commit.
+        yield conn
+        return
+    if not hasattr(_local, "transactions"):
+        _local.transactions = {}
+    state = _local.transactions[path] = {"rollback_hooks": [], "touched": set()}
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        for hook in state["rollback_hooks"]:
+            hook()
+        raise
+    finally:
+        del _local.transactions[path]
+    _bump_versions(path, state["touched"])
+
+
+def _current_transaction(path=None):
+    return getattr(_local, "transactions", {}).get(path or DB_PATH)
+
+
+def on_rollback(callback, path=None):
+    # Lets in-process caches undo what they recorded if the enclosing transaction fails.
+    state = _current_transaction(path)
+    if state is not None:
+        state["rollback_hooks"].append(callback)
+
+
+# --- Shards ---
+#
+# Every per-user function reads and writes the database shard_path() returns for its
+# user. New users go to the shard with the fewest users; they only change shards
+# through move_user(), which runs offline (manage.py rebalance-shards).
+
+def _all_paths():
+    return [DB_PATH] + [path for path in SHARD_PATHS if path != DB_PATH]
+
+
+def shard_path(user_id):
+    if not SHARD_PATHS:
+        return DB_PATH
+    key = (DB_PATH, user_id)
+    path = _shard_paths.get(key)
+    if path is None:
+        row = get_connection(DB_PATH).execute(
+            "SELECT shard FROM user_shards WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        path = _shard_paths[key] = SHARD_PATHS[row[0]] if row else DB_PATH
+    return path
+
+
+def get_user_shards():
+    # {user_id: shard index, or None while the user's data is still in DB_PATH}
+    conn = get_connection(DB_PATH)
+    return dict(conn.execute("SELECT u.id, s.shard FROM users u LEFT JOIN user_shards s ON s.user_id = u.id"))
+
+
+def _least_loaded_shard(conn):
+    counts = dict(conn.execute("SELECT shard, COUNT(*) FROM user_shards GROUP BY shard"))
+    return min(range(len(SHARD_PATHS)), key=lambda shard: counts.get(shard, 0))
+
+
+def _add_shard_user(conn, user_id, username):
+    # Shards keep a credential-less copy of the users row for their foreign keys;
+    # logins and password changes use the one in DB_PATH. Anything left under this id
+    # by an interrupted signup, import or move is cleared first.
+    if conn.execute("SELECT 1 FROM users WHERE id = ?", (user_id,)).fetchone():
+        _delete_user_rows(conn, user_id)
+        conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    conn.execute("INSERT INTO users (id, username, password_hash, salt) VALUES (?, ?, '', '')", (user_id, username))
+
+
+# --- Single writer ---
+#
+# Writes from every thread are queued to one writer thread per database. It runs
+# whatever is pending inside one transaction, each write in its own savepoint so a
+# failing write does not undo the others, commits once and then resolves every
+# caller's future. Callers block until their write is committed, so they read their
+# own writes. A thread already inside transaction() runs writes inline as part of it.
+
+class _Writer:
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        # This thread's connection commits every queued write, so its PRAGMA data_version
+        # only moves for commits made elsewhere. state (under lock) says what a reader's
+        # probe() can rely on: "idle" between batches, "begin" while BEGIN IMMEDIATE waits
+        # for another process's write, "open" from the check after BEGIN to COMMIT, a span
+        # in which no other connection can commit.
+        self.conn = None
+        self.lock = threading.Lock()
+        self.state = "idle"
+        self.probed = False
+        self.data_version = None
+        self.thread = threading.Thread(target=self._run, name="rpglife-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, fn, args, kwargs):
+        future = Future()
+        # The caller's record_queries() log, so its writes still show up in it.
+        self.queue.put((fn, args, kwargs, future, getattr(_local, "query_log", None), time.perf_counter()))
+        return future
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        conn = get_connection(self.path)
+        with self.lock:
+            self.conn = conn
+        try:
+            while True:
+                op = self.queue.get()
+                if op is None:
+                    return
+                depth = self.queue.qsize() + 1
+                batch = [op]
+                while len(batch) < WRITE_BATCH_SIZE:
+                    try:
+                        op = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if op is None:
+                        self._commit(batch, depth)
+                        return
+                    batch.append(op)
+                self._commit(batch, depth)
+        finally:
+            with self.lock:
+                self.conn = None
+            # Hand the connection back now rather than whenever the thread is collected.
+            for lease in getattr(_local, "leases", {}).values():
+                lease.finalizer()
+
+    def _commit(self, batch, depth):
+        started = time.perf_counter()
+        results = []
+        with self.lock:
+            self.state = "begin"
+        try:
+            with transaction(self.path) as conn:
+                with self.lock:
+                    self._check_foreign_commits()
+                    self.state = "open"
+                hooks = _current_transaction(self.path)["rollback_hooks"]
+                for fn, args, kwargs, _, log, _ in batch:
+                    _local.query_log = log
+                    try:
+                        results.append(self._apply(conn, hooks, fn, args, kwargs, isolate=len(batch) > 1))
+                    finally:
+                        _local.query_log = None
+        except Exception as exc:
+            # BEGIN or COMMIT failed: nothing in the batch was written. BEGIN may have
+            # failed before the foreign-commit check, so assume the worst.
+            results = [(False, exc)] * len(batch)
+            clear_read_cache()
+        with self.lock:
+            # A reader probed while the batch was open; what it saw may be a commit made
+            # between our COMMIT and now.
+            if self.probed:
+                self.probed = False
+                self._check_foreign_commits()
+            self.state = "idle"
+        finished = time.perf_counter()
+
+        with _writers_lock:
+            stats = _writer_stats
+            stats["batches"] += 1
+            stats["writes"] += len(batch)
+            stats["failed"] += sum(1 for ok, _ in results if not ok)
+            stats["max_batch"] = max(stats["max_batch"], len(batch))
+            stats["max_queue_depth"] = max(stats["max_queue_depth"], depth)
+            commit_ms = (finished - started) * 1000
+            stats["commit_ms"] += commit_ms
+            stats["max_commit_ms"] = max(stats["max_commit_ms"], commit_ms)
+            stats["wait_ms"] += sum((finished - op[5]) * 1000 for op in batch)
+        for op, (ok, value) in zip(batch, results):
+            if ok:
+                op[3].set_result(value)
+            else:
+                op[3].set_exception(value)
+
+
+    def _check_foreign_commits(self):
+        # Call with self.lock held. Our own commits already bumped the versions of the
+        # users they touched; anything else may have changed any user's data.
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self.data_version:
+            self.data_version = version
+            clear_read_cache()
+
+    def probe(self):
+        # For a reader whose connection saw some commit: flushes the cache if it was not
+        # one of ours. An open batch made this check right after its BEGIN, which covers
+        # every commit made before it; while BEGIN is still waiting the connection is busy,
+        # so the commit may be foreign and the cache goes.
+        with self.lock:
+            if self.conn is None or self.state == "begin":
+                clear_read_cache()  # not started yet, stopped, or waiting for a foreign write
+            elif self.state == "open":
+                self.probed = True
+            else:
+                self._check_foreign_commits()
+
+    @staticmethod
+    def _apply(conn, hooks, fn, args, kwargs, isolate):
+        # A lone write needs no savepoint: if it fails the whole transaction rolls back.
+        if not isolate:
+            return True, fn(*args, **kwargs)
+        undo_from = len(hooks)
+        conn.execute("SAVEPOINT queued_write")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as exc:
+            conn.execute("ROLLBACK TO queued_write")
+            conn.execute("RELEASE queued_write")
+            for hook in hooks[undo_from:]:
+                hook()
+            del hooks[undo_from:]
+            return False, exc
+        conn.execute("RELEASE queued_write")
+        return True, result
+
+
+def _writer(path):
+    writer = _writers.get(path)
+    if writer is None:
+        with _writers_lock:
+            writer = _writers.get(path)
+            if writer is None:
+                writer = _writers[path] = _Writer(path)
+    return writer
+
+
+def _stop_writers():
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.stop()
+
+
+def _queued_on(route):
+    def decorate(fn):
+        @wraps(fn)
+        def queued(*args, **kwargs):
+            path = route(args, kwargs)
+            if not SINGLE_WRITER or _current_transaction(path) is not None:
+                return fn(*args, **kwargs)
+            return _writer(path).submit(fn, args, kwargs).result()
+
+        return queued
+    return decorate
+
+
+# For writes to DB_PATH's own tables (users, API tokens), even those taking a user_id.
+_directory_write = _queued_on(lambda args, kwargs: DB_PATH)
+
+
+def queued_write(fn):
+    # Runs fn as one unit of a group commit on the writer thread of its user's shard
+    # (found from its user_id argument; DB_PATH without one), or inline when this thread
+    # is already in a transaction there (including on that writer thread itself).
+    params = list(inspect.signature(fn).parameters)
+    if "user_id" not in params:
+        return _directory_write(fn)
+    index = params.index("user_id")
+
+    def route(args, kwargs):
+        return shard_path(kwargs["user_id"] if "user_id" in kwargs else args[index])
+
+    return _queued_on(route)(fn)
+
+
+def get_writer_stats():
+    # Queue depth, group-commit batch sizes and commit latency (BEGIN to COMMIT of a
+    # batch); wait is from a caller queuing a write until it was committed.
+    with _writers_lock:
+        stats = dict(_writer_stats)
+        stats["queue_depth"] = sum(writer.queue.qsize() for writer in _writers.values())
+    batches = stats["batches"] or 1
+    stats["mean_batch"] = stats["writes"] / batches
+    stats["mean_commit_ms"] = stats["commit_ms"] / batches
+    stats["mean_wait_ms"] = stats["wait_ms"] / (stats["writes"] or 1)
+    return stats
 
-        CREATE TABLE IF NOT EXISTS reward_redemptions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            reward_id INTEGER NOT NULL,
-            user_id INTEGER NOT NULL,
-            points_spent INTEGER NOT NULL,
-            redeemed_at TEXT NOT NULL DEFAULT (datetime('now')),
-            FOREIGN KEY (reward_id) REFERENCES rewards(id),
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
 
-        CREATE TABLE IF NOT EXISTS achievements (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT NOT NULL,
-            category TEXT NOT NULL,
-            icon TEXT NOT NULL DEFAULT '🏆',
-            requirement_type TEXT NOT NULL,
-            requirement_value INTEGER NOT NULL
-        );
+# --- Read-through cache ---
+#
+# Per-user reads are cached under the user's data version, which every committed
+# write for that user bumps. Writes from other connections show up as a change in
+# PRAGMA data_version and flush the whole cache, since there is no way to tell which
+# users they touched. With the single writer, a reader's data_version also moves for
+# this process's own queued writes, so it asks the writer's connection, which only
+# sees the foreign ones.
+
+def _touch(user_id, path=None):
+    path = path or shard_path(user_id)
+    state = _current_transaction(path)
+    if state is not None:
+        state["touched"].add(user_id)
+    else:
+        _bump_versions(path, (user_id,))
+
+
+def _bump_versions(path, user_ids):
+    if not user_ids:
+        return
+    with _cache_lock:
+        for user_id in user_ids:
+            key = (path, user_id)
+            _user_versions[key] = _user_versions.get(key, 0) + 1
+
+
+def _check_data_version(conn, path):
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if version == conn.seen_data_version:
+        return
+    first = conn.seen_data_version is None
+    conn.seen_data_version = version
+    writer = _writers.get(path) if SINGLE_WRITER else None
+    if first or writer is None:
+        # A connection seen for the first time may have missed earlier outside writes
+        # too; without a writer thread, any other connection's commit may be foreign.
+        clear_read_cache()
+    else:
+        writer.probe()
+
+
+def clear_read_cache():
+    global _cache_epoch
+    with _cache_lock:
+        _cache_epoch += 1
+        _read_cache.clear()
+        _cache_stats["flushes"] += 1
+
+
+def get_cache_stats():
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats["entries"] = len(_read_cache)
+    return stats
 
-        CREATE TABLE IF NOT EXISTS user_achievements (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            achievement_id INTEGER NOT NULL,
-            unlocked_at TEXT NOT NULL DEFAULT (datetime('now')),
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (achievement_id) REFERENCES achievements(id),
-            UNIQUE(user_id, achievement_id)
-        );
 
-        CREATE TABLE IF NOT EXISTS point_transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            amount INTEGER NOT NULL,
-            transaction_type TEXT NOT NULL,
-            reference_id INTEGER,
-            created_at TEXT NOT NULL DEFAULT (datetime('now')),
-            FOREIGN KEY (user_id) REFERENCES users(id)
-        );
-    """)
-
-    _seed_defaults(c)
-    conn.commit()
-    conn.close()
+def _read_through(fn):
+    # Cached functions take the owning user_id as their first argument (none for global data,
+    # which is read from DB_PATH) and return values callers treat as read-only.
+    name = fn.__name__
+
+    @wraps(fn)
+    def cached(*args, **kwargs):
+        path = shard_path(args[0]) if args else DB_PATH
+        conn = get_connection(path)
+        if conn.in_transaction:
+            # Inside a unit of work reads must see its own uncommitted writes.
+            return fn(*args, **kwargs)
+        _check_data_version(conn, path)
+
+        key = (path, name, args, tuple(sorted(kwargs.items())))
+        user_id = args[0] if args else None
+        with _cache_lock:
+            # Captured before querying, so a write that commits meanwhile invalidates the result.
+            epoch = _cache_epoch
+            version = _user_versions.get((path, user_id), 0)
+            entry = _read_cache.get(key)
+            if entry is not None and entry[0] == epoch and entry[1] == version:
+                _read_cache.move_to_end(key)
+                _cache_stats["hits"] += 1
+                return entry[2]
+            _cache_stats["misses"] += 1
+
+        value = fn(*args, **kwargs)
+        with _cache_lock:
+            _read_cache[key] = (epoch, version, value)
+            _read_cache.move_to_end(key)
+            while len(_read_cache) > READ_CACHE_SIZE:
+                _read_cache.popitem(last=False)
+        return value
+
+    return cached
+
+
+def init_db(path=None):
+    # Streamlit re-executes app.py on every interaction; only the first call per
+    # database in this process does any work. Without a path, DB_PATH and every shard.
+    for path in [path] if path else _all_paths():
+        if path in _initialized:
+            continue
+        with _init_lock:
+            if path not in _initialized:
+                migrate(path)
+                _initialized.add(path)
+                clear_read_cache()
+
+
+def migrate(path=None, target=None):
+    # Applies pending migrations, stopping after version target when given.
+    conn = get_connection(path)
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, step in MIGRATIONS:
+        if version <= current:
+            continue
+        if target is not None and version > target:
+            break
+        with transaction(path) as conn:
+            # Another process may have applied it while we waited for the write lock.
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                continue
+            if callable(step):
+                step(conn)
+            else:
+                _execute_script(conn, step)
+            conn.execute(f"PRAGMA user_version = {version}")
+        current = version
+    return current
+
+
+def _execute_script(conn, script):
+    # executescript() commits first, which would break the migration's transaction.
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ""
+    if statement.strip():
+        conn.execute(statement)
+
+
+_BASE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        salt TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (datetime('now'))
+    );
+
+    CREATE TABLE IF NOT EXISTS user_stats (
+        user_id INTEGER PRIMARY KEY,
+        total_xp INTEGER NOT NULL DEFAULT 0,
+        level INTEGER NOT NULL DEFAULT 1,
+        available_points INTEGER NOT NULL DEFAULT 0,
+        current_streak INTEGER NOT NULL DEFAULT 0,
+        longest_streak INTEGER NOT NULL DEFAULT 0,
+        last_completion_date TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        name TEXT NOT NULL,
+        icon TEXT NOT NULL DEFAULT '📋',
+        color TEXT NOT NULL DEFAULT '#4A90D9',
+        is_default INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        description TEXT NOT NULL DEFAULT '',
+        difficulty INTEGER NOT NULL DEFAULT 1 CHECK(difficulty BETWEEN 1 AND 5),
+        is_recurring INTEGER NOT NULL DEFAULT 0,
+        is_active INTEGER NOT NULL DEFAULT 1,
+        created_at TEXT NOT NULL DEFAULT (datetime('now')),
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        FOREIGN KEY (category_id) REFERENCES categories(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS task_completions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        points_earned INTEGER NOT NULL,
+        completed_at TEXT NOT NULL DEFAULT (datetime('now')),
+        FOREIGN KEY (task_id) REFERENCES tasks(id),
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS rewards (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        description TEXT NOT NULL DEFAULT '',
+        value INTEGER NOT NULL DEFAULT 1 CHECK(value BETWEEN 1 AND 5),
+        point_cost INTEGER NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (datetime('now')),
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS reward_redemptions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        reward_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        points_spent INTEGER NOT NULL,
+        redeemed_at TEXT NOT NULL DEFAULT (datetime('now')),
+        FOREIGN KEY (reward_id) REFERENCES rewards(id),
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    );
+
+    CREATE TABLE IF NOT EXISTS achievements (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        description TEXT NOT NULL,
+        category TEXT NOT NULL,
+        icon TEXT NOT NULL DEFAULT '🏆',
+        requirement_type TEXT NOT NULL,
+        requirement_value INTEGER NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS user_achievements (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        achievement_id INTEGER NOT NULL,
+        unlocked_at TEXT NOT NULL DEFAULT (datetime('now')),
+        FOREIGN KEY (user_id) REFERENCES users(id),
+        FOREIGN KEY (achievement_id) REFERENCES achievements(id),
+        UNIQUE(user_id, achievement_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS point_transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        amount INTEGER NOT NULL,
+        transaction_type TEXT NOT NULL,
+        reference_id INTEGER,
+        created_at TEXT NOT NULL DEFAULT (datetime('now')),
+        FOREIGN KEY (user_id) REFERENCES users(id)
+    );
+"""
+
+
+def _create_base_schema(conn):
+    # Statements are idempotent so databases created before migrations existed upgrade cleanly.
+    _execute_script(conn, _BASE_SCHEMA)
+    _seed_defaults(conn.cursor())
 
 
 def _seed_defaults(cursor):
@@ -177,331 +892,1539 @@ def _seed_defaults(cursor):
             )
 
 
+def _add_materialized_counters(conn):
+    _execute_script(conn, """
+        ALTER TABLE user_stats ADD COLUMN total_completions INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE user_stats ADD COLUMN rewards_redeemed INTEGER NOT NULL DEFAULT 0;
+
+        CREATE TABLE IF NOT EXISTS user_category_stats (
+            user_id INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            completions INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, category_id),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        ) WITHOUT ROWID;
+    """)
+    _rebuild_counters(conn)
+
+
+def _add_daily_stats(conn):
+    _execute_script(conn, """
+        CREATE TABLE IF NOT EXISTS user_daily_stats (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,  -- UTC date, same clock as the datetime('now') timestamps
+            completions INTEGER NOT NULL DEFAULT 0,
+            points_earned INTEGER NOT NULL DEFAULT 0,
+            xp_spent INTEGER NOT NULL DEFAULT 0,
+            reward_points_spent INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        ) WITHOUT ROWID;
+    """)
+    _rebuild_daily_stats(conn)
+
+
+# Point ledger entry types, stored as these codes in ledger.type.
+EARNED, SPENT_XP, SPENT_REWARD = 1, 2, 3
+TRANSACTION_TYPES = {"earned": EARNED, "spent_xp": SPENT_XP, "spent_reward": SPENT_REWARD}
+
+# Integer epoch seconds, the storage format of the compact event tables.
+_NOW = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+
+def _epoch(column):
+    return f"CAST(strftime('%s', {column}) AS INTEGER)"
+
+
+def _copy_sequence(conn, old, new):
+    # Keeps AUTOINCREMENT from reusing ids the old table had already handed out.
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (old,)).fetchone()
+    if row is None:
+        return
+    if conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", (row[0], new)).rowcount == 0:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (new, row[0]))
+
+
+def _compact_event_tables(conn):
+    # The three append-only history tables hold nearly all rows. They move to integer
+    # epoch timestamps and, for the ledger, integer type codes; views under the old
+    # names present the old TEXT columns to existing readers.
+    _execute_script(conn, f"""
+        CREATE TABLE IF NOT EXISTS transaction_types (
+            code INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        );
+        INSERT INTO transaction_types (code, name) VALUES
+            ({EARNED}, 'earned'), ({SPENT_XP}, 'spent_xp'), ({SPENT_REWARD}, 'spent_reward');
+
+        CREATE TABLE completions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            points_earned INTEGER NOT NULL,
+            completed_at INTEGER NOT NULL DEFAULT ({_NOW}),
+            FOREIGN KEY (task_id) REFERENCES tasks(id),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        );
+        INSERT INTO completions (id, task_id, user_id, points_earned, completed_at)
+            SELECT id, task_id, user_id, points_earned, {_epoch("completed_at")} FROM task_completions;
+
+        CREATE TABLE ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            type INTEGER NOT NULL,
+            reference_id INTEGER,
+            created_at INTEGER NOT NULL DEFAULT ({_NOW}),
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (type) REFERENCES transaction_types(code)
+        );
+        INSERT INTO ledger (id, user_id, amount, type, reference_id, created_at)
+            SELECT p.id, p.user_id, p.amount, t.code, p.reference_id, {_epoch("p.created_at")}
+            FROM point_transactions p LEFT JOIN transaction_types t ON t.name = p.transaction_type;
+
+        CREATE TABLE redemptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            reward_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            points_spent INTEGER NOT NULL,
+            redeemed_at INTEGER NOT NULL DEFAULT ({_NOW}),
+            FOREIGN KEY (reward_id) REFERENCES rewards(id),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        );
+        INSERT INTO redemptions (id, reward_id, user_id, points_spent, redeemed_at)
+            SELECT id, reward_id, user_id, points_spent, {_epoch("redeemed_at")} FROM reward_redemptions;
+    """)
+    for old, new in (("task_completions", "completions"), ("point_transactions", "ledger"),
+                     ("reward_redemptions", "redemptions")):
+        _copy_sequence(conn, old, new)
+    _execute_script(conn, """
+        DROP TABLE task_completions;
+        DROP TABLE point_transactions;
+        DROP TABLE reward_redemptions;
+
+        CREATE INDEX idx_completions_user_completed ON completions (user_id, completed_at);
+        CREATE INDEX idx_ledger_user_created ON ledger (user_id, created_at);
+        CREATE INDEX idx_ledger_user_type_created ON ledger (user_id, type, created_at, amount);
+        CREATE INDEX idx_redemptions_user_redeemed ON redemptions (user_id, redeemed_at);
+        CREATE INDEX idx_redemptions_reward ON redemptions (reward_id);
+
+        CREATE VIEW task_completions AS
+            SELECT id, task_id, user_id, points_earned, datetime(completed_at, 'unixepoch') AS completed_at
+            FROM completions;
+        CREATE VIEW point_transactions AS
+            SELECT l.id, l.user_id, l.amount, t.name AS transaction_type, l.reference_id,
+                   datetime(l.created_at, 'unixepoch') AS created_at
+            FROM ledger l JOIN transaction_types t ON t.code = l.type;
+        CREATE VIEW reward_redemptions AS
+            SELECT id, reward_id, user_id, points_spent, datetime(redeemed_at, 'unixepoch') AS redeemed_at
+            FROM redemptions;
+    """)
+
+
+# Ordered (version, step) pairs. A step is SQL or a callable taking the connection;
+# each runs once inside its own transaction and then sets PRAGMA user_version.
+MIGRATIONS = [
+    (1, _create_base_schema),
+    (2, """
+        CREATE INDEX IF NOT EXISTS idx_task_completions_user_completed
+            ON task_completions (user_id, completed_at);
+        CREATE INDEX IF NOT EXISTS idx_point_transactions_user_created
+            ON point_transactions (user_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_point_transactions_user_type_created
+            ON point_transactions (user_id, transaction_type, created_at, amount);
+        CREATE INDEX IF NOT EXISTS idx_tasks_user_active_created
+            ON tasks (user_id, is_active, created_at);
+        CREATE INDEX IF NOT EXISTS idx_rewards_user_cost
+            ON rewards (user_id, point_cost);
+        CREATE INDEX IF NOT EXISTS idx_reward_redemptions_user_redeemed
+            ON reward_redemptions (user_id, redeemed_at);
+        CREATE INDEX IF NOT EXISTS idx_categories_user
+            ON categories (user_id, name);
+        CREATE INDEX IF NOT EXISTS idx_categories_default
+            ON categories (is_default, name);
+        -- Foreign-key lookups when a category or reward is deleted
+        CREATE INDEX IF NOT EXISTS idx_tasks_category
+            ON tasks (category_id);
+        CREATE INDEX IF NOT EXISTS idx_reward_redemptions_reward
+            ON reward_redemptions (reward_id);
+    """),
+    (3, _add_materialized_counters),
+    (4, """
+        -- Existing hashes were all produced with these parameters
+        ALTER TABLE users ADD COLUMN kdf_algorithm TEXT NOT NULL DEFAULT 'pbkdf2_sha256';
+        ALTER TABLE users ADD COLUMN kdf_iterations INTEGER NOT NULL DEFAULT 100000;
+    """),
+    (5, _add_daily_stats),
+    (6, """
+        -- Bearer tokens for the HTTP API; only a SHA-256 of each token is stored
+        CREATE TABLE IF NOT EXISTS api_tokens (
+            token_hash TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            expires_at TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_api_tokens_user ON api_tokens (user_id);
+        CREATE INDEX IF NOT EXISTS idx_api_tokens_expires ON api_tokens (expires_at);
+    """),
+    (7, """
+        -- Ledger totals per user up to a point_transactions id, written by reconcile_ledger()
+        CREATE TABLE IF NOT EXISTS ledger_checkpoints (
+            user_id INTEGER PRIMARY KEY,
+            last_transaction_id INTEGER NOT NULL,
+            available_points INTEGER NOT NULL,
+            total_xp INTEGER NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (datetime('now')),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        ) WITHOUT ROWID;
+    """),
+    (8, _compact_event_tables),
+    (9, """
+        -- Which shard file holds each user's data (see SHARD_PATHS); unused without shards
+        CREATE TABLE IF NOT EXISTS user_shards (
+            user_id INTEGER PRIMARY KEY,
+            shard INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_user_shards_shard ON user_shards (shard);
+    """),
+    (10, """
+        -- IANA zone name that streak days are counted in; NULL is the server's local time
+        ALTER TABLE user_stats ADD COLUMN time_zone TEXT;
+    """),
+    (11, """
+        -- All-time leaderboard order
+        CREATE INDEX IF NOT EXISTS idx_user_stats_xp ON user_stats (total_xp DESC, user_id);
+        -- Weekly and monthly boards written by refresh_leaderboards(); used in DB_PATH only
+        CREATE TABLE IF NOT EXISTS leaderboard_entries (
+            board TEXT NOT NULL,
+            rank INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            xp INTEGER NOT NULL,
+            period_start TEXT NOT NULL,
+            refreshed_at TEXT NOT NULL DEFAULT (datetime('now')),
+            PRIMARY KEY (board, rank)
+        ) WITHOUT ROWID;
+    """),
+    (12, """
+        -- Recurring tasks get a schedule (see models.parse_schedule); every task is due
+        -- once next_due_at (epoch seconds) has passed. Existing recurring tasks become daily.
+        ALTER TABLE tasks ADD COLUMN schedule TEXT;
+        ALTER TABLE tasks ADD COLUMN next_due_at INTEGER NOT NULL DEFAULT 0;
+        UPDATE tasks SET schedule = CASE WHEN is_recurring THEN 'daily' END,
+                         next_due_at = CAST(strftime('%s', created_at) AS INTEGER);
+        -- A user's due tasks, newest first
+        CREATE INDEX IF NOT EXISTS idx_tasks_user_due ON tasks (user_id, is_active, next_due_at);
+        -- Upcoming due times across all users, for the schedule materializer
+        CREATE INDEX IF NOT EXISTS idx_tasks_upcoming ON tasks (next_due_at) WHERE is_active = 1 AND is_recurring = 1;
+    """),
+    (13, """
+        -- XP spent in a period across all users, for refresh_leaderboards(); covering, so
+        -- the job reads only the period's entries instead of the whole ledger
+        CREATE INDEX IF NOT EXISTS idx_ledger_type_created ON ledger (type, created_at, user_id, amount);
+    """),
+]
+
+
+# --- Keyset pagination ---
+#
+# History pages are ordered newest first by (timestamp, id) and continue strictly after
+# the last row of the previous page, so every page is one index range scan however deep
+# it is. Page tokens are opaque to callers.
+
+def encode_cursor(timestamp, row_id):
+    raw = json.dumps([timestamp, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid page token") from e
+    return timestamp, row_id
+
+
+def _keyset_clause(cursor, timestamp_column, id_column):
+    if cursor is None:
+        return "", ()
+    return f" AND ({timestamp_column}, {id_column}) < (?, ?)", decode_cursor(cursor)
+
+
+def _finish_page(rows, limit, timestamp_key):
+    # Queries fetch limit + 1 rows; the extra one only signals that another page exists.
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1][timestamp_key], rows[-1]["id"])
+
+
+# --- Row records ---
+#
+# The main per-user reads return these named tuples rather than sqlite3.Row: one tuple
+# per row with no mapping object beside it, attribute access (stats.level, the fast
+# path), and row["level"], keys() and dict(row) for code written against sqlite3.Row
+# (a Python-level lookup, slower than sqlite3.Row's; prefer attributes in hot loops). Functions
+# taking columns= (a tuple of field names) select only those and return a record of
+# just them.
+
+class _Record(tuple):
+    __slots__ = ()
+    _index = {}  # field name -> position
+
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            key = self._index[key]
+        return tuple.__getitem__(self, key)
+
+    def keys(self):
+        return self._fields
+
+
+@lru_cache(maxsize=None)
+def _record_type(name, columns):
+    return type(name, (_Record, namedtuple(name, columns)),
+                {"__slots__": (), "_index": {column: i for i, column in enumerate(columns)}})
+
+
+User = _record_type("User", ("id", "username", "password_hash", "salt", "created_at", "kdf_algorithm",
+                             "kdf_iterations"))
+UserStats = _record_type("UserStats", ("user_id", "total_xp", "level", "available_points", "current_streak",
+                                       "longest_streak", "last_completion_date", "total_completions",
+                                       "rewards_redeemed", "time_zone"))
+Task = _record_type("Task", ("id", "user_id", "category_id", "name", "description", "difficulty", "is_recurring",
+                             "is_active", "created_at", "schedule", "next_due_at", "category_name",
+                             "category_icon", "category_color"))
+Completion = _record_type("Completion", ("id", "task_id", "user_id", "points_earned", "completed_at",
+                                         "completed_epoch", "task_name", "difficulty", "category_icon"))
+Reward = _record_type("Reward", ("id", "user_id", "name", "description", "value", "point_cost", "created_at"))
+
+# SQL for each Task field in the tasks t JOIN categories c queries.
+_TASK_SELECT = {
+    **{column: "t." + column for column in Task._fields},
+    "category_name": "c.name", "category_icon": "c.icon", "category_color": "c.color",
+}
+
+
+def _projection(record, columns, expressions=None):
+    # (record type, SELECT list) for the requested fields of record, or all of them.
+    if columns is None:
+        columns = record._fields
+    unknown = [column for column in columns if column not in record._index]
+    if unknown:
+        raise ValueError(f"Unknown {record.__name__} column(s): {', '.join(unknown)}")
+    select = ", ".join((expressions or {}).get(column, column) for column in columns)
+    return _record_type(record.__name__, tuple(columns)), select
+
+
+def _fetch_records(conn, record, sql, parameters=()):
+    # Plain tuples from SQLite turned straight into records, with no sqlite3.Row in between.
+    # tuple.__new__ skips _make()'s length check: the SELECT list was built from the fields.
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return list(map(partial(tuple.__new__, record), cursor.execute(sql, parameters).fetchall()))
+
+
 # --- User functions ---
 
-def create_user(username, password_hash, salt):
-    conn = get_connection()
+def create_user(username, password_hash, salt, kdf_algorithm, kdf_iterations):
+    # Not one queued write: with shards the users row has to be committed to DB_PATH
+    # before the shard is filled in, so each step goes through its own database's writer.
     try:
-        conn.execute(
-            "INSERT INTO users (username, password_hash, salt) VALUES (?, ?, ?)",
-            (username, password_hash, salt),
-        )
-        user_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
-        conn.execute("INSERT INTO user_stats (user_id) VALUES (?)", (user_id,))
-        conn.commit()
+        if not SHARD_PATHS:
+            return _create_user(username, password_hash, salt, kdf_algorithm, kdf_iterations)
+        user_id = _register_user(username, password_hash, salt, kdf_algorithm, kdf_iterations)
+        try:
+            _add_user_stats(user_id, username)
+        except BaseException:
+            _unregister_user(user_id)
+            raise
         return user_id
     except sqlite3.IntegrityError:
         return None
-    finally:
-        conn.close()
 
 
-def get_user_by_username(username):
-    conn = get_connection()
-    user = conn.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
-    conn.close()
-    return user
+@_directory_write
+def _create_user(username, password_hash, salt, kdf_algorithm, kdf_iterations):
+    with transaction() as conn:
+        user_id = _insert_user(conn, username, password_hash, salt, kdf_algorithm, kdf_iterations)
+        conn.execute("INSERT INTO user_stats (user_id) VALUES (?)", (user_id,))
+        _touch(user_id)
+    return user_id
 
 
-def get_user_stats(user_id):
-    conn = get_connection()
-    stats = conn.execute("SELECT * FROM user_stats WHERE user_id = ?", (user_id,)).fetchone()
-    conn.close()
-    return stats
+@queued_write
+def _add_user_stats(user_id, username):
+    with transaction(shard_path(user_id)) as conn:
+        _add_shard_user(conn, user_id, username)
+        conn.execute("INSERT INTO user_stats (user_id) VALUES (?)", (user_id,))
+        _touch(user_id)
+
+
+def _insert_user(conn, username, password_hash, salt, kdf_algorithm, kdf_iterations, created_at=None):
+    return conn.execute(
+        "INSERT INTO users (username, password_hash, salt, kdf_algorithm, kdf_iterations, created_at) "
+        "VALUES (?, ?, ?, ?, ?, COALESCE(?, datetime('now')))",
+        (username, password_hash, salt, kdf_algorithm, kdf_iterations, created_at),
+    ).lastrowid
+
+
+@_directory_write
+def _register_user(username, password_hash, salt, kdf_algorithm, kdf_iterations, created_at=None):
+    # The users row and its shard placement, committed by the time this returns unless
+    # the caller is inside a DB_PATH transaction. AUTOINCREMENT then never hands the id
+    # out again, even if filling in the shard fails.
+    with transaction() as conn:
+        user_id = _insert_user(conn, username, password_hash, salt, kdf_algorithm, kdf_iterations, created_at)
+        shard = _least_loaded_shard(conn)
+        conn.execute("INSERT INTO user_shards (user_id, shard) VALUES (?, ?)", (user_id, shard))
+    return user_id
+
+
+@_directory_write
+def _unregister_user(user_id):
+    with transaction() as conn:
+        conn.execute("DELETE FROM user_shards WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    _shard_paths.pop((DB_PATH, user_id), None)
+
+
+@contextmanager
+def _new_user(username, password_hash, salt, kdf_algorithm, kdf_iterations, created_at=None):
+    # Yields (conn, user_id) to fill in a new user's data. Without shards that is one
+    # transaction; with them the users row and its placement are committed to DB_PATH
+    # first and removed again if filling in the shard fails.
+    if not SHARD_PATHS:
+        with transaction() as conn:
+            yield conn, _insert_user(conn, username, password_hash, salt, kdf_algorithm, kdf_iterations, created_at)
+        return
+
+    user_id = _register_user(username, password_hash, salt, kdf_algorithm, kdf_iterations, created_at)
+    try:
+        with transaction(shard_path(user_id)) as conn:
+            _add_shard_user(conn, user_id, username)
+            yield conn, user_id
+    except BaseException:
+        _unregister_user(user_id)
+        raise
 
 
+def get_user_by_username(username, columns=None):
+    record, select = _projection(User, columns)
+    rows = _fetch_records(get_connection(), record, f"SELECT {select} FROM users WHERE username = ?", (username,))
+    return rows[0] if rows else None
+
+
+@_directory_write
+def update_password_hash(user_id, password_hash, salt, kdf_algorithm, kdf_iterations):
+    with transaction() as conn:
+        conn.execute(
+            "UPDATE users SET password_hash = ?, salt = ?, kdf_algorithm = ?, kdf_iterations = ? "
+            "WHERE id = ?",
+            (password_hash, salt, kdf_algorithm, kdf_iterations, user_id),
+        )
+
+
+@_read_through
+def get_user_stats(user_id, columns=None):
+    # Views read the whole row, so they share one cache entry per rerun; a projection
+    # pays off inside write transactions, where reads bypass the cache.
+    record, select = _projection(UserStats, columns)
+    rows = _fetch_records(get_connection(shard_path(user_id)), record,
+                          f"SELECT {select} FROM user_stats WHERE user_id = ?", (user_id,))
+    return rows[0] if rows else None
+
+
+@queued_write
 def update_user_stats(user_id, **kwargs):
-    conn = get_connection()
     sets = ", ".join(f"{k} = ?" for k in kwargs)
     vals = list(kwargs.values()) + [user_id]
-    conn.execute(f"UPDATE user_stats SET {sets} WHERE user_id = ?", vals)
-    conn.commit()
-    conn.close()
+    with transaction(shard_path(user_id)) as conn:
+        conn.execute(f"UPDATE user_stats SET {sets} WHERE user_id = ?", vals)
+        _touch(user_id)
+
+
+# --- API tokens ---
+
+@_directory_write
+def create_api_token(user_id, token_hash, expires_at):
+    with transaction() as conn:
+        conn.execute(
+            "INSERT INTO api_tokens (token_hash, user_id, expires_at) VALUES (?, ?, ?)",
+            (token_hash, user_id, expires_at),
+        )
+
+
+def get_api_token_user(token_hash):
+    # Returns the user id of an unexpired token, or None.
+    conn = get_connection()
+    row = conn.execute(
+        "SELECT user_id FROM api_tokens WHERE token_hash = ? AND expires_at > datetime('now')",
+        (token_hash,),
+    ).fetchone()
+    return row["user_id"] if row else None
+
+
+@queued_write
+def delete_api_token(token_hash):
+    with transaction() as conn:
+        conn.execute("DELETE FROM api_tokens WHERE token_hash = ?", (token_hash,))
+
+
+@queued_write
+def delete_expired_api_tokens():
+    with transaction() as conn:
+        return conn.execute("DELETE FROM api_tokens WHERE expires_at <= datetime('now')").rowcount
 
 
 # --- Category functions ---
 
+@_read_through
 def get_categories(user_id):
-    conn = get_connection()
-    cats = conn.execute(
+    conn = get_connection(shard_path(user_id))
+    return conn.execute(
         "SELECT * FROM categories WHERE is_default = 1 OR user_id = ? ORDER BY is_default DESC, name",
         (user_id,),
     ).fetchall()
-    conn.close()
-    return cats
 
 
+@queued_write
 def create_category(user_id, name, icon, color):
-    conn = get_connection()
-    conn.execute(
-        "INSERT INTO categories (user_id, name, icon, color) VALUES (?, ?, ?, ?)",
-        (user_id, name, icon, color),
-    )
-    conn.commit()
-    conn.close()
+    with transaction(shard_path(user_id)) as conn:
+        conn.execute(
+            "INSERT INTO categories (user_id, name, icon, color) VALUES (?, ?, ?, ?)",
+            (user_id, name, icon, color),
+        )
+        _touch(user_id)
 
 
-def update_category(cat_id, name, icon, color):
-    conn = get_connection()
-    conn.execute(
-        "UPDATE categories SET name = ?, icon = ?, color = ? WHERE id = ?",
-        (name, icon, color, cat_id),
-    )
-    conn.commit()
-    conn.close()
+@queued_write
+def update_category(cat_id, user_id, name, icon, color):
+    with transaction(shard_path(user_id)) as conn:
+        conn.execute(
+            "UPDATE categories SET name = ?, icon = ?, color = ? WHERE id = ? AND user_id = ?",
+            (name, icon, color, cat_id, user_id),
+        )
+        _touch(user_id)
 
 
-def delete_category(cat_id):
-    conn = get_connection()
-    conn.execute("DELETE FROM categories WHERE id = ? AND is_default = 0", (cat_id,))
-    conn.commit()
-    conn.close()
+@queued_write
+def delete_category(cat_id, user_id):
+    with transaction(shard_path(user_id)) as conn:
+        conn.execute(
+            "DELETE FROM categories WHERE id = ? AND user_id = ? AND is_default = 0",
+            (cat_id, user_id),
+        )
+        _touch(user_id)
 
 
 # --- Task functions ---
 
-def create_task(user_id, category_id, name, description, difficulty, is_recurring=False):
-    conn = get_connection()
-    conn.execute(
-        "INSERT INTO tasks (user_id, category_id, name, description, difficulty, is_recurring) "
-        "VALUES (?, ?, ?, ?, ?, ?)",
-        (user_id, category_id, name, description, difficulty, int(is_recurring)),
-    )
-    conn.commit()
-    conn.close()
+@queued_write
+def create_task(user_id, category_id, name, description, difficulty, schedule=None, next_due_at=None):
+    # A task without a schedule is one-off. next_due_at defaults to now (due at once).
+    with transaction(shard_path(user_id)) as conn:
+        conn.execute(
+            "INSERT INTO tasks (user_id, category_id, name, description, difficulty, is_recurring, schedule, "
+            "next_due_at) VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE(?, CAST(strftime('%s', 'now') AS INTEGER)))",
+            (user_id, category_id, name, description, difficulty, int(schedule is not None), schedule, next_due_at),
+        )
+        _touch(user_id)
 
 
-def get_active_tasks(user_id):
-    conn = get_connection()
-    tasks = conn.execute(
-        "SELECT t.*, c.name as category_name, c.icon as category_icon, c.color as category_color "
-        "FROM tasks t JOIN categories c ON t.category_id = c.id "
+@_read_through
+def get_active_tasks(user_id, columns=None):
+    record, select = _projection(Task, columns, _TASK_SELECT)
+    return _fetch_records(
+        get_connection(shard_path(user_id)), record,
+        f"SELECT {select} FROM tasks t JOIN categories c ON t.category_id = c.id "
         "WHERE t.user_id = ? AND t.is_active = 1 ORDER BY t.created_at DESC",
         (user_id,),
-    ).fetchall()
-    conn.close()
-    return tasks
+    )
 
 
-def complete_task(task_id, user_id, points_earned):
-    conn = get_connection()
-    conn.execute(
-        "INSERT INTO task_completions (task_id, user_id, points_earned) VALUES (?, ?, ?)",
-        (task_id, user_id, points_earned),
+@_read_through
+def get_due_tasks(user_id, columns=None):
+    # Active tasks whose due time has passed, most recently due first. Cached like any
+    # read, so a task coming due must bump the user's version: see release_due_tasks().
+    record, select = _projection(Task, columns, _TASK_SELECT)
+    return _fetch_records(
+        get_connection(shard_path(user_id)), record,
+        f"SELECT {select} FROM tasks t JOIN categories c ON t.category_id = c.id "
+        "WHERE t.user_id = ? AND t.is_active = 1 AND t.next_due_at <= ? ORDER BY t.next_due_at DESC, t.id DESC",
+        (user_id, int(time.time())),
     )
-    # Deactivate non-recurring tasks
-    conn.execute(
-        "UPDATE tasks SET is_active = 0 WHERE id = ? AND is_recurring = 0",
-        (task_id,),
-    )
-    conn.execute(
-        "INSERT INTO point_transactions (user_id, amount, transaction_type, reference_id) "
-        "VALUES (?, ?, 'earned', ?)",
-        (user_id, points_earned, task_id),
-    )
-    conn.commit()
-    conn.close()
+
+
+@_read_through
+def get_active_task_count(user_id):
+    conn = get_connection(shard_path(user_id))
+    return conn.execute(
+        "SELECT COUNT(*) FROM tasks WHERE user_id = ? AND is_active = 1", (user_id,)
+    ).fetchone()[0]
+
+
+def next_task_due_at(after):
+    # Earliest time after `after` at which a recurring task comes due, in any database file.
+    times = [
+        get_connection(path).execute(
+            "SELECT MIN(next_due_at) FROM tasks WHERE is_active = 1 AND is_recurring = 1 AND next_due_at > ?",
+            (after,),
+        ).fetchone()[0]
+        for path in _all_paths()
+    ]
+    return min((t for t in times if t is not None), default=None)
+
+
+def release_due_tasks(since, until):
+    # Bumps the cache version of every user with a task that came due in (since, until],
+    # so their cached get_due_tasks() is re-read. Returns how many users that was.
+    released = 0
+    for path in _all_paths():
+        user_ids = {row[0] for row in get_connection(path).execute(
+            "SELECT user_id FROM tasks WHERE is_active = 1 AND is_recurring = 1 AND next_due_at > ? "
+            "AND next_due_at <= ?",
+            (since, until),
+        )}
+        _bump_versions(path, user_ids)
+        released += len(user_ids)
+    return released
+
+
+@queued_write
+def complete_task(task_id, user_id, points_earned, next_due_at=None):
+    # next_due_at is when a scheduled task comes due again; one-off tasks are deactivated.
+    with transaction(shard_path(user_id)) as conn:
+        conn.execute(
+            "INSERT INTO completions (task_id, user_id, points_earned) VALUES (?, ?, ?)",
+            (task_id, user_id, points_earned),
+        )
+        # Deactivate non-recurring tasks
+        conn.execute(
+            "UPDATE tasks SET is_active = 0 WHERE id = ? AND is_recurring = 0",
+            (task_id,),
+        )
+        if next_due_at is not None:
+            conn.execute("UPDATE tasks SET next_due_at = ? WHERE id = ?", (next_due_at, task_id))
+        conn.execute(
+            f"INSERT INTO ledger (user_id, amount, type, reference_id) VALUES (?, ?, {EARNED}, ?)",
+            (user_id, points_earned, task_id),
+        )
+        conn.execute(
+            "UPDATE user_stats SET total_completions = total_completions + 1 WHERE user_id = ?",
+            (user_id,),
+        )
+        conn.execute(
+            "INSERT INTO user_category_stats (user_id, category_id, completions) "
+            "SELECT ?, category_id, 1 FROM tasks WHERE id = ? "
+            "ON CONFLICT (user_id, category_id) DO UPDATE SET completions = completions + 1",
+            (user_id, task_id),
+        )
+        _add_daily_stats_row(conn, user_id, completions=1, points_earned=points_earned)
+        _touch(user_id)
+
+
+@queued_write
+def complete_tasks(user_id, completions, next_due=None):
+    # Batch form of complete_task(): completions is [(task_id, points_earned), ...] and
+    # next_due {task_id: next_due_at} for the scheduled ones. One statement per table
+    # via executemany, one counter and one rollup update.
+    if not completions:
+        return
+    with transaction(shard_path(user_id)) as conn:
+        conn.executemany(
+            "INSERT INTO completions (task_id, user_id, points_earned) VALUES (?, ?, ?)",
+            [(task_id, user_id, points) for task_id, points in completions],
+        )
+        conn.executemany(
+            "UPDATE tasks SET is_active = 0 WHERE id = ? AND is_recurring = 0",
+            [(task_id,) for task_id, _ in completions],
+        )
+        conn.executemany(
+            "UPDATE tasks SET next_due_at = ? WHERE id = ?",
+            [(due, task_id) for task_id, due in (next_due or {}).items()],
+        )
+        conn.executemany(
+            f"INSERT INTO ledger (user_id, amount, type, reference_id) VALUES (?, ?, {EARNED}, ?)",
+            [(user_id, points, task_id) for task_id, points in completions],
+        )
+        conn.execute(
+            "UPDATE user_stats SET total_completions = total_completions + ? WHERE user_id = ?",
+            (len(completions), user_id),
+        )
+        conn.executemany(
+            "INSERT INTO user_category_stats (user_id, category_id, completions) "
+            "SELECT ?, category_id, 1 FROM tasks WHERE id = ? "
+            "ON CONFLICT (user_id, category_id) DO UPDATE SET completions = completions + 1",
+            [(user_id, task_id) for task_id, _ in completions],
+        )
+        _add_daily_stats_row(conn, user_id, completions=len(completions),
+                             points_earned=sum(points for _, points in completions))
+        _touch(user_id)
 
 
 def get_task_completions(user_id, limit=50):
-    conn = get_connection()
-    completions = conn.execute(
-        "SELECT tc.*, t.name as task_name, t.difficulty, c.icon as category_icon "
-        "FROM task_completions tc "
+    return get_task_completions_page(user_id, limit)[0]
+
+
+@_read_through
+def get_task_completions_page(user_id, limit=20, cursor=None):
+    after, after_params = _keyset_clause(cursor, "tc.completed_at", "tc.id")
+    rows = _fetch_records(
+        get_connection(shard_path(user_id)), Completion,
+        "SELECT tc.id, tc.task_id, tc.user_id, tc.points_earned, "
+        "datetime(tc.completed_at, 'unixepoch') as completed_at, tc.completed_at as completed_epoch, "
+        "t.name as task_name, t.difficulty, c.icon as category_icon "
+        "FROM completions tc "
         "JOIN tasks t ON tc.task_id = t.id "
         "JOIN categories c ON t.category_id = c.id "
-        "WHERE tc.user_id = ? ORDER BY tc.completed_at DESC LIMIT ?",
-        (user_id, limit),
-    ).fetchall()
-    conn.close()
-    return completions
+        "WHERE tc.user_id = ?" + after + " ORDER BY tc.completed_at DESC, tc.id DESC LIMIT ?",
+        (user_id, *after_params, limit + 1),
+    )
+    return _finish_page(rows, limit, "completed_epoch")
 
 
+@_read_through
 def get_total_completions(user_id):
-    conn = get_connection()
-    count = conn.execute(
-        "SELECT COUNT(*) FROM task_completions WHERE user_id = ?", (user_id,)
-    ).fetchone()[0]
-    conn.close()
-    return count
+    conn = get_connection(shard_path(user_id))
+    row = conn.execute(
+        "SELECT total_completions FROM user_stats WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return row[0] if row else 0
 
 
+@_read_through
 def get_category_completion_counts(user_id):
-    conn = get_connection()
-    rows = conn.execute(
-        "SELECT c.name, c.icon, c.color, COUNT(tc.id) as count "
-        "FROM task_completions tc "
-        "JOIN tasks t ON tc.task_id = t.id "
-        "JOIN categories c ON t.category_id = c.id "
-        "WHERE tc.user_id = ? GROUP BY c.id ORDER BY count DESC",
+    conn = get_connection(shard_path(user_id))
+    return conn.execute(
+        "SELECT c.name, c.icon, c.color, s.completions as count "
+        "FROM user_category_stats s "
+        "JOIN categories c ON s.category_id = c.id "
+        "WHERE s.user_id = ? AND s.completions > 0 ORDER BY count DESC",
         (user_id,),
     ).fetchall()
-    conn.close()
-    return rows
 
 
+@_read_through
 def get_max_category_completions(user_id):
-    conn = get_connection()
+    conn = get_connection(shard_path(user_id))
     row = conn.execute(
-        "SELECT MAX(cnt) FROM ("
-        "  SELECT COUNT(tc.id) as cnt FROM task_completions tc "
-        "  JOIN tasks t ON tc.task_id = t.id "
-        "  WHERE tc.user_id = ? GROUP BY t.category_id"
-        ")",
+        "SELECT MAX(completions) FROM user_category_stats WHERE user_id = ?",
         (user_id,),
     ).fetchone()
-    conn.close()
     return row[0] if row[0] else 0
 
 
 def get_weekly_completions(user_id):
-    conn = get_connection()
-    rows = conn.execute(
-        "SELECT DATE(completed_at) as day, COUNT(*) as count "
-        "FROM task_completions WHERE user_id = ? "
-        "AND completed_at >= datetime('now', '-7 days') "
-        "GROUP BY DATE(completed_at) ORDER BY day",
-        (user_id,),
+    # Today and the six days before it (UTC); the date is part of the cache key.
+    since = (datetime.now(timezone.utc).date() - timedelta(days=6)).isoformat()
+    return _get_completions_since(user_id, since)
+
+
+@_read_through
+def _get_completions_since(user_id, since):
+    conn = get_connection(shard_path(user_id))
+    return conn.execute(
+        "SELECT day, completions as count FROM user_daily_stats "
+        "WHERE user_id = ? AND day >= ? AND completions > 0 ORDER BY day",
+        (user_id, since),
     ).fetchall()
-    conn.close()
-    return rows
 
 
+@_read_through
 def get_xp_over_time(user_id):
-    conn = get_connection()
-    rows = conn.execute(
-        "SELECT DATE(created_at) as day, SUM(amount) as total "
-        "FROM point_transactions WHERE user_id = ? AND transaction_type = 'spent_xp' "
-        "GROUP BY DATE(created_at) ORDER BY day",
+    conn = get_connection(shard_path(user_id))
+    return conn.execute(
+        "SELECT day, -xp_spent as total FROM user_daily_stats "
+        "WHERE user_id = ? AND xp_spent > 0 ORDER BY day",
         (user_id,),
     ).fetchall()
-    conn.close()
-    return rows
 
 
+@queued_write
 def delete_task(task_id, user_id):
-    conn = get_connection()
-    conn.execute("UPDATE tasks SET is_active = 0 WHERE id = ? AND user_id = ?", (task_id, user_id))
-    conn.commit()
-    conn.close()
+    with transaction(shard_path(user_id)) as conn:
+        conn.execute("UPDATE tasks SET is_active = 0 WHERE id = ? AND user_id = ?", (task_id, user_id))
+        _touch(user_id)
 
 
 # --- Reward functions ---
 
+@queued_write
 def create_reward(user_id, name, description, value, point_cost):
-    conn = get_connection()
-    conn.execute(
-        "INSERT INTO rewards (user_id, name, description, value, point_cost) VALUES (?, ?, ?, ?, ?)",
-        (user_id, name, description, value, point_cost),
-    )
-    conn.commit()
-    conn.close()
+    with transaction(shard_path(user_id)) as conn:
+        conn.execute(
+            "INSERT INTO rewards (user_id, name, description, value, point_cost) VALUES (?, ?, ?, ?, ?)",
+            (user_id, name, description, value, point_cost),
+        )
+        _touch(user_id)
 
 
-def get_rewards(user_id):
-    conn = get_connection()
-    rewards = conn.execute(
-        "SELECT * FROM rewards WHERE user_id = ? ORDER BY point_cost ASC",
+@_read_through
+def get_rewards(user_id, columns=None):
+    record, select = _projection(Reward, columns)
+    return _fetch_records(
+        get_connection(shard_path(user_id)), record,
+        f"SELECT {select} FROM rewards WHERE user_id = ? ORDER BY point_cost ASC",
         (user_id,),
-    ).fetchall()
-    conn.close()
-    return rewards
+    )
 
 
+@queued_write
 def redeem_reward(reward_id, user_id, points_spent):
-    conn = get_connection()
-    conn.execute(
-        "INSERT INTO reward_redemptions (reward_id, user_id, points_spent) VALUES (?, ?, ?)",
-        (reward_id, user_id, points_spent),
-    )
-    conn.execute(
-        "INSERT INTO point_transactions (user_id, amount, transaction_type, reference_id) "
-        "VALUES (?, ?, 'spent_reward', ?)",
-        (user_id, -points_spent, reward_id),
-    )
-    conn.commit()
-    conn.close()
+    # Debits only if the balance covers the cost, so concurrent redemptions cannot overdraw.
+    with transaction(shard_path(user_id)) as conn:
+        debited = conn.execute(
+            "UPDATE user_stats SET available_points = available_points - ?, "
+            "rewards_redeemed = rewards_redeemed + 1 "
+            "WHERE user_id = ? AND available_points >= ?",
+            (points_spent, user_id, points_spent),
+        ).rowcount
+        if not debited:
+            return False
+        conn.execute(
+            "INSERT INTO redemptions (reward_id, user_id, points_spent) VALUES (?, ?, ?)",
+            (reward_id, user_id, points_spent),
+        )
+        conn.execute(
+            f"INSERT INTO ledger (user_id, amount, type, reference_id) VALUES (?, ?, {SPENT_REWARD}, ?)",
+            (user_id, -points_spent, reward_id),
+        )
+        _add_daily_stats_row(conn, user_id, reward_points_spent=points_spent)
+        _touch(user_id)
+    return True
 
 
+@_read_through
 def get_redemption_count(user_id):
-    conn = get_connection()
-    count = conn.execute(
-        "SELECT COUNT(*) FROM reward_redemptions WHERE user_id = ?", (user_id,)
-    ).fetchone()[0]
-    conn.close()
-    return count
+    conn = get_connection(shard_path(user_id))
+    row = conn.execute(
+        "SELECT rewards_redeemed FROM user_stats WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    return row[0] if row else 0
 
 
 def get_redemption_history(user_id, limit=50):
-    conn = get_connection()
+    return get_redemption_history_page(user_id, limit)[0]
+
+
+@_read_through
+def get_redemption_history_page(user_id, limit=20, cursor=None):
+    after, after_params = _keyset_clause(cursor, "rr.redeemed_at", "rr.id")
+    conn = get_connection(shard_path(user_id))
     rows = conn.execute(
-        "SELECT rr.*, r.name as reward_name, r.value "
-        "FROM reward_redemptions rr JOIN rewards r ON rr.reward_id = r.id "
-        "WHERE rr.user_id = ? ORDER BY rr.redeemed_at DESC LIMIT ?",
-        (user_id, limit),
+        "SELECT rr.id, rr.reward_id, rr.user_id, rr.points_spent, "
+        "datetime(rr.redeemed_at, 'unixepoch') as redeemed_at, rr.redeemed_at as redeemed_epoch, "
+        "r.name as reward_name, r.value "
+        "FROM redemptions rr JOIN rewards r ON rr.reward_id = r.id "
+        "WHERE rr.user_id = ?" + after + " ORDER BY rr.redeemed_at DESC, rr.id DESC LIMIT ?",
+        (user_id, *after_params, limit + 1),
     ).fetchall()
-    conn.close()
-    return rows
+    return _finish_page(rows, limit, "redeemed_epoch")
 
 
+@queued_write
 def delete_reward(reward_id, user_id):
-    conn = get_connection()
-    conn.execute("DELETE FROM rewards WHERE id = ? AND user_id = ?", (reward_id, user_id))
-    conn.commit()
-    conn.close()
+    with transaction(shard_path(user_id)) as conn:
+        conn.execute("DELETE FROM rewards WHERE id = ? AND user_id = ?", (reward_id, user_id))
+        _touch(user_id)
 
 
 # --- Achievement functions ---
 
+@_read_through
 def get_all_achievements():
     conn = get_connection()
-    achievements = conn.execute("SELECT * FROM achievements ORDER BY category, requirement_value").fetchall()
-    conn.close()
-    return achievements
+    return conn.execute("SELECT * FROM achievements ORDER BY category, requirement_value").fetchall()
 
 
+@_read_through
 def get_user_achievements(user_id):
-    conn = get_connection()
+    conn = get_connection(shard_path(user_id))
     rows = conn.execute(
         "SELECT achievement_id, unlocked_at FROM user_achievements WHERE user_id = ?",
         (user_id,),
     ).fetchall()
-    conn.close()
     return {row["achievement_id"]: row["unlocked_at"] for row in rows}
 
 
+@queued_write
 def unlock_achievement(user_id, achievement_id):
-    conn = get_connection()
-    try:
-        conn.execute(
-            "INSERT INTO user_achievements (user_id, achievement_id) VALUES (?, ?)",
+    with transaction(shard_path(user_id)) as conn:
+        inserted = conn.execute(
+            "INSERT OR IGNORE INTO user_achievements (user_id, achievement_id) VALUES (?, ?)",
             (user_id, achievement_id),
-        )
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
+        ).rowcount
+        _touch(user_id)
+    return inserted == 1
 
 
 # --- Point transaction functions ---
 
+@queued_write
+def add_points(user_id, points):
+    with transaction(shard_path(user_id)) as conn:
+        conn.execute(
+            "UPDATE user_stats SET available_points = available_points + ? WHERE user_id = ?",
+            (points, user_id),
+        )
+        _touch(user_id)
+
+
+@queued_write
 def spend_points_on_xp(user_id, amount):
-    conn = get_connection()
+    # Moves points to XP only if the balance covers it; the caller recomputes the level.
+    with transaction(shard_path(user_id)) as conn:
+        debited = conn.execute(
+            "UPDATE user_stats SET available_points = available_points - ?, total_xp = total_xp + ? "
+            "WHERE user_id = ? AND available_points >= ?",
+            (amount, amount, user_id, amount),
+        ).rowcount
+        if not debited:
+            return False
+        conn.execute(
+            f"INSERT INTO ledger (user_id, amount, type) VALUES (?, ?, {SPENT_XP})",
+            (user_id, -amount),
+        )
+        _add_daily_stats_row(conn, user_id, xp_spent=amount)
+        _touch(user_id)
+    return True
+
+
+def get_point_transactions(user_id, limit=50):
+    return get_point_transactions_page(user_id, limit)[0]
+
+
+@_read_through
+def get_point_transactions_page(user_id, limit=20, cursor=None):
+    after, after_params = _keyset_clause(cursor, "l.created_at", "l.id")
+    conn = get_connection(shard_path(user_id))
+    rows = conn.execute(
+        "SELECT l.id, l.user_id, l.amount, t.name as transaction_type, l.reference_id, "
+        "datetime(l.created_at, 'unixepoch') as created_at, l.created_at as created_epoch "
+        "FROM ledger l JOIN transaction_types t ON t.code = l.type "
+        "WHERE l.user_id = ?" + after + " ORDER BY l.created_at DESC, l.id DESC LIMIT ?",
+        (user_id, *after_params, limit + 1),
+    ).fetchall()
+    return _finish_page(rows, limit, "created_epoch")
+
+
+# --- Materialized counters ---
+
+def rebuild_counters(user_id=None):
+    # Recomputes the counters kept in user_stats and user_category_stats from the raw tables.
+    for path in [shard_path(user_id)] if user_id is not None else _all_paths():
+        with transaction(path) as conn:
+            _rebuild_counters(conn, user_id)
+            if user_id is not None:
+                _touch(user_id, path)
+    if user_id is None:
+        clear_read_cache()
+
+
+def _rebuild_counters(conn, user_id=None):
+    # Reads the stable table names (compatibility views since migration 8) because
+    # migration 3 runs this against the schema as it was then.
+    scope, params = ("", ()) if user_id is None else (" WHERE user_id = ?", (user_id,))
     conn.execute(
-        "INSERT INTO point_transactions (user_id, amount, transaction_type) VALUES (?, ?, 'spent_xp')",
-        (user_id, -amount),
+        "UPDATE user_stats SET "
+        "total_completions = (SELECT COUNT(*) FROM task_completions tc WHERE tc.user_id = user_stats.user_id), "
+        "rewards_redeemed = (SELECT COUNT(*) FROM reward_redemptions rr WHERE rr.user_id = user_stats.user_id)"
+        + scope,
+        params,
+    )
+    conn.execute("DELETE FROM user_category_stats" + scope, params)
+    conn.execute(
+        "INSERT INTO user_category_stats (user_id, category_id, completions) "
+        "SELECT tc.user_id, t.category_id, COUNT(*) FROM task_completions tc "
+        "JOIN tasks t ON tc.task_id = t.id"
+        + scope.replace("user_id", "tc.user_id")
+        + " GROUP BY tc.user_id, t.category_id",
+        params,
     )
-    conn.commit()
-    conn.close()
 
 
-def get_point_transactions(user_id, limit=50):
-    conn = get_connection()
+# --- Daily rollups ---
+
+def _add_daily_stats_row(conn, user_id, completions=0, points_earned=0, xp_spent=0, reward_points_spent=0):
+    conn.execute(
+        "INSERT INTO user_daily_stats (user_id, day, completions, points_earned, xp_spent, reward_points_spent) "
+        "VALUES (?, DATE('now'), ?, ?, ?, ?) "
+        "ON CONFLICT (user_id, day) DO UPDATE SET "
+        "completions = completions + excluded.completions, "
+        "points_earned = points_earned + excluded.points_earned, "
+        "xp_spent = xp_spent + excluded.xp_spent, "
+        "reward_points_spent = reward_points_spent + excluded.reward_points_spent",
+        (user_id, completions, points_earned, xp_spent, reward_points_spent),
+    )
+
+
+@_read_through
+def get_daily_stats(user_id, since=None):
+    conn = get_connection(shard_path(user_id))
+    return conn.execute(
+        "SELECT day, completions, points_earned, xp_spent, reward_points_spent "
+        "FROM user_daily_stats WHERE user_id = ? AND day >= ? ORDER BY day",
+        (user_id, since or ""),
+    ).fetchall()
+
+
+def rebuild_daily_stats(user_id=None):
+    for path in [shard_path(user_id)] if user_id is not None else _all_paths():
+        with transaction(path) as conn:
+            _rebuild_daily_stats(conn, user_id)
+            if user_id is not None:
+                _touch(user_id, path)
+    if user_id is None:
+        clear_read_cache()
+
+
+def _rebuild_daily_stats(conn, user_id=None):
+    # Stable table names for the same reason as _rebuild_counters(): migration 5 runs it.
+    scope, params = ("", ()) if user_id is None else (" AND user_id = ?", (user_id,))
+    conn.execute("DELETE FROM user_daily_stats WHERE 1" + scope, params)
+    conn.execute(
+        "INSERT INTO user_daily_stats (user_id, day, completions, points_earned, xp_spent, reward_points_spent) "
+        "SELECT user_id, day, SUM(completions), SUM(points_earned), SUM(xp_spent), SUM(reward_points_spent) "
+        "FROM ("
+        "  SELECT user_id, DATE(completed_at) as day, 1 as completions, points_earned, "
+        "         0 as xp_spent, 0 as reward_points_spent "
+        "  FROM task_completions WHERE 1" + scope +
+        "  UNION ALL "
+        "  SELECT user_id, DATE(created_at), 0, 0, -amount, 0 "
+        "  FROM point_transactions WHERE transaction_type = 'spent_xp'" + scope +
+        "  UNION ALL "
+        "  SELECT user_id, DATE(redeemed_at), 0, 0, 0, points_spent "
+        "  FROM reward_redemptions WHERE 1" + scope +
+        ") GROUP BY user_id, day",
+        params * 3,
+    )
+
+
+# --- Streaks ---
+#
+# A streak counts consecutive local days with a completion, in the user's time zone.
+# models.update_streak() moves it one completion at a time; recompute_streaks()
+# derives it from the whole completion history instead.
+
+STREAK_CHUNK_SIZE = 500  # users per transaction
+
+
+def time_zone(name):
+    # None is the server's local time zone, as datetime.now() and fromtimestamp() take it.
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone {name!r}") from None
+
+
+def recompute_streaks(user_id=None, chunk_size=STREAK_CHUNK_SIZE, now=None):
+    # Rebuilds current_streak, longest_streak and last_completion_date from the
+    # completions, chunk_size users per transaction. Returns how many users changed.
+    now = time.time() if now is None else now
+    changed = 0
+    for path in [shard_path(user_id)] if user_id is not None else _all_paths():
+        after = 0
+        while True:
+            with transaction(path) as conn:
+                if user_id is not None:
+                    user_ids = [user_id]
+                else:
+                    user_ids = [r[0] for r in conn.execute(
+                        "SELECT user_id FROM user_stats WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                        (after, chunk_size),
+                    )]
+                changed += _recompute_streaks(conn, user_ids, now)
+            if user_id is not None or len(user_ids) < chunk_size:
+                break
+            after = user_ids[-1]
+    return changed
+
+
+def _recompute_streaks(conn, user_ids, now):
+    # One ordered range scan of the completions index for the whole chunk, grouped by user.
+    if not user_ids:
+        return 0
+    low, high = min(user_ids), max(user_ids)
+    wanted = set(user_ids)
+    stored = conn.execute(
+        "SELECT user_id, time_zone, current_streak, longest_streak, last_completion_date FROM user_stats "
+        "WHERE user_id BETWEEN ? AND ?",
+        (low, high),
+    ).fetchall()
     rows = conn.execute(
-        "SELECT * FROM point_transactions WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
-        (user_id, limit),
+        "SELECT user_id, completed_at FROM completions WHERE user_id BETWEEN ? AND ? ORDER BY user_id, completed_at",
+        (low, high),
+    )
+    history = {uid: [r[1] for r in group] for uid, group in groupby(rows, key=itemgetter(0)) if uid in wanted}
+
+    updates = []
+    for row in stored:
+        if row["user_id"] not in wanted:
+            continue
+        zone = time_zone(row["time_zone"])
+        # Timestamps are sorted, so their local days are too; dict.fromkeys drops repeats.
+        days = list(dict.fromkeys(datetime.fromtimestamp(ts, zone).toordinal()
+                                  for ts in history.get(row["user_id"], ())))
+        current, longest = _streaks(days, datetime.fromtimestamp(now, zone).toordinal())
+        last = date.fromordinal(days[-1]).isoformat() if days else None
+        if (current, longest, last) != (row["current_streak"], row["longest_streak"], row["last_completion_date"]):
+            updates.append((current, longest, last, row["user_id"]))
+    conn.executemany(
+        "UPDATE user_stats SET current_streak = ?, longest_streak = ?, last_completion_date = ? WHERE user_id = ?",
+        updates,
+    )
+    for update in updates:
+        _touch(update[-1])
+    return len(updates)
+
+
+def _streaks(days, today):
+    # days are sorted distinct day ordinals. Within a run of consecutive days, day minus
+    # position is constant, so each run is one group. The last run is still current if
+    # it reaches today or yesterday.
+    if not days:
+        return 0, 0
+    runs = [sum(1 for _ in run) for _, run in groupby(map(sub, days, count()))]
+    return (runs[-1] if today - days[-1] <= 1 else 0), max(runs)
+
+
+# --- Leaderboards ---
+#
+# The all-time board is ranked in process by models from get_xp_standings(). The
+# weekly and monthly boards count XP gained (points converted) in the current UTC
+# week and month; they read a whole period of every user's ledger, so
+# refresh_leaderboards() stores the top LEADERBOARD_SIZE on a schedule.
+
+LEADERBOARD_SIZE = 100
+LEADERBOARDS = ("weekly", "monthly")
+
+
+def get_xp_standings():
+    # Every user's (total_xp, user_id), highest XP first, merged from each file's XP index.
+    per_path = [
+        get_connection(path).execute("SELECT total_xp, user_id FROM user_stats ORDER BY total_xp DESC, user_id")
+        for path in _all_paths()
+    ]
+    return [tuple(row) for row in heapq.merge(*per_path, key=lambda row: (-row[0], row[1]))]
+
+
+def get_usernames(user_ids):
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    conn = get_connection(DB_PATH)
+    return dict(conn.execute(
+        f"SELECT id, username FROM users WHERE id IN ({', '.join('?' * len(user_ids))})", user_ids
+    ).fetchall())
+
+
+def leaderboard_periods(now=None):
+    # First day (UTC) of the week and month that the boards cover at time now.
+    today = datetime.fromtimestamp(time.time() if now is None else now, timezone.utc).date()
+    return {"weekly": (today - timedelta(days=today.weekday())).isoformat(),
+            "monthly": today.replace(day=1).isoformat()}
+
+
+def refresh_leaderboards(now=None):
+    periods = leaderboard_periods(now)
+    since = {board: int(datetime.fromisoformat(day).replace(tzinfo=timezone.utc).timestamp())
+             for board, day in periods.items()}
+    gained = []
+    for path in _all_paths():
+        gained += get_connection(path).execute(
+            "SELECT user_id, "
+            "-SUM(CASE WHEN created_at >= :weekly THEN amount ELSE 0 END) as weekly, "
+            "-SUM(CASE WHEN created_at >= :monthly THEN amount ELSE 0 END) as monthly "
+            "FROM ledger WHERE type = :type AND created_at >= :since GROUP BY user_id",
+            dict(since, type=SPENT_XP, since=min(since.values())),
+        ).fetchall()
+    entries = []
+    for board in LEADERBOARDS:
+        top = heapq.nsmallest(LEADERBOARD_SIZE, ((-row[board], row["user_id"]) for row in gained if row[board] > 0))
+        entries += [(board, rank, user_id, -xp, periods[board]) for rank, (xp, user_id) in enumerate(top, 1)]
+    _store_leaderboards(entries)
+    return len(entries)
+
+
+@_directory_write
+def _store_leaderboards(entries):
+    with transaction(DB_PATH) as conn:
+        conn.execute("DELETE FROM leaderboard_entries")
+        conn.executemany(
+            "INSERT INTO leaderboard_entries (board, rank, user_id, xp, period_start) VALUES (?, ?, ?, ?, ?)",
+            entries,
+        )
+
+
+def get_leaderboard(board, limit=LEADERBOARD_SIZE):
+    conn = get_connection(DB_PATH)
+    return conn.execute(
+        "SELECT e.rank, e.user_id, u.username, e.xp, e.period_start, e.refreshed_at "
+        "FROM leaderboard_entries e JOIN users u ON u.id = e.user_id "
+        "WHERE e.board = ? ORDER BY e.rank LIMIT ?",
+        (board, limit),
     ).fetchall()
-    conn.close()
-    return rows
+
+
+# --- Export / import ---
+#
+# A user's data as (table, row) records, parents before children. Row ids are the
+# source database's; import_user() assigns fresh ones and remaps every reference.
+# Derived tables (counters, rollups) are not exported and are rebuilt on import.
+
+EXPORT_BATCH_SIZE = 5000
+EXPORT_QUERIES = (
+    ("users",
+     "SELECT id, username, password_hash, salt, kdf_algorithm, kdf_iterations, created_at "
+     "FROM users WHERE id = ?"),
+    ("user_stats",
+     "SELECT total_xp, level, available_points, current_streak, longest_streak, last_completion_date, time_zone "
+     "FROM user_stats WHERE user_id = ?"),
+    ("categories",
+     "SELECT id, name, icon, color, is_default FROM categories WHERE user_id = ? OR is_default = 1"),
+    ("tasks",
+     "SELECT id, category_id, name, description, difficulty, is_recurring, is_active, created_at, schedule, "
+     "next_due_at FROM tasks WHERE user_id = ?"),
+    ("task_completions",
+     "SELECT id, task_id, points_earned, completed_at FROM task_completions WHERE user_id = ?"),
+    ("rewards",
+     "SELECT id, name, description, value, point_cost, created_at FROM rewards WHERE user_id = ?"),
+    ("reward_redemptions",
+     "SELECT id, reward_id, points_spent, redeemed_at FROM reward_redemptions WHERE user_id = ?"),
+    ("user_achievements",
+     "SELECT a.name as achievement, ua.unlocked_at FROM user_achievements ua "
+     "JOIN achievements a ON ua.achievement_id = a.id WHERE ua.user_id = ?"),
+    ("point_transactions",
+     "SELECT id, amount, transaction_type, reference_id, created_at "
+     "FROM point_transactions WHERE user_id = ?"),
+)
+
+
+def iter_user_export(user_id, batch_size=EXPORT_BATCH_SIZE):
+    # Reads through one snapshot on a private connection, fetching batch_size rows at a
+    # time, so memory stays flat however much history the user has. The users row always
+    # comes from DB_PATH: a shard only has a copy without credentials.
+    path = shard_path(user_id)
+    conn = _open_connection(path)
+    try:
+        conn.execute("BEGIN")
+        for table, sql in EXPORT_QUERIES:
+            source = get_connection(DB_PATH) if table == "users" and path != DB_PATH else conn
+            cursor = source.execute(sql, (user_id,))
+            columns = [d[0] for d in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield table, dict(zip(columns, row))
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def import_user(records, username=None, batch_size=EXPORT_BATCH_SIZE):
+    # Loads records produced by iter_user_export() as a new user and returns the new
+    # user id. Raises ValueError if the username is taken.
+    records = iter(records)
+    table, row = next(records, (None, None))
+    if table != "users":
+        raise ValueError("Export does not start with a users record")
+    username = username or row["username"]
+    if get_user_by_username(username, ("id",)):
+        raise ValueError(f"Username {username!r} already exists")
+    with _new_user(username, row["password_hash"], row["salt"], row["kdf_algorithm"], row["kdf_iterations"],
+                   row["created_at"]) as (conn, user_id):
+        _load_user(conn, user_id, records, batch_size)
+        _touch(user_id)
+    return user_id
+
+
+def _load_user(conn, user_id, records, batch_size=EXPORT_BATCH_SIZE):
+    # The rest of an export, as the data of an existing users row; the counters and
+    # rollups are rebuilt rather than trusted.
+    importer = _UserImporter(conn, user_id, batch_size)
+    for table, row in records:
+        importer.add(table, row)
+    importer.finish()
+    _rebuild_counters(conn, user_id)
+    _rebuild_daily_stats(conn, user_id)
+
+
+class _UserImporter:
+    def __init__(self, conn, user_id, batch_size):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.user_id = user_id
+        self.table = None
+        self.pending = []
+        self.ids = {"categories": {}, "tasks": {}, "rewards": {}}
+        self.next_ids = {}
+        self.default_categories = {
+            row["name"]: row["id"]
+            for row in conn.execute("SELECT id, name FROM categories WHERE is_default = 1")
+        }
+        self.achievements = {row["name"]: row["id"] for row in conn.execute("SELECT id, name FROM achievements")}
+
+    def _new_id(self, table):
+        # Explicit ids let executemany() batches keep the old -> new mapping without lastrowid.
+        if table not in self.next_ids:
+            self.next_ids[table] = self.conn.execute(
+                f"SELECT MAX(COALESCE((SELECT MAX(id) FROM {table}), 0), "
+                f"COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0)) + 1",
+                (table,),
+            ).fetchone()[0]
+        new_id = self.next_ids[table]
+        self.next_ids[table] += 1
+        return new_id
+
+    def add(self, table, row):
+        if table == "users":
+            return  # the caller has created the user
+        if table != self.table:
+            self.flush()
+            self.table = table
+        values = getattr(self, f"_{table}")(row)
+        if values is not None:
+            self.pending.append(values)
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def _user_stats(self, row):
+        return (self.user_id, row["total_xp"], row["level"], row["available_points"],
+                row["current_streak"], row["longest_streak"], row["last_completion_date"], row.get("time_zone"))
+
+    def _categories(self, row):
+        if row["is_default"] and row["name"] in self.default_categories:
+            self.ids["categories"][row["id"]] = self.default_categories[row["name"]]
+            return None
+        new_id = self.ids["categories"][row["id"]] = self._new_id("categories")
+        return new_id, self.user_id, row["name"], row["icon"], row["color"]
+
+    def _tasks(self, row):
+        new_id = self.ids["tasks"][row["id"]] = self._new_id("tasks")
+        return (new_id, self.user_id, self.ids["categories"][row["category_id"]], row["name"],
+                row["description"], row["difficulty"], row["is_recurring"], row["is_active"], row["created_at"],
+                row.get("schedule", "daily" if row["is_recurring"] else None), row.get("next_due_at", 0))
+
+    def _task_completions(self, row):
+        return (self._new_id("completions"), self.ids["tasks"][row["task_id"]], self.user_id,
+                row["points_earned"], row["completed_at"])
+
+    def _rewards(self, row):
+        new_id = self.ids["rewards"][row["id"]] = self._new_id("rewards")
+        return (new_id, self.user_id, row["name"], row["description"], row["value"], row["point_cost"],
+                row["created_at"])
+
+    def _reward_redemptions(self, row):
+        return (self._new_id("redemptions"), self.ids["rewards"][row["reward_id"]], self.user_id,
+                row["points_spent"], row["redeemed_at"])
+
+    def _user_achievements(self, row):
+        achievement_id = self.achievements.get(row["achievement"])
+        if achievement_id is None:
+            return None
+        return self.user_id, achievement_id, row["unlocked_at"]
+
+    def _point_transactions(self, row):
+        refs = {"earned": self.ids["tasks"], "spent_reward": self.ids["rewards"]}.get(row["transaction_type"], {})
+        reference_id = refs.get(row["reference_id"]) if row["reference_id"] is not None else None
+        return (self._new_id("ledger"), self.user_id, row["amount"], TRANSACTION_TYPES[row["transaction_type"]],
+                reference_id, row["created_at"])
+
+    _INSERTS = {
+        "user_stats": "INSERT INTO user_stats (user_id, total_xp, level, available_points, current_streak, "
+                      "longest_streak, last_completion_date, time_zone) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        "categories": "INSERT INTO categories (id, user_id, name, icon, color) VALUES (?, ?, ?, ?, ?)",
+        "tasks": "INSERT INTO tasks (id, user_id, category_id, name, description, difficulty, is_recurring, "
+                 "is_active, created_at, schedule, next_due_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        # Exports carry TEXT timestamps and type names (the compatibility view columns).
+        "task_completions": "INSERT INTO completions (id, task_id, user_id, points_earned, completed_at) "
+                            f"VALUES (?, ?, ?, ?, {_epoch('?')})",
+        "rewards": "INSERT INTO rewards (id, user_id, name, description, value, point_cost, created_at) "
+                   "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        "reward_redemptions": "INSERT INTO redemptions (id, reward_id, user_id, points_spent, redeemed_at) "
+                              f"VALUES (?, ?, ?, ?, {_epoch('?')})",
+        "user_achievements": "INSERT OR IGNORE INTO user_achievements (user_id, achievement_id, unlocked_at) "
+                             "VALUES (?, ?, ?)",
+        "point_transactions": "INSERT INTO ledger (id, user_id, amount, type, reference_id, created_at) "
+                              f"VALUES (?, ?, ?, ?, ?, {_epoch('?')})",
+    }
+
+    def flush(self):
+        if self.pending:
+            self.conn.executemany(self._INSERTS[self.table], self.pending)
+            self.pending = []
+
+    def finish(self):
+        self.flush()
+        self.conn.execute("INSERT OR IGNORE INTO user_stats (user_id) VALUES (?)", (self.user_id,))
+
+
+# --- Moving users between shards ---
+
+# Per-user tables, children before parents. api_tokens stay in DB_PATH with the users row.
+_USER_TABLES = (
+    "ledger_checkpoints", "user_daily_stats", "user_category_stats", "user_achievements", "ledger",
+    "redemptions", "completions", "rewards", "tasks", "categories", "user_stats",
+)
+
+
+def _delete_user_rows(conn, user_id):
+    for table in _USER_TABLES:
+        conn.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+
+
+def move_user(user_id, shard):
+    # Offline only (no app or API process running): copies the user's data into shard
+    # with fresh ids, points the directory at it, then deletes the old copy. Every step
+    # can be repeated if a move is interrupted. Returns False if it is already there.
+    source, target = shard_path(user_id), SHARD_PATHS[shard]
+    if source == target:
+        return False
+    username = get_connection(DB_PATH).execute("SELECT username FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+    with transaction(target) as conn:
+        _add_shard_user(conn, user_id, username)
+        _load_user(conn, user_id, iter_user_export(user_id))
+    with transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO user_shards (user_id, shard) VALUES (?, ?)", (user_id, shard))
+    _shard_paths[(DB_PATH, user_id)] = target
+    # Children are deleted before parents, so the foreign key checks would only find
+    # nothing, and without an index on completions.task_id each deleted task's check
+    # scans the whole table.
+    conn = get_connection(source)
+    conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        with transaction(source) as conn:
+            _delete_user_rows(conn, user_id)
+            if source != DB_PATH:
+                conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+    finally:
+        conn.execute("PRAGMA foreign_keys = ON")
+    clear_read_cache()
+    return True
+
+
+# --- Ledger reconciliation ---
+#
+# The point ledger is the source of truth for balances: available_points is the sum
+# of all amounts and total_xp the sum of points spent on XP. A checkpoint stores those
+# sums per user up to a transaction id, and every run advances all users' checkpoints
+# to the same id, so the next run only replays the ledger tail written since.
+
+LEDGER_BATCH_SIZE = 5000
+
+
+def _ledger_sums(conn, user_id, after_id, upto_id):
+    return conn.execute(
+        "SELECT COALESCE(SUM(amount), 0), "
+        f"COALESCE(SUM(CASE WHEN type = {SPENT_XP} THEN -amount ELSE 0 END), 0) "
+        "FROM ledger WHERE user_id = ? AND id > ? AND id <= ?",
+        (user_id, after_id, upto_id),
+    ).fetchone()
+
+
+def reconcile_ledger(batch_size=LEDGER_BATCH_SIZE):
+    # Compares every user's balance and XP with the ledger and advances the checkpoints.
+    # Returns [{"user_id", "available_points", "expected_points", "total_xp",
+    # "expected_xp"}, ...] for users whose stats disagree with the ledger.
+    drift = []
+    for path in _all_paths():
+        drift.extend(_reconcile_database(path, batch_size))
+    return drift
+
+
+def _reconcile_database(path, batch_size):
+    conn = _open_connection(path)
+    try:
+        # One read snapshot, so stats and ledger are compared at the same instant.
+        conn.execute("BEGIN")
+        high = conn.execute("SELECT COALESCE(MAX(id), 0) FROM ledger").fetchone()[0]
+        checkpoints = {
+            row[0]: [row[1], row[2], row[3]]
+            for row in conn.execute(
+                "SELECT user_id, last_transaction_id, available_points, total_xp FROM ledger_checkpoints"
+            )
+        }
+        low = min((cp[0] for cp in checkpoints.values()), default=0)
+
+        # Users without a checkpoint yet get one at the scan start from their own index range.
+        if low:
+            for (user_id,) in conn.execute(
+                "SELECT user_id FROM user_stats WHERE user_id NOT IN (SELECT user_id FROM ledger_checkpoints)"
+            ).fetchall():
+                points, xp = _ledger_sums(conn, user_id, 0, low)
+                checkpoints[user_id] = [low, points, xp]
+
+        # Stream the ledger tail in id order and fold it into the checkpoints.
+        cursor = conn.execute(
+            "SELECT id, user_id, amount, type FROM ledger WHERE id > ? AND id <= ? "
+            "ORDER BY id",
+            (low, high),
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row_id, user_id, amount, entry_type in rows:
+                cp = checkpoints.setdefault(user_id, [0, 0, 0])
+                if row_id > cp[0]:
+                    cp[1] += amount
+                    if entry_type == SPENT_XP:
+                        cp[2] -= amount
+
+        drift = []
+        cursor = conn.execute("SELECT user_id, available_points, total_xp FROM user_stats ORDER BY user_id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for user_id, points, xp in rows:
+                _, expected_points, expected_xp = checkpoints.get(user_id, (0, 0, 0))
+                if points != expected_points or xp != expected_xp:
+                    drift.append({
+                        "user_id": user_id,
+                        "available_points": points,
+                        "expected_points": expected_points,
+                        "total_xp": xp,
+                        "expected_xp": expected_xp,
+                    })
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    with transaction(path) as conn:
+        rows = [(user_id, high, cp[1], cp[2]) for user_id, cp in checkpoints.items()]
+        for start in range(0, len(rows), batch_size):
+            conn.executemany(
+                "INSERT INTO ledger_checkpoints (user_id, last_transaction_id, available_points, total_xp) "
+                "VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET last_transaction_id = excluded.last_transaction_id, "
+                "available_points = excluded.available_points, total_xp = excluded.total_xp, "
+                "created_at = datetime('now')",
+                rows[start:start + batch_size],
+            )
+    return drift
+
+
+def repair_ledger_drift(drift):
+    # Moves each user's stats by the difference found, rather than overwriting them,
+    # so activity committed since the reconciliation snapshot is preserved. The caller
+    # recomputes levels from the corrected XP.
+    by_path = {}
+    for d in drift:
+        by_path.setdefault(shard_path(d["user_id"]), []).append(d)
+    for path, entries in by_path.items():
+        with transaction(path) as conn:
+            conn.executemany(
+                "UPDATE user_stats SET available_points = available_points + ?, total_xp = total_xp + ? "
+                "WHERE user_id = ?",
+                [(d["expected_points"] - d["available_points"], d["expected_xp"] - d["total_xp"], d["user_id"])
+                 for d in entries],
+            )
+            for d in entries:
+                _touch(d["user_id"], path)
@@ -0,0 +1,149 @@
+import argparse
+import os
+import database as db
+import models
+import transfer
+
+
+def cmd_migrate(args):
+    for path in [db.DB_PATH, *db.SHARD_PATHS]:
+        version = db.migrate(path)
+        print(f"Schema at version {version} ({path})")
+
+
+def cmd_rebuild_counters(args):
+    db.rebuild_counters(args.user)
+    print("Counters rebuilt" + (f" for user {args.user}" if args.user else " for all users"))
+
+
+def cmd_rebuild_rollups(args):
+    db.rebuild_daily_stats(args.user)
+    print("Daily rollups rebuilt" + (f" for user {args.user}" if args.user else " for all users"))
+
+
+def cmd_reconcile_ledger(args):
+    drift = models.reconcile_ledger(repair=args.repair)
+    for d in drift:
+        print(f"user {d['user_id']}: points {d['available_points']} (ledger {d['expected_points']}), "
+              f"xp {d['total_xp']} (ledger {d['expected_xp']})")
+    action = "repaired" if args.repair else "found"
+    print(f"{len(drift)} user(s) with ledger drift {action}")
+    if drift and not args.repair:
+        raise SystemExit(1)
+
+
+def cmd_recompute_streaks(args):
+    changed = db.recompute_streaks(args.user)
+    print(f"{changed} streak(s) corrected" + (f" for user {args.user}" if args.user else ""))
+
+
+def cmd_refresh_leaderboards(args):
+    entries = db.refresh_leaderboards()
+    print(f"Leaderboards refreshed ({entries} entries)")
+
+
+def _plan_rebalance(placement, shard_count):
+    # Even shares, the larger ones going to the shards that already hold the most users
+    # so the fewest move. Users whose data is still in the main database always move.
+    members = {shard: [] for shard in range(shard_count)}
+    pending = []
+    for user_id, shard in sorted(placement.items()):
+        (pending if shard is None else members[shard]).append(user_id)
+    base, extra = divmod(len(placement), shard_count)
+    order = sorted(members, key=lambda shard: -len(members[shard]))
+    share = {shard: base + (i < extra) for i, shard in enumerate(order)}
+    for shard in order:
+        surplus = len(members[shard]) - share[shard]
+        if surplus > 0:
+            pending.extend(members[shard][-surplus:])
+            del members[shard][-surplus:]
+    moves = []
+    for shard in order:
+        while len(members[shard]) < share[shard]:
+            user_id = pending.pop()
+            members[shard].append(user_id)
+            moves.append((user_id, shard))
+    return moves
+
+
+def cmd_rebalance_shards(args):
+    if not db.SHARD_PATHS:
+        raise SystemExit("No shards configured (set RPGLIFE_SHARDS or pass --shards)")
+    db.init_db()
+    moves = _plan_rebalance(db.get_user_shards(), len(db.SHARD_PATHS))
+    for user_id, shard in moves:
+        if not args.dry_run:
+            db.move_user(user_id, shard)
+        print(f"user {user_id} -> shard {shard} ({db.SHARD_PATHS[shard]})")
+    print(f"{len(moves)} user(s) {'to move' if args.dry_run else 'moved'}")
+
+
+def cmd_export(args):
+    count = transfer.export_user(args.user, args.path, args.format)
+    print(f"Exported {count} rows for user {args.user} to {args.path}")
+
+
+def cmd_import(args):
+    try:
+        user_id = transfer.import_user(args.path, args.username)
+    except ValueError as e:
+        raise SystemExit(f"Import failed: {e}")
+    print(f"Imported {args.path} as user {user_id}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="RPG Life maintenance commands")
+    parser.add_argument("--db", help="database file (defaults to rpglife.db next to the app)")
+    parser.add_argument("--shards", help=f"shard database files separated by {os.pathsep!r} "
+                                         "(defaults to $RPGLIFE_SHARDS)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("migrate", help="apply pending schema migrations")
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser("rebuild-counters", help="recompute materialized completion/redemption counters")
+    p.add_argument("--user", type=int, help="only this user id")
+    p.set_defaults(func=cmd_rebuild_counters)
+
+    p = sub.add_parser("rebuild-rollups", help="recompute the per-user daily rollups behind the charts")
+    p.add_argument("--user", type=int, help="only this user id")
+    p.set_defaults(func=cmd_rebuild_rollups)
+
+    p = sub.add_parser("reconcile-ledger", help="check balances and XP against the point ledger")
+    p.add_argument("--repair", action="store_true", help="correct drifted users to the ledger")
+    p.set_defaults(func=cmd_reconcile_ledger)
+
+    p = sub.add_parser("recompute-streaks", help="recompute streaks from completion history in each user's time zone")
+    p.add_argument("--user", type=int, help="only this user id")
+    p.set_defaults(func=cmd_recompute_streaks)
+
+    p = sub.add_parser("refresh-leaderboards",
+                       help="recompute the weekly and monthly leaderboards (the app does this every few minutes)")
+    p.set_defaults(func=cmd_refresh_leaderboards)
+
+    p = sub.add_parser("rebalance-shards",
+                       help="spread users evenly over the shards; stop the app and the API first")
+    p.add_argument("--dry-run", action="store_true", help="only print the moves")
+    p.set_defaults(func=cmd_rebalance_shards)
+
+    p = sub.add_parser("export", help="stream one user's data to a JSONL file or a parquet directory")
+    p.add_argument("user", type=int, help="user id")
+    p.add_argument("path", help="output file (jsonl) or directory (parquet)")
+    p.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("import", help="load an export as a new user, assigning fresh ids")
+    p.add_argument("path", help="export file or parquet directory")
+    p.add_argument("--username", help="import under this username instead of the exported one")
+    p.set_defaults(func=cmd_import)
+
+    args = parser.parse_args(argv)
+    if args.db:
+        db.DB_PATH = args.db
+    if args.shards:
+        db.SHARD_PATHS = [path for path in args.shards.split(os.pathsep) if path]
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,10 @@
+import logging
 import math
-from datetime import datetime, date, timedelta
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from datetime import datetime, timedelta
 import database as db
 
 BASE_POINTS = {1: 10, 2: 25, 3: 50, 4: 100, 5: 200}
@@ -15,6 +20,31 @@ FEATURE_UNLOCKS = {
     "power_ups": 15,
 }
 
+# Requirement types whose threshold each action can cross.
+ACHIEVEMENT_TRIGGERS = {
+    "task_completed": ("tasks_completed", "category_tasks", "streak", "points_saved"),
+    "xp_spent": ("level",),
+    "reward_redeemed": ("rewards_redeemed", "points_saved"),
+}
+LOCKED_RULES_CACHE_SIZE = 10_000
+LEADERBOARD_RELOAD_SECONDS = 300  # XP changed by other processes shows up within this
+LEADERBOARD_REFRESH_SECONDS = 600  # how often the weekly and monthly boards are recomputed
+SCHEDULE_POLL_SECONDS = 60  # longest materializer sleep, to see due times set by other processes
+WEEKDAY_LABELS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+STREAK_COLUMNS = ("time_zone", "last_completion_date", "current_streak", "longest_streak")
+
+_achievement_lock = threading.Lock()
+_rules_by_type = None  # requirement_type -> achievements sorted by requirement_value
+_locked_rules = OrderedDict()  # user_id -> {requirement_type: still-locked achievements, ascending}
+
+_ranking_lock = threading.Lock()
+_ranking = None  # _XpRanking of every user, loaded from the XP index
+_background_lock = threading.Lock()
+_refresher = None  # thread recomputing the weekly and monthly boards
+_materializer = None  # thread releasing scheduled tasks as they come due
+
+log = logging.getLogger("rpglife.models")
+
 
 def level_multiplier(level):
     return 1 + (level - 1) * 0.1
@@ -29,16 +59,25 @@ def xp_for_level(level):
     return 100 * level * level
 
 
+XP_PER_LEVEL_SQUARED = xp_for_level(1)
+MAX_TABLE_LEVEL = 200
+LEVEL_THRESHOLDS = tuple(xp_for_level(lvl) for lvl in range(MAX_TABLE_LEVEL + 2))  # index = level
+_SLOT_LEVELS = tuple(sorted(TASK_SLOT_LIMITS))
+_SLOT_VALUES = tuple(TASK_SLOT_LIMITS[lvl] for lvl in _SLOT_LEVELS)
+
+
+def _threshold(level):
+    return LEVEL_THRESHOLDS[level] if 0 <= level <= MAX_TABLE_LEVEL + 1 else xp_for_level(level)
+
+
 def level_from_xp(total_xp):
-    level = 1
-    while xp_for_level(level) <= total_xp:
-        level += 1
-    return level - 1 if level > 1 else 1
+    # Largest level with 100 * level^2 <= total_xp, exact for any integer XP.
+    return max(1, math.isqrt(max(total_xp, 0) // XP_PER_LEVEL_SQUARED))
 
 
 def xp_progress(total_xp, level):
-    current_threshold = xp_for_level(level)
-    next_threshold = xp_for_level(level + 1)
+    current_threshold = _threshold(level)
+    next_threshold = _threshold(level + 1)
     xp_into_level = total_xp - current_threshold
     xp_needed = next_threshold - current_threshold
     if xp_needed <= 0:
@@ -46,16 +85,29 @@ def xp_progress(total_xp, level):
     return max(0.0, min(1.0, xp_into_level / xp_needed))
 
 
+def level_thresholds(start_level, count):
+    return [(lvl, _threshold(lvl + 1)) for lvl in range(start_level, start_level + count)]
+
+
+def levels_from_xp(xp_values):
+    isqrt, per_level = math.isqrt, XP_PER_LEVEL_SQUARED
+    return [max(1, isqrt(max(xp, 0) // per_level)) for xp in xp_values]
+
+
+def xp_progress_batch(xp_values):
+    # Levels and progress fractions for many XP totals in one pass, for leaderboards and bulk stats jobs.
+    levels = levels_from_xp(xp_values)
+    fractions = [xp_progress(xp, lvl) for xp, lvl in zip(xp_values, levels)]
+    return levels, fractions
+
+
 def reward_cost(value):
     return REWARD_COSTS.get(value, 50)
 
 
 def get_task_slots(level):
-    slots = 3
-    for lvl, s in sorted(TASK_SLOT_LIMITS.items()):
-        if level >= lvl:
-            slots = s
-    return slots
+    i = bisect_right(_SLOT_LEVELS, level)
+    return _SLOT_VALUES[i - 1] if i else 3
 
 
 def is_feature_unlocked(level, feature):
@@ -64,20 +116,21 @@ def is_feature_unlocked(level, feature):
 
 
 def update_streak(user_id):
-    stats = db.get_user_stats(user_id)
-    today = date.today().isoformat()
-    yesterday = (date.today() - timedelta(days=1)).isoformat()
-    last = stats["last_completion_date"]
+    stats = db.get_user_stats(user_id, STREAK_COLUMNS)
+    local_today = datetime.now(db.time_zone(stats.time_zone)).date()
+    today = local_today.isoformat()
+    yesterday = (local_today - timedelta(days=1)).isoformat()
+    last = stats.last_completion_date
 
     if last == today:
-        return stats["current_streak"]
+        return stats.current_streak
 
     if last == yesterday:
-        new_streak = stats["current_streak"] + 1
+        new_streak = stats.current_streak + 1
     else:
         new_streak = 1
 
-    longest = max(stats["longest_streak"], new_streak)
+    longest = max(stats.longest_streak, new_streak)
     db.update_user_stats(
         user_id,
         current_streak=new_streak,
@@ -87,69 +140,254 @@ def update_streak(user_id):
     return new_streak
 
 
-def add_points(user_id, points):
-    stats = db.get_user_stats(user_id)
-    db.update_user_stats(user_id, available_points=stats["available_points"] + points)
+@db.queued_write
+def set_time_zone(user_id, name):
+    # Completions can fall on different local days in the new zone, so the streaks are
+    # recomputed from history. Raises ValueError for an unknown zone; None or "" is the
+    # server's time zone.
+    db.time_zone(name)
+    with db.transaction(db.shard_path(user_id)):
+        db.update_user_stats(user_id, time_zone=name or None)
+        db.recompute_streaks(user_id)
 
 
+def add_points(user_id, points):
+    db.add_points(user_id, points)
+
+
+def parse_schedule(schedule):
+    # "daily", "weekly:<weekdays>" (comma-separated, 0 = Monday) or "every:<days>".
+    # Returns (kind, value); raises ValueError for anything else.
+    kind, _, arg = schedule.partition(":")
+    try:
+        if kind == "daily" and not arg:
+            return kind, None
+        if kind == "weekly":
+            weekdays = frozenset(int(d) for d in arg.split(","))
+            if weekdays and weekdays <= set(range(7)):
+                return kind, weekdays
+        if kind == "every" and 1 <= int(arg) <= 365:
+            return kind, int(arg)
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid schedule {schedule!r}")
+
+
+def make_schedule(kind, weekdays=(), days=1):
+    if kind == "weekly":
+        schedule = "weekly:" + ",".join(str(d) for d in sorted(set(weekdays)))
+    elif kind == "every":
+        schedule = f"every:{days}"
+    else:
+        schedule = kind
+    parse_schedule(schedule)
+    return schedule
+
+
+def describe_schedule(schedule):
+    kind, value = parse_schedule(schedule)
+    if kind == "weekly":
+        return "Weekly on " + ", ".join(WEEKDAY_LABELS[d] for d in sorted(value))
+    if kind == "every":
+        return "Every day" if value == 1 else f"Every {value} days"
+    return "Daily"
+
+
+def next_due_at(schedule, after, zone=None, first=False):
+    # Epoch seconds at which a task on this schedule is next due, counting local days
+    # in zone: the midnight starting the next due day after `after` (a completion).
+    # For a new task (first), today counts and makes it due at once.
+    kind, value = parse_schedule(schedule)
+    day = datetime.fromtimestamp(after, zone).date()
+    if kind == "weekly":
+        offset = next(k for k in range(0 if first else 1, 8) if (day + timedelta(days=k)).weekday() in value)
+    else:
+        offset = 0 if first else (value if kind == "every" else 1)
+    if offset == 0:
+        return int(after)
+    return int(datetime.combine(day + timedelta(days=offset), datetime.min.time(), zone).timestamp())
+
+
+def create_task(user_id, category_id, name, description, difficulty, schedule=None):
+    due = None
+    if schedule is not None:
+        zone = db.time_zone(db.get_user_stats(user_id, ("time_zone",)).time_zone)
+        due = next_due_at(schedule, time.time(), zone, first=True)
+    db.create_task(user_id, category_id, name, description, difficulty, schedule, due)
+
+
+def _next_due(tasks, user_id):
+    # {task_id: next due time} for the scheduled tasks among tasks, completed now.
+    scheduled = [task for task in tasks if task.schedule]
+    if not scheduled:
+        return {}
+    zone = db.time_zone(db.get_user_stats(user_id, ("time_zone",)).time_zone)
+    now = time.time()
+    return {task.id: next_due_at(task.schedule, now, zone) for task in scheduled}
+
+
+@db.queued_write
+def complete_task(user_id, task_id, points):
+    # One transaction (and one commit) for the completion, ledger entry, balance,
+    # streak and any achievements it unlocks. Returns None if the task is not due.
+    with db.transaction(db.shard_path(user_id)):
+        task = next((t for t in db.get_due_tasks(user_id, ("id", "schedule")) if t.id == task_id), None)
+        if task is None:
+            return None
+        db.complete_task(task_id, user_id, points, _next_due([task], user_id).get(task_id))
+        db.add_points(user_id, points)
+        update_streak(user_id)
+        return check_achievements(user_id, "task_completed")
+
+
+@db.queued_write
+def complete_tasks(user_id, task_ids):
+    # Completes several due tasks at once: one transaction, one balance update, one
+    # streak update and one achievement check. Ids that are not due tasks of this
+    # user are skipped. Returns (completed task ids, total points, newly unlocked).
+    with db.transaction(db.shard_path(user_id)):
+        due = {task.id: task for task in db.get_due_tasks(user_id, ("id", "difficulty", "schedule"))}
+        level = db.get_user_stats(user_id, ("level",)).level
+        completions = [
+            (task_id, calc_points_earned(due[task_id].difficulty, level))
+            for task_id in dict.fromkeys(task_ids) if task_id in due
+        ]
+        if not completions:
+            return [], 0, []
+        total = sum(points for _, points in completions)
+        db.complete_tasks(user_id, completions, _next_due([due[task_id] for task_id, _ in completions], user_id))
+        db.add_points(user_id, total)
+        update_streak(user_id)
+        unlocked = check_achievements(user_id, "task_completed")
+    return [task_id for task_id, _ in completions], total, unlocked
+
+
+@db.queued_write
 def spend_points_on_xp(user_id, amount):
-    stats = db.get_user_stats(user_id)
-    if amount > stats["available_points"] or amount <= 0:
+    if amount <= 0:
         return False
-    new_points = stats["available_points"] - amount
-    new_xp = stats["total_xp"] + amount
-    new_level = level_from_xp(new_xp)
-    db.update_user_stats(
-        user_id,
-        available_points=new_points,
-        total_xp=new_xp,
-        level=new_level,
-    )
-    db.spend_points_on_xp(user_id, amount)
+    with db.transaction(db.shard_path(user_id)):
+        if not db.spend_points_on_xp(user_id, amount):
+            return False
+        total_xp = db.get_user_stats(user_id, ("total_xp",)).total_xp
+        db.update_user_stats(user_id, level=level_from_xp(total_xp))
+        db.on_rollback(_forget_ranking, db.shard_path(user_id))
+        _update_ranking(user_id, total_xp)
     return True
 
 
 def spend_points_on_reward(user_id, reward_id, cost):
-    stats = db.get_user_stats(user_id)
-    if cost > stats["available_points"]:
-        return False
-    db.update_user_stats(user_id, available_points=stats["available_points"] - cost)
-    db.redeem_reward(reward_id, user_id, cost)
-    return True
-
+    return db.redeem_reward(reward_id, user_id, cost)
+
+
+@db.queued_write
+def convert_points_to_xp(user_id, amount):
+    # The conversion and the achievements it unlocks as one write; returns (converted, unlocked).
+    with db.transaction(db.shard_path(user_id)):
+        converted = spend_points_on_xp(user_id, amount)
+        return converted, check_achievements(user_id, "xp_spent") if converted else []
+
+
+@db.queued_write
+def redeem_reward(user_id, reward_id, cost):
+    # The redemption and the achievements it unlocks as one write; returns (redeemed, unlocked).
+    with db.transaction(db.shard_path(user_id)):
+        redeemed = spend_points_on_reward(user_id, reward_id, cost)
+        return redeemed, check_achievements(user_id, "reward_redeemed") if redeemed else []
+
+
+def reconcile_ledger(repair=False):
+    # Returns the users whose balance or XP disagrees with the ledger; with repair,
+    # corrects them to the ledger and recomputes their levels.
+    drift = db.reconcile_ledger()
+    if repair:
+        for d in drift:
+            with db.transaction(db.shard_path(d["user_id"])):
+                db.repair_ledger_drift([d])
+                total_xp = db.get_user_stats(d["user_id"], ("total_xp",)).total_xp
+                db.update_user_stats(d["user_id"], level=level_from_xp(total_xp))
+        _forget_ranking()
+    return drift
+
+
+def _achievement_rules():
+    # The catalog is static seed data, so it is loaded once per process.
+    global _rules_by_type
+    if _rules_by_type is None:
+        rules = {}
+        for ach in db.get_all_achievements():
+            rules.setdefault(ach["requirement_type"], []).append(ach)
+        for achs in rules.values():
+            achs.sort(key=lambda a: a["requirement_value"])
+        _rules_by_type = rules
+    return _rules_by_type
+
+
+def _user_locked_rules(user_id):
+    with _achievement_lock:
+        locked = _locked_rules.get(user_id)
+        if locked is not None:
+            _locked_rules.move_to_end(user_id)
+            return locked
 
-def check_achievements(user_id):
-    stats = db.get_user_stats(user_id)
-    all_achievements = db.get_all_achievements()
     unlocked = db.get_user_achievements(user_id)
+    locked = {
+        req_type: [a for a in achs if a["id"] not in unlocked]
+        for req_type, achs in _achievement_rules().items()
+    }
+    with _achievement_lock:
+        locked = _locked_rules.setdefault(user_id, locked)
+        while len(_locked_rules) > LOCKED_RULES_CACHE_SIZE:
+            _locked_rules.popitem(last=False)
+    return locked
+
+
+def _forget_locked_rules(user_id):
+    with _achievement_lock:
+        _locked_rules.pop(user_id, None)
+
+
+def _achievement_metric(user_id, req_type, stats):
+    if req_type == "streak":
+        return stats.longest_streak
+    elif req_type == "tasks_completed":
+        return stats.total_completions
+    elif req_type == "category_tasks":
+        return db.get_max_category_completions(user_id)
+    elif req_type == "level":
+        return stats.level
+    elif req_type == "rewards_redeemed":
+        return stats.rewards_redeemed
+    elif req_type == "points_saved":
+        return stats.available_points
+    return 0
+
+
+def check_achievements(user_id, event=None):
+    # Only the next locked threshold of each affected requirement type matters, so an
+    # action costs one metric read per type it can move, not one per achievement.
+    locked = _user_locked_rules(user_id)
+    req_types = ACHIEVEMENT_TRIGGERS[event] if event else tuple(locked)
     newly_unlocked = []
+    stats = None
 
-    total_completions = db.get_total_completions(user_id)
-    max_cat = db.get_max_category_completions(user_id)
-    redemptions = db.get_redemption_count(user_id)
-
-    for ach in all_achievements:
-        if ach["id"] in unlocked:
+    for req_type in req_types:
+        pending = locked.get(req_type)
+        if not pending:
+            continue
+        if stats is None:
+            stats = db.get_user_stats(user_id)
+        value = _achievement_metric(user_id, req_type, stats)
+
+        with _achievement_lock:
+            met = bisect_right(pending, value, key=lambda a: a["requirement_value"])
+            crossed = pending[:met]
+            del pending[:met]
+        if not crossed:
             continue
 
-        met = False
-        req_type = ach["requirement_type"]
-        req_val = ach["requirement_value"]
-
-        if req_type == "streak":
-            met = stats["longest_streak"] >= req_val
-        elif req_type == "tasks_completed":
-            met = total_completions >= req_val
-        elif req_type == "category_tasks":
-            met = max_cat >= req_val
-        elif req_type == "level":
-            met = stats["level"] >= req_val
-        elif req_type == "rewards_redeemed":
-            met = redemptions >= req_val
-        elif req_type == "points_saved":
-            met = stats["available_points"] >= req_val
-
-        if met:
+        db.on_rollback(lambda: _forget_locked_rules(user_id), db.shard_path(user_id))
+        for ach in crossed:
             if db.unlock_achievement(user_id, ach["id"]):
                 newly_unlocked.append(ach)
 
@@ -158,23 +396,153 @@ def check_achievements(user_id):
 
 def get_achievement_progress(user_id):
     stats = db.get_user_stats(user_id)
-    total_completions = db.get_total_completions(user_id)
+    total_completions = stats.total_completions
     max_cat = db.get_max_category_completions(user_id)
-    redemptions = db.get_redemption_count(user_id)
+    redemptions = stats.rewards_redeemed
 
     def _progress(req_type, req_val):
         if req_type == "streak":
-            return min(1.0, stats["longest_streak"] / req_val)
+            return min(1.0, stats.longest_streak / req_val)
         elif req_type == "tasks_completed":
             return min(1.0, total_completions / req_val)
         elif req_type == "category_tasks":
             return min(1.0, max_cat / req_val)
         elif req_type == "level":
-            return min(1.0, stats["level"] / req_val)
+            return min(1.0, stats.level / req_val)
         elif req_type == "rewards_redeemed":
             return min(1.0, redemptions / req_val)
         elif req_type == "points_saved":
-            return min(1.0, stats["available_points"] / req_val)
+            return min(1.0, stats.available_points / req_val)
         return 0.0
 
     return _progress
+
+
+class _XpRanking:
+    # Users as (-total_xp, user_id) keys in one sorted list: a rank is a bisection, top-K
+    # and neighbours are slices, and an XP change moves a single key.
+    def __init__(self, standings):
+        self.keys = [(-xp, user_id) for xp, user_id in standings]
+        self.xp = {user_id: xp for xp, user_id in standings}
+        self.loaded_at = time.monotonic()
+
+    def set(self, user_id, total_xp):
+        old = self.xp.get(user_id)
+        if old == total_xp:
+            return
+        if old is not None:
+            del self.keys[bisect_left(self.keys, (-old, user_id))]
+        insort(self.keys, (-total_xp, user_id))
+        self.xp[user_id] = total_xp
+
+    def rank(self, user_id):
+        return bisect_left(self.keys, (-self.xp[user_id], user_id)) + 1
+
+    def entries(self, start, stop):
+        start = max(start, 0)
+        return [(rank, user_id, -neg_xp) for rank, (neg_xp, user_id) in enumerate(self.keys[start:stop], start + 1)]
+
+
+def _xp_ranking(user_id=None):
+    # Call with _ranking_lock held. Reloads after LEADERBOARD_RELOAD_SECONDS, and adds
+    # user_id if it was created since the last load.
+    global _ranking
+    if _ranking is None or time.monotonic() - _ranking.loaded_at > LEADERBOARD_RELOAD_SECONDS:
+        _ranking = _XpRanking(db.get_xp_standings())
+    if user_id is not None and user_id not in _ranking.xp:
+        _ranking.set(user_id, db.get_user_stats(user_id, ("total_xp",)).total_xp)
+    return _ranking
+
+
+def _update_ranking(user_id, total_xp):
+    with _ranking_lock:
+        if _ranking is not None:
+            _ranking.set(user_id, total_xp)
+
+
+def _forget_ranking():
+    global _ranking
+    with _ranking_lock:
+        _ranking = None
+
+
+def _leaderboard_rows(entries):
+    names = db.get_usernames(user_id for _, user_id, _ in entries)
+    levels, progress = xp_progress_batch([xp for _, _, xp in entries])
+    return [
+        {"rank": rank, "user_id": user_id, "username": names.get(user_id), "total_xp": xp, "level": level,
+         "progress": fraction}
+        for (rank, user_id, xp), level, fraction in zip(entries, levels, progress)
+    ]
+
+
+def get_top_players(limit=10):
+    with _ranking_lock:
+        entries = _xp_ranking().entries(0, limit)
+    return _leaderboard_rows(entries)
+
+
+def get_rank(user_id):
+    # (1-based all-time rank, number of ranked users).
+    with _ranking_lock:
+        ranking = _xp_ranking(user_id)
+        return ranking.rank(user_id), len(ranking.keys)
+
+
+def get_neighbors(user_id, count=2):
+    # The user and up to count players on either side of them.
+    with _ranking_lock:
+        ranking = _xp_ranking(user_id)
+        rank = ranking.rank(user_id)
+        entries = ranking.entries(rank - 1 - count, rank + count)
+    return _leaderboard_rows(entries)
+
+
+def get_period_leaderboard(board, limit=10):
+    # The stored weekly or monthly board; empty until it has been refreshed this period.
+    current = db.leaderboard_periods()[board]
+    return [dict(row) for row in db.get_leaderboard(board, limit) if row["period_start"] == current]
+
+
+def start_leaderboard_refresh():
+    # Recomputes the weekly and monthly boards every LEADERBOARD_REFRESH_SECONDS on a
+    # daemon thread; starts once per process however often it is called.
+    global _refresher
+    with _background_lock:
+        if _refresher is None:
+            _refresher = threading.Thread(target=_refresh_leaderboards, name="rpglife-leaderboards", daemon=True)
+            _refresher.start()
+
+
+def _refresh_leaderboards():
+    while True:
+        try:
+            db.refresh_leaderboards()
+        except Exception:
+            log.exception("Leaderboard refresh failed")
+        time.sleep(LEADERBOARD_REFRESH_SECONDS)
+
+
+def start_schedule_materializer():
+    # Releases scheduled tasks as they come due, on a daemon thread that sleeps until
+    # the earliest upcoming due time; starts once per process however often it is called.
+    global _materializer
+    with _background_lock:
+        if _materializer is None:
+            _materializer = threading.Thread(target=_materialize_schedules, name="rpglife-schedules", daemon=True)
+            _materializer.start()
+
+
+def _materialize_schedules():
+    released_until = time.time()
+    while True:
+        upcoming = None
+        try:
+            now = time.time()
+            db.release_due_tasks(released_until, now)
+            released_until = now
+            upcoming = db.next_task_due_at(now)
+        except Exception:
+            log.exception("Releasing due tasks failed")
+        wait = SCHEDULE_POLL_SECONDS if upcoming is None else upcoming - time.time()
+        time.sleep(min(max(wait, 0), SCHEDULE_POLL_SECONDS))
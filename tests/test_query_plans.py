@@ -0,0 +1,18 @@
+import pytest
+
+from tools import query_plans
+
+
+@pytest.fixture(scope="module")
+def problems():
+    with query_plans.scratch_database():
+        return query_plans.check()
+
+
+def test_every_public_function_is_exercised(problems):
+    assert [p for p in problems if p.endswith("not exercised by the plan check scenario")] == []
+
+
+def test_queries_use_indexes(problems):
+    # A new SCAN or temp B-tree step needs an index, or an entry with its reason in query_plans.ALLOWED.
+    assert [p for p in problems if not p.endswith("not exercised by the plan check scenario")] == []
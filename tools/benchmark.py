@@ -0,0 +1,382 @@
+"""Benchmark suite for database.py and the main models.py flows.
+
+Generates a synthetic database at each requested size (see tools.synthetic),
+times every public database function plus models.check_achievements,
+spend_points_on_xp and update_streak against randomly chosen users, and writes
+the timings as JSON. Pass --baseline with an earlier result file to report
+functions whose median got slower than --tolerance times the baseline.
+
+    python -m tools.benchmark --users 100,1000 --output bench.json
+    python -m tools.benchmark --users 100,1000 --baseline bench.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+import database as db
+import models
+from tools import synthetic
+
+# Helpers that manage connections, shards or the cache rather than do per-user work.
+NOT_BENCHMARKED = {
+    "get_connection", "get_pool_stats", "close_connections", "transaction", "on_rollback", "init_db", "migrate",
+    "clear_read_cache", "get_cache_stats", "record_queries", "summarize_queries",
+    "queued_write", "get_writer_stats", "shard_path", "get_user_shards", "move_user",
+}
+
+_names = itertools.count()
+
+
+def _last_id(table, user_id):
+    return db.get_connection().execute(f"SELECT MAX(id) FROM {table} WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+
+def _fund(user_id, points):
+    db.get_connection().execute(
+        "UPDATE user_stats SET available_points = available_points + ? WHERE user_id = ?", (points, user_id)
+    )
+    db.clear_read_cache()
+
+
+def _middle_cursor(table, ts_col, user_id):
+    row = db.get_connection().execute(
+        f"SELECT {ts_col}, id FROM {table} WHERE user_id = ? ORDER BY {ts_col} DESC, id DESC LIMIT 1 OFFSET 20",
+        (user_id,),
+    ).fetchone()
+    return db.encode_cursor(row[0], row[1]) if row else None
+
+
+def _new_task(user_id):
+    category_id = db.get_categories(user_id)[0]["id"]
+    db.create_task(user_id, category_id, "Benchmark task", "", 3, schedule="daily")
+    return _last_id("tasks", user_id)
+
+
+def _make_due(task_ids):
+    # Completing a scheduled task makes it wait for its next day; repeated calls need it due.
+    db.get_connection().executemany("UPDATE tasks SET next_due_at = 0 WHERE id = ?", [(t,) for t in task_ids])
+
+
+def _new_reward(user_id):
+    db.create_reward(user_id, "Benchmark reward", "", 1, 50)
+    return _last_id("rewards", user_id)
+
+
+def _reset_streak(user_id):
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    db.update_user_stats(user_id, last_completion_date=yesterday)
+
+
+def _decode_cursor(user_id):
+    token = db.encode_cursor("2024-01-01 00:00:00", user_id)
+    return lambda: db.decode_cursor(token)
+
+
+def _get_user_by_username(user_id):
+    username = db.get_connection().execute("SELECT username FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+    return lambda: db.get_user_by_username(username)
+
+
+def _new_api_token(user_id):
+    token_hash = f"bench_{next(_names)}"
+    db.create_api_token(user_id, token_hash, "9999-12-31 00:00:00")
+    return token_hash
+
+
+def _get_api_token_user(user_id):
+    token_hash = _new_api_token(user_id)
+    return lambda: db.get_api_token_user(token_hash)
+
+
+def _delete_api_token(user_id):
+    token_hash = _new_api_token(user_id)
+    return lambda: db.delete_api_token(token_hash)
+
+
+def _update_category(user_id):
+    db.create_category(user_id, "Benchmark", "📌", "#000000")
+    category_id = _last_id("categories", user_id)
+    return lambda: db.update_category(category_id, user_id, "Renamed", "📌", "#111111")
+
+
+def _delete_category(user_id):
+    db.create_category(user_id, "Benchmark", "📌", "#000000")
+    category_id = _last_id("categories", user_id)
+    return lambda: db.delete_category(category_id, user_id)
+
+
+def _create_task(user_id):
+    category_id = db.get_categories(user_id)[0]["id"]
+    return lambda: db.create_task(user_id, category_id, "Benchmark task", "", 2)
+
+
+def _complete_task(user_id):
+    task_id = _new_task(user_id)
+    return lambda: db.complete_task(task_id, user_id, 50)
+
+
+def _complete_tasks(user_id):
+    completions = [(_new_task(user_id), 50) for _ in range(5)]
+    return lambda: db.complete_tasks(user_id, completions)
+
+
+def _models_complete_tasks(user_id):
+    task_ids = [_new_task(user_id) for _ in range(5)]
+    return lambda: (_make_due(task_ids), models.complete_tasks(user_id, task_ids))
+
+
+def _delete_task(user_id):
+    task_id = _new_task(user_id)
+    return lambda: db.delete_task(task_id, user_id)
+
+
+def _redeem_reward(user_id):
+    reward_id = _new_reward(user_id)
+    _fund(user_id, 50)
+    return lambda: db.redeem_reward(reward_id, user_id, 50)
+
+
+def _delete_reward(user_id):
+    reward_id = _new_reward(user_id)
+    return lambda: db.delete_reward(reward_id, user_id)
+
+
+def _page(fn, table, ts_col):
+    def case(user_id):
+        cursor = _middle_cursor(table, ts_col, user_id)
+        return lambda: fn(user_id, 20, cursor)
+    return case
+
+
+def _import_user(user_id):
+    records = list(db.iter_user_export(user_id))
+    return lambda: db.import_user(records, f"bench_{next(_names)}")
+
+
+def _funded(spend):
+    def case(user_id):
+        _fund(user_id, 100)
+        return lambda: spend(user_id, 100)
+    return case
+
+
+def _update_streak(user_id):
+    _reset_streak(user_id)
+    return lambda: models.update_streak(user_id)
+
+
+# Each case takes a user id, does any untimed setup, and returns the call to time.
+CASES = {
+    "encode_cursor": lambda u: lambda: db.encode_cursor("2024-01-01 00:00:00", u),
+    "decode_cursor": _decode_cursor,
+    "create_user": lambda u: lambda: db.create_user(f"bench_{next(_names)}", "hash", "salt", "pbkdf2_sha256", 1),
+    "get_user_by_username": _get_user_by_username,
+    "update_password_hash": lambda u: lambda: db.update_password_hash(u, "hash", "salt", "pbkdf2_sha256", 1),
+    "get_user_stats": lambda u: lambda: db.get_user_stats(u),
+    "create_api_token": lambda u: lambda: db.create_api_token(u, f"bench_{next(_names)}", "9999-12-31 00:00:00"),
+    "get_api_token_user": _get_api_token_user,
+    "delete_api_token": _delete_api_token,
+    "delete_expired_api_tokens": lambda u: lambda: db.delete_expired_api_tokens(),
+    "update_user_stats": lambda u: lambda: db.update_user_stats(u, current_streak=1),
+
+    "get_categories": lambda u: lambda: db.get_categories(u),
+    "create_category": lambda u: lambda: db.create_category(u, "Benchmark", "📌", "#000000"),
+    "update_category": _update_category,
+    "delete_category": _delete_category,
+
+    "create_task": _create_task,
+    "get_active_tasks": lambda u: lambda: db.get_active_tasks(u),
+    "get_due_tasks": lambda u: lambda: db.get_due_tasks(u),
+    "get_active_task_count": lambda u: lambda: db.get_active_task_count(u),
+    "next_task_due_at": lambda u: lambda: db.next_task_due_at(time.time()),
+    "release_due_tasks": lambda u: lambda: db.release_due_tasks(time.time() - 86400, time.time()),
+    "complete_task": _complete_task,
+    "complete_tasks": _complete_tasks,
+    "get_task_completions": lambda u: lambda: db.get_task_completions(u),
+    "get_task_completions_page": _page(db.get_task_completions_page, "completions", "completed_at"),
+    "get_total_completions": lambda u: lambda: db.get_total_completions(u),
+    "get_category_completion_counts": lambda u: lambda: db.get_category_completion_counts(u),
+    "get_max_category_completions": lambda u: lambda: db.get_max_category_completions(u),
+    "get_weekly_completions": lambda u: lambda: db.get_weekly_completions(u),
+    "get_xp_over_time": lambda u: lambda: db.get_xp_over_time(u),
+    "delete_task": _delete_task,
+
+    "create_reward": lambda u: lambda: db.create_reward(u, "Benchmark reward", "", 1, 50),
+    "get_rewards": lambda u: lambda: db.get_rewards(u),
+    "redeem_reward": _redeem_reward,
+    "get_redemption_count": lambda u: lambda: db.get_redemption_count(u),
+    "get_redemption_history": lambda u: lambda: db.get_redemption_history(u),
+    "get_redemption_history_page": _page(db.get_redemption_history_page, "redemptions", "redeemed_at"),
+    "delete_reward": _delete_reward,
+
+    "get_all_achievements": lambda u: lambda: db.get_all_achievements(),
+    "get_user_achievements": lambda u: lambda: db.get_user_achievements(u),
+    "unlock_achievement": lambda u: lambda: db.unlock_achievement(u, db.get_all_achievements()[-1]["id"]),
+
+    "add_points": lambda u: lambda: db.add_points(u, 10),
+    "spend_points_on_xp": _funded(db.spend_points_on_xp),
+    "get_point_transactions": lambda u: lambda: db.get_point_transactions(u),
+    "get_point_transactions_page": _page(db.get_point_transactions_page, "ledger", "created_at"),
+
+    "rebuild_counters": lambda u: lambda: db.rebuild_counters(u),
+    "reconcile_ledger": lambda u: lambda: db.reconcile_ledger(),
+    "repair_ledger_drift": lambda u: lambda: db.repair_ledger_drift(
+        [{"user_id": u, "available_points": 0, "expected_points": 0, "total_xp": 0, "expected_xp": 0}]),
+    "get_daily_stats": lambda u: lambda: db.get_daily_stats(u),
+    "rebuild_daily_stats": lambda u: lambda: db.rebuild_daily_stats(u),
+    "time_zone": lambda u: lambda: db.time_zone("Europe/Berlin"),
+    "recompute_streaks": lambda u: lambda: db.recompute_streaks(u),
+    "get_xp_standings": lambda u: lambda: db.get_xp_standings(),
+    "get_usernames": lambda u: lambda: db.get_usernames(range(u, u + 10)),
+    "leaderboard_periods": lambda u: lambda: db.leaderboard_periods(),
+    "refresh_leaderboards": lambda u: lambda: db.refresh_leaderboards(),
+    "get_leaderboard": lambda u: lambda: db.get_leaderboard("weekly"),
+
+    "iter_user_export": lambda u: lambda: sum(1 for _ in db.iter_user_export(u)),
+    "import_user": _import_user,
+
+    "models.check_achievements": lambda u: lambda: models.check_achievements(u),
+    "models.complete_tasks": _models_complete_tasks,
+    "models.spend_points_on_xp": _funded(models.spend_points_on_xp),
+    "models.update_streak": _update_streak,
+    "models.get_rank": lambda u: lambda: models.get_rank(u),
+    "models.get_neighbors": lambda u: lambda: models.get_neighbors(u),
+    "models.get_top_players": lambda u: lambda: models.get_top_players(),
+}
+
+
+def missing_cases():
+    public = {
+        name for name, obj in vars(db).items()
+        if callable(obj) and not isinstance(obj, type) and not name.startswith("_") and name not in NOT_BENCHMARKED
+        and getattr(obj, "__module__", None) == db.__name__
+    }
+    return sorted(public - set(CASES))
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    ms = [s / 1e6 for s in samples]
+    return {
+        "runs": len(ms),
+        "min_ms": round(ms[0], 4),
+        "median_ms": round(statistics.median(ms), 4),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 4),
+        "mean_ms": round(statistics.fmean(ms), 4),
+    }
+
+
+def run_size(users, days, repeat, seed, only=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "bench.db")
+        started = time.perf_counter()
+        user_ids = synthetic.generate(users=users, days=days, seed=seed)
+        generate_s = time.perf_counter() - started
+        conn = db.get_connection()
+        rows = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in synthetic.INSERTS}
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        size_bytes = os.path.getsize(db.DB_PATH)
+
+        rng = random.Random(seed)
+        functions = {}
+        try:
+            for name, case in CASES.items():
+                if only and name not in only:
+                    continue
+                samples = []
+                for _ in range(repeat):
+                    call = case(rng.choice(user_ids))
+                    started = time.perf_counter_ns()
+                    call()
+                    samples.append(time.perf_counter_ns() - started)
+                functions[name] = _summary(samples)
+        finally:
+            db.close_connections()
+    return {
+        "users": users,
+        "days": days,
+        "rows": rows,
+        "db_bytes": size_bytes,
+        "generate_s": round(generate_s, 3),
+        "functions": functions,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return (name, users, old_ms, new_ms) for functions slower than tolerance times the baseline."""
+    old = {(size["users"], name): stats["median_ms"]
+           for size in baseline["sizes"] for name, stats in size["functions"].items()}
+    regressions = []
+    for size in results["sizes"]:
+        for name, stats in size["functions"].items():
+            before = old.get((size["users"], name))
+            if before and stats["median_ms"] > before * tolerance:
+                regressions.append((name, size["users"], before, stats["median_ms"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark database.py and models.py at several data sizes")
+    parser.add_argument("--users", default="50,500", help="comma-separated user counts, one run per size")
+    parser.add_argument("--days", type=int, default=90, help="days of history per user")
+    parser.add_argument("--repeat", type=int, default=30, help="timed calls per function per size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", help="comma-separated function names to run")
+    parser.add_argument("--cache", action="store_true", help="keep the read-through cache enabled")
+    parser.add_argument("--output", help="write results to this JSON file (default: stdout)")
+    parser.add_argument("--baseline", help="earlier results file to compare medians against")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    missing = missing_cases()
+    if missing:
+        print("No benchmark case for: " + ", ".join(missing), file=sys.stderr)
+        return 1
+    if not args.cache:
+        db.READ_CACHE_SIZE = 0  # time the queries, not dictionary lookups
+
+    only = set(args.only.split(",")) if args.only else None
+    results = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "read_cache": args.cache,
+        },
+        "sizes": [],
+    }
+    for users in (int(n) for n in args.users.split(",")):
+        print(f"Benchmarking {users} users x {args.days} days...", file=sys.stderr)
+        results["sizes"].append(run_size(users, args.days, args.repeat, args.seed, only))
+
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, users, before, after in regressions:
+            print(f"{name} @ {users} users: {before:.3f} ms -> {after:.3f} ms", file=sys.stderr)
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance}x", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""Query-plan regression check for database.py.
+
+Runs every public function in database.py against a scratch database, captures
+the SQL it issues, and fails if any statement's EXPLAIN QUERY PLAN falls back to
+a full table scan or a temporary B-tree sort that is not explicitly allowed.
+tests/test_query_plans.py runs the same check under pytest.
+
+    python -m tools.query_plans
+"""
+import inspect
+import os
+import re
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import database as db
+
+# Helpers that manage connections rather than issue queries.
+NOT_QUERIES = {
+    "get_connection", "get_pool_stats", "close_connections", "transaction", "on_rollback", "init_db", "migrate",
+    "clear_read_cache", "get_cache_stats", "encode_cursor", "decode_cursor", "record_queries", "summarize_queries",
+    "queued_write", "get_writer_stats", "time_zone", "leaderboard_periods",
+}
+
+# Known plan steps that are acceptable for a specific function, with the reason.
+ALLOWED = {
+    "get_categories": {
+        "USE TEMP B-TREE FOR ORDER BY": "merges the default and custom index ranges; a handful of rows",
+    },
+    "get_all_achievements": {
+        "SCAN achievements": "static catalog read in full by design",
+        "USE TEMP B-TREE FOR ORDER BY": "static catalog read in full by design",
+    },
+    "get_category_completion_counts": {
+        "USE TEMP B-TREE FOR ORDER BY": "orders one row per category by its counter",
+    },
+    "rebuild_counters": {
+        "USE TEMP B-TREE FOR GROUP BY": "maintenance recompute, groups one user's completions",
+    },
+    "rebuild_daily_stats": {
+        "USE TEMP B-TREE FOR GROUP BY": "maintenance recompute, groups one user's events by day",
+    },
+    "reconcile_ledger": {
+        "SCAN user_stats": "checks every user's balance, one sequential pass",
+        "SCAN ledger_checkpoints": "loads every user's checkpoint, one sequential pass",
+    },
+    "import_user": {
+        "SCAN achievements": "loads the static catalog once to map achievement names",
+        "SCAN sqlite_sequence": "one row per table, read once per table to allocate ids",
+        "SCAN user_shards": "counts users per shard (covering index) to place the new one",
+    },
+    "create_user": {
+        "SCAN user_shards": "counts users per shard (covering index) to place the new one",
+    },
+    "get_xp_standings": {
+        "SCAN user_stats USING COVERING INDEX idx_user_stats_xp": "loads every user's XP in rank order, once per "
+                                                                 "LEADERBOARD_RELOAD_SECONDS",
+    },
+    "refresh_leaderboards": {
+        "USE TEMP B-TREE FOR GROUP BY": "scheduled job, sums only the period's XP entries (idx_ledger_type_created) "
+                                        "per user",
+        "SCAN leaderboard_entries": "replaces the stored boards, at most LEADERBOARD_SIZE rows each",
+    },
+    "get_user_shards": {
+        "SCAN u": "lists every user for the offline rebalancer",
+    },
+    "move_user": {
+        "SCAN completions": "foreign key check of the task deletes, which move_user runs with foreign keys off",
+        "SCAN achievements": "loads the static catalog once to map achievement names",
+        "SCAN sqlite_sequence": "one row per table, read once per table to allocate ids",
+    },
+}
+
+BAD_STEP = re.compile(r"^(SCAN (?!CONSTANT ROW)\w+|USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT))")
+
+
+def _scenario():
+    # Exercises every public function once; the tool fails if one is missing here.
+    user_id = db.create_user("plan_check", "hash", "salt", "pbkdf2_sha256", 1)
+    db.get_user_by_username("plan_check")
+    db.update_password_hash(user_id, "hash2", "salt2", "pbkdf2_sha256", 2)
+    db.get_user_stats(user_id)
+    db.update_user_stats(user_id, available_points=100)
+
+    db.create_api_token(user_id, "token-hash", "9999-12-31 00:00:00")
+    db.get_api_token_user("token-hash")
+    db.delete_api_token("token-hash")
+    db.delete_expired_api_tokens()
+
+    db.create_category(user_id, "Custom", "📌", "#000000")
+    categories = db.get_categories(user_id)
+    custom = [c for c in categories if not c["is_default"]][0]
+    db.update_category(custom["id"], user_id, "Custom 2", "📌", "#111111")
+
+    db.create_task(user_id, categories[0]["id"], "Task", "", 2, schedule="daily")
+    task = db.get_active_tasks(user_id)[0]
+    db.get_due_tasks(user_id)
+    db.get_active_task_count(user_id)
+    db.complete_task(task["id"], user_id, 25, next_due_at=int(time.time()) + 3600)
+    db.complete_tasks(user_id, [(task["id"], 25), (task["id"], 25)], {task["id"]: int(time.time()) + 7200})
+    db.next_task_due_at(time.time())
+    db.release_due_tasks(time.time(), time.time() + 86400)
+    db.add_points(user_id, 25)
+    db.get_task_completions(user_id)
+    db.get_task_completions_page(user_id, 10, db.encode_cursor(1 << 62, 1 << 62))
+    db.get_total_completions(user_id)
+    db.get_category_completion_counts(user_id)
+    db.get_max_category_completions(user_id)
+    db.get_weekly_completions(user_id)
+
+    db.spend_points_on_xp(user_id, 10)
+    db.get_xp_over_time(user_id)
+    db.get_point_transactions(user_id)
+    db.get_point_transactions_page(user_id, 10, db.encode_cursor(1 << 62, 1 << 62))
+
+    db.create_reward(user_id, "Reward", "", 1, 50)
+    reward = db.get_rewards(user_id)[0]
+    db.redeem_reward(reward["id"], user_id, 50)
+    db.get_redemption_count(user_id)
+    db.get_redemption_history(user_id)
+    db.get_redemption_history_page(user_id, 10, db.encode_cursor(1 << 62, 1 << 62))
+
+    achievements = db.get_all_achievements()
+    db.unlock_achievement(user_id, achievements[0]["id"])
+    db.get_user_achievements(user_id)
+
+    db.rebuild_counters(user_id)
+    db.reconcile_ledger()
+    db.repair_ledger_drift(db.reconcile_ledger())
+    db.get_daily_stats(user_id, "2000-01-01")
+    db.rebuild_daily_stats(user_id)
+    db.recompute_streaks(user_id)
+    db.recompute_streaks()
+    db.get_xp_standings()
+    db.get_usernames([user_id])
+    db.refresh_leaderboards()
+    db.get_leaderboard("weekly")
+
+    records = db.iter_user_export(user_id)
+    db.import_user(records, "plan_check_copy")
+
+    db.delete_task(task["id"], user_id)
+    db.create_reward(user_id, "Spare", "", 1, 50)
+    spare = [r for r in db.get_rewards(user_id) if r["name"] == "Spare"][0]
+    db.delete_reward(spare["id"], user_id)
+    db.delete_category(custom["id"], user_id)
+
+    db._shard_paths.clear()  # so the lookup reaches the directory
+    db.shard_path(user_id)
+    db.get_user_shards()
+    db.move_user(user_id, 1)
+
+
+def _public_functions():
+    return {
+        name for name, obj in vars(db).items()
+        if callable(obj) and not isinstance(obj, type) and not name.startswith("_") and name not in NOT_QUERIES
+        and getattr(obj, "__module__", None) == db.__name__
+    }
+
+
+def capture_statements():
+    """Return {function_name: [sql, ...]} for every statement the scenario issues."""
+    captured = {}
+    current = [None]
+    originals = {}
+    for name in _public_functions():
+        fn = getattr(db, name)
+        originals[name] = fn
+
+        def traced(*args, _name=name, _fn=fn, **kwargs):
+            outer = current[0]
+            if outer is None:
+                current[0] = _name
+            try:
+                result = _fn(*args, **kwargs)
+                # Drain generators here so their statements are attributed to them.
+                return list(result) if inspect.isgenerator(result) else result
+            finally:
+                current[0] = outer
+        setattr(db, name, traced)
+
+    def on_statement(sql):
+        if current[0] is not None:
+            captured.setdefault(current[0], []).append(sql)
+
+    # Exports read through their own connection, so trace those as they are opened.
+    open_connection = db._open_connection
+
+    def traced_open(*args, **kwargs):
+        new_conn = open_connection(*args, **kwargs)
+        new_conn.set_trace_callback(on_statement)
+        return new_conn
+    db._open_connection = traced_open
+
+    conns = [db.get_connection(path) for path in [db.DB_PATH, *db.SHARD_PATHS]]
+    for conn in conns:
+        conn.set_trace_callback(on_statement)
+    try:
+        _scenario()
+    finally:
+        for conn in conns:
+            conn.set_trace_callback(None)
+        db._open_connection = open_connection
+        for name, fn in originals.items():
+            setattr(db, name, fn)
+    return captured
+
+
+def check():
+    captured = capture_statements()
+    conn = db.get_connection()
+    problems = []
+
+    missing = _public_functions() - set(captured)
+    for name in sorted(missing):
+        problems.append(f"{name}: not exercised by the plan check scenario")
+
+    for name in sorted(captured):
+        allowed = ALLOWED.get(name, {})
+        for sql in dict.fromkeys(captured[name]):
+            if not re.match(r"\s*(SELECT|UPDATE|DELETE|WITH)", sql, re.IGNORECASE):
+                continue
+            for row in conn.execute("EXPLAIN QUERY PLAN " + sql):
+                step = row["detail"]
+                match = BAD_STEP.match(step)
+                if match and match.group(0) not in allowed and step not in allowed:
+                    problems.append(f"{name}: {step}\n    {' '.join(sql.split())}")
+    return problems
+
+
+@contextmanager
+def scratch_database():
+    """Point database.py at a fresh database with two shards, restoring its settings afterwards."""
+    saved = db.DB_PATH, db.SHARD_PATHS, db.READ_CACHE_SIZE
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "plans.db")
+        # Two shards, so the per-user functions are checked through the shard router.
+        db.SHARD_PATHS = [os.path.join(tmp, "shard0.db"), os.path.join(tmp, "shard1.db")]
+        db.READ_CACHE_SIZE = 0  # every call must reach SQLite
+        db.init_db()
+        try:
+            yield
+        finally:
+            db.close_connections()
+            db.DB_PATH, db.SHARD_PATHS, db.READ_CACHE_SIZE = saved
+
+
+def main():
+    with scratch_database():
+        problems = check()
+
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} query plan problem(s)" if problems else "All query plans use indexes.")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""Memory and throughput of the row records against sqlite3.Row on large lists.
+
+Generates a synthetic database, then reads every task, stats row, reward and
+completion in it three ways: sqlite3.Row with all columns (how the reads worked
+before the records), the full named-tuple record, and a record of only the
+columns a typical caller uses. Reports the median fetch time, the time to read
+one field from every row (by attribute, and by key the way sqlite3.Row code
+does) and the memory the fetched list holds, as JSON.
+
+    python -m tools.row_compare --users 2000 --days 90 --output rows.json
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from operator import attrgetter, itemgetter
+
+import database as db
+from tools import synthetic
+
+_COMPLETION_SELECT = {
+    **{column: "tc." + column for column in db.Completion._fields},
+    "completed_at": "datetime(tc.completed_at, 'unixepoch')", "completed_epoch": "tc.completed_at",
+    "task_name": "t.name", "difficulty": "t.difficulty", "category_icon": "c.icon",
+}
+
+# (name, record type, SQL with a {select} slot, field SQL, projected columns, field read per row)
+CASES = (
+    ("tasks", db.Task, "SELECT {select} FROM tasks t JOIN categories c ON t.category_id = c.id",
+     db._TASK_SELECT, ("id", "name", "difficulty", "schedule"), "difficulty"),
+    ("user_stats", db.UserStats, "SELECT {select} FROM user_stats", None, ("level",), "level"),
+    ("rewards", db.Reward, "SELECT {select} FROM rewards", None, ("id", "point_cost"), "point_cost"),
+    ("completions", db.Completion,
+     "SELECT {select} FROM completions tc JOIN tasks t ON tc.task_id = t.id JOIN categories c ON t.category_id = c.id",
+     _COMPLETION_SELECT, ("id", "points_earned", "completed_epoch"), "points_earned"),
+)
+
+
+def _readers(record, sql, expressions, projection):
+    # variant -> function returning the fetched list.
+    conn = db.get_connection()
+    _, select_all = db._projection(record, None, expressions)
+    projected, select_some = db._projection(record, projection, expressions)
+    return {
+        "sqlite3_row": lambda: conn.execute(sql.format(select=select_all)).fetchall(),
+        "record": lambda: db._fetch_records(conn, record, sql.format(select=select_all)),
+        "projected": lambda: db._fetch_records(conn, projected, sql.format(select=select_some)),
+    }
+
+
+def _median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - started)
+    return round(statistics.median(samples) / 1e6, 3)
+
+
+def _retained_bytes(read):
+    # A full collection also empties the interpreter's free lists, which would otherwise
+    # still count the intermediate tuples a read discarded.
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    rows = read()
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del rows
+    return held
+
+
+def run_case(record, sql, expressions, projection, field, repeat):
+    results = {}
+    for variant, read in _readers(record, sql, expressions, projection).items():
+        rows = read()
+        by_key = itemgetter(field)
+        result = {
+            "rows": len(rows),
+            "fetch_ms": _median_ms(read, repeat),
+            "key_access_ms": _median_ms(lambda: list(map(by_key, rows)), repeat),
+            "bytes": _retained_bytes(read),
+        }
+        if variant != "sqlite3_row":
+            by_attribute = attrgetter(field)
+            result["attribute_access_ms"] = _median_ms(lambda: list(map(by_attribute, rows)), repeat)
+        result["bytes_per_row"] = round(result["bytes"] / len(rows), 1) if rows else None
+        results[variant] = result
+    return results
+
+
+def compare(users, days, repeat, seed=0):
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "rows.db")
+        synthetic.generate(users=users, days=days, seed=seed)
+        db.SLOW_QUERY_MS = float("inf")  # whole-table reads are slow by design here
+        report = {"users": users, "days": days, "repeat": repeat, "cases": {}}
+        try:
+            for name, record, sql, expressions, projection, field in CASES:
+                print(f"Reading {name}...", file=sys.stderr)
+                report["cases"][name] = run_case(record, sql, expressions, projection, field, repeat)
+        finally:
+            db.close_connections()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare row records with sqlite3.Row on large result lists")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report to this JSON file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    report = compare(args.users, args.days, args.repeat, args.seed)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    for name, variants in report["cases"].items():
+        row, record, projected = variants["sqlite3_row"], variants["record"], variants["projected"]
+        print(f"{name} ({row['rows']:,} rows): fetch {row['fetch_ms']} -> {record['fetch_ms']} ms "
+              f"({projected['fetch_ms']} ms projected), memory {row['bytes']:,} -> {record['bytes']:,} bytes "
+              f"({projected['bytes']:,} projected)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""Before/after measurement of the compact event-table schema (migration 8).
+
+Generates a synthetic database at the current schema, rebuilds the same data at
+the last TEXT-timestamp schema (version 7) by copying it through the
+compatibility views, then reports file size, per-table size and the latency of
+the hot history queries on both, as JSON.
+
+    python -m tools.schema_compare --users 2000 --days 180 --output compact.json
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import database as db
+from tools import synthetic
+
+LEGACY_VERSION = 7
+
+# (name, legacy SQL, compact SQL); parameters are filled by _params().
+QUERIES = (
+    ("completion_history_page",
+     "SELECT tc.*, t.name as task_name, t.difficulty, c.icon as category_icon FROM task_completions tc "
+     "JOIN tasks t ON tc.task_id = t.id JOIN categories c ON t.category_id = c.id "
+     "WHERE tc.user_id = :user ORDER BY tc.completed_at DESC, tc.id DESC LIMIT 21",
+     "SELECT tc.id, tc.task_id, tc.user_id, tc.points_earned, datetime(tc.completed_at, 'unixepoch') as completed_at, "
+     "t.name as task_name, t.difficulty, c.icon as category_icon FROM completions tc "
+     "JOIN tasks t ON tc.task_id = t.id JOIN categories c ON t.category_id = c.id "
+     "WHERE tc.user_id = :user ORDER BY tc.completed_at DESC, tc.id DESC LIMIT 21"),
+    ("ledger_history_page",
+     "SELECT * FROM point_transactions WHERE user_id = :user ORDER BY created_at DESC, id DESC LIMIT 21",
+     "SELECT l.id, l.user_id, l.amount, t.name as transaction_type, l.reference_id, "
+     "datetime(l.created_at, 'unixepoch') as created_at FROM ledger l JOIN transaction_types t ON t.code = l.type "
+     "WHERE l.user_id = :user ORDER BY l.created_at DESC, l.id DESC LIMIT 21"),
+    ("xp_spent_by_day",
+     "SELECT DATE(created_at), -SUM(amount) FROM point_transactions "
+     "WHERE user_id = :user AND transaction_type = 'spent_xp' GROUP BY DATE(created_at)",
+     f"SELECT DATE(created_at, 'unixepoch'), -SUM(amount) FROM ledger "
+     f"WHERE user_id = :user AND type = {db.SPENT_XP} GROUP BY created_at / 86400"),
+    ("completions_last_week",
+     "SELECT COUNT(*) FROM task_completions WHERE user_id = :user AND completed_at >= :since_text",
+     "SELECT COUNT(*) FROM completions WHERE user_id = :user AND completed_at >= :since_epoch"),
+    ("ledger_balance",
+     "SELECT SUM(amount) FROM point_transactions WHERE user_id = :user",
+     "SELECT SUM(amount) FROM ledger WHERE user_id = :user"),
+)
+
+
+def _build_legacy(source, target):
+    # Same rows at schema version 7: every table copied by column name, the event
+    # tables through the compatibility views that present them in the old format.
+    db.migrate(target, target=LEGACY_VERSION)
+    db.close_connections()
+    conn = sqlite3.connect(target, isolation_level=None)
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.execute("ATTACH DATABASE ? AS src", (source,))
+    conn.execute("BEGIN")
+    tables = [r[0] for r in conn.execute(
+        "SELECT name FROM main.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")]
+    for table in tables:
+        columns = ", ".join(r[1] for r in conn.execute(f"PRAGMA main.table_info({table})"))
+        conn.execute(f"DELETE FROM main.{table}")
+        conn.execute(f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM src.{table}")
+    conn.execute("COMMIT")
+    conn.execute("DETACH DATABASE src")
+    conn.execute("VACUUM")
+    conn.close()
+
+
+def _table_sizes(path):
+    conn = sqlite3.connect(path)
+    try:
+        return dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY 2 DESC"))
+    except sqlite3.OperationalError:
+        return {}  # SQLite built without the dbstat virtual table
+    finally:
+        conn.close()
+
+
+def _time_queries(path, user_ids, repeat, legacy):
+    conn = sqlite3.connect(path)
+    since = datetime.now(timezone.utc) - timedelta(days=7)
+    results = {}
+    for name, legacy_sql, compact_sql in QUERIES:
+        sql = legacy_sql if legacy else compact_sql
+        rng = random.Random(0)
+        samples = []
+        for _ in range(repeat):
+            params = {
+                "user": rng.choice(user_ids),
+                "since_text": since.strftime("%Y-%m-%d %H:%M:%S"),
+                "since_epoch": int(since.timestamp()),
+            }
+            started = time.perf_counter_ns()
+            conn.execute(sql, params).fetchall()
+            samples.append(time.perf_counter_ns() - started)
+        results[name] = {
+            "median_us": round(statistics.median(samples) / 1000, 2),
+            "mean_us": round(statistics.fmean(samples) / 1000, 2),
+        }
+    conn.close()
+    return results
+
+
+def compare(users, days, repeat, seed=0):
+    with tempfile.TemporaryDirectory() as tmp:
+        compact = os.path.join(tmp, "compact.db")
+        legacy = os.path.join(tmp, "legacy.db")
+        db.DB_PATH = compact
+        user_ids = synthetic.generate(users=users, days=days, seed=seed)
+        db.close_connections()
+        conn = sqlite3.connect(compact)
+        conn.execute("VACUUM")
+        conn.close()
+        _build_legacy(compact, legacy)
+
+        report = {"users": users, "days": days, "repeat": repeat}
+        for label, path in (("before", legacy), ("after", compact)):
+            report[label] = {
+                "file_bytes": os.path.getsize(path),
+                "tables": _table_sizes(path),
+                "queries": _time_queries(path, user_ids, repeat, legacy=label == "before"),
+            }
+        report["file_ratio"] = round(report["after"]["file_bytes"] / report["before"]["file_bytes"], 3)
+        report["latency_ratio"] = {
+            name: round(report["after"]["queries"][name]["median_us"] / report["before"]["queries"][name]["median_us"], 3)
+            for name, _, _ in QUERIES
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the compact event-table schema against the TEXT one")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report to this JSON file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    report = compare(args.users, args.days, args.repeat, args.seed)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    before, after = report["before"]["file_bytes"], report["after"]["file_bytes"]
+    print(f"File size: {before:,} -> {after:,} bytes ({report['file_ratio']:.0%})", file=sys.stderr)
+    for name, ratio in report["latency_ratio"].items():
+        print(f"{name}: {ratio:.2f}x median latency", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
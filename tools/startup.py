@@ -0,0 +1,150 @@
+"""Cold-start import benchmark.
+
+Starts a fresh interpreter per run with -X importtime and imports what a worker
+loads for each scenario: app.py's own imports for the login page, then the page
+module for a first visit to the tasks or dashboard page, and plotly once the
+dashboard draws a chart. "eager" is every page plus plotly, which is what app.py
+imported before pages were loaded on demand. Reports the median import time,
+wall time and peak resident memory per scenario plus the slowest modules, as
+JSON. Pass --baseline with an earlier result file to report scenarios whose
+import time got slower than --tolerance times the baseline.
+
+    python -m tools.startup --repeat 10 --output startup.json
+    python -m tools.startup --baseline startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_IMPORTS = ("streamlit", "database", "models", "auth", "components.sidebar")
+PAGES = ("views.dashboard", "views.tasks", "views.rewards", "views.achievements", "views.leaderboard",
+         "views.categories", "views.settings")
+SCENARIOS = {
+    "interpreter": (),
+    "login": APP_IMPORTS,
+    "tasks": APP_IMPORTS + ("views.tasks",),
+    "dashboard": APP_IMPORTS + ("views.dashboard",),
+    "dashboard_charts": APP_IMPORTS + ("views.dashboard", "plotly.graph_objects"),
+    "eager": APP_IMPORTS + PAGES + ("plotly.graph_objects",),
+}
+
+# Printed by the child after its imports: peak RSS, in KiB on Linux and bytes on macOS.
+_RSS = "import resource; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+
+
+def _parse_importtime(stderr):
+    # "import time: <self us> | <cumulative us> | <indent><module>" per imported module.
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(own), int(cumulative)))
+    return modules
+
+
+def run_once(modules):
+    code = "".join(f"import {name}\n" for name in modules) + _RSS
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - started) * 1000
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    rss = int(proc.stdout.split()[-1])
+    imported = _parse_importtime(proc.stderr)
+    return {
+        "wall_ms": wall_ms,
+        "import_ms": sum(own for _, own, _ in imported) / 1000,
+        "rss_kib": rss // 1024 if sys.platform == "darwin" else rss,
+        "modules": imported,
+    }
+
+
+def run_scenario(modules, repeat, top):
+    runs = [run_once(modules) for _ in range(repeat)]
+    # Self time of each module, median across runs, for the slowest-modules list.
+    own = {}
+    for run in runs:
+        for name, us, _ in run["modules"]:
+            own.setdefault(name, []).append(us)
+    slowest = sorted(own.items(), key=lambda item: statistics.median(item[1]), reverse=True)[:top]
+    return {
+        "imports": list(modules),
+        "module_count": len(runs[-1]["modules"]),
+        "import_ms": round(statistics.median(r["import_ms"] for r in runs), 2),
+        "wall_ms": round(statistics.median(r["wall_ms"] for r in runs), 2),
+        "rss_kib": int(statistics.median(r["rss_kib"] for r in runs)),
+        "slowest": {name: round(statistics.median(us) / 1000, 2) for name, us in slowest},
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Return (scenario, old_ms, new_ms) for scenarios slower to import than tolerance times the baseline."""
+    regressions = []
+    for name, stats in results["scenarios"].items():
+        before = baseline["scenarios"].get(name, {}).get("import_ms")
+        if before and stats.get("import_ms", 0) > before * tolerance:
+            regressions.append((name, before, stats["import_ms"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold-start import time and memory with -X importtime")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per scenario")
+    parser.add_argument("--only", help="comma-separated scenario names to run")
+    parser.add_argument("--top", type=int, default=10, help="slowest modules listed per scenario")
+    parser.add_argument("--output", help="write results to this JSON file (default: stdout)")
+    parser.add_argument("--baseline", help="earlier results file to compare import times against")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    only = set(args.only.split(",")) if args.only else None
+    results = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "scenarios": {},
+    }
+    for name, modules in SCENARIOS.items():
+        if only and name not in only:
+            continue
+        try:
+            result = run_scenario(modules, args.repeat, args.top)
+        except RuntimeError as e:
+            # A missing optional package (plotly on a worker that never charts) fails one scenario, not the run.
+            result = {"imports": list(modules), "error": str(e)}
+            print(f"{name}: {e}", file=sys.stderr)
+        else:
+            print(f"{name}: {result['import_ms']} ms imports, {result['wall_ms']} ms wall, "
+                  f"{result['rss_kib']} KiB RSS", file=sys.stderr)
+        results["scenarios"][name] = result
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, before, after in regressions:
+            print(f"{name}: {before:.2f} ms -> {after:.2f} ms", file=sys.stderr)
+        print(f"{len(regressions)} regression(s) beyond {args.tolerance}x", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
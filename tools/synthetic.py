@@ -0,0 +1,191 @@
+"""Synthetic dataset generator.
+
+Fills a database with users, tasks, completions spread over a number of days,
+rewards, redemptions, XP conversions and unlocked achievements. Activity is
+skewed the way real usage is: a few heavy users, many light ones, and more
+easy tasks than epic ones.
+
+    python -m tools.synthetic scratch.db --users 500 --days 180
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import database as db
+import models
+
+DIFFICULTY_WEIGHTS = (30, 30, 20, 12, 8)
+VALUE_WEIGHTS = (40, 30, 18, 9, 3)
+TASK_NAMES = ("Run", "Read", "Stretch", "Tidy desk", "Meditate", "Cook", "Study", "Call family", "Journal", "Walk")
+REWARD_NAMES = ("Coffee", "Movie night", "Game hour", "Dessert", "Day off", "New book")
+
+
+def _timestamp(day, rng):
+    # Epoch seconds, the storage format of the event tables.
+    return int(day.replace(tzinfo=timezone.utc).timestamp()) + rng.randrange(6 * 3600, 23 * 3600)
+
+
+def _next_id(ids, table):
+    ids[table] += 1
+    return ids[table]
+
+
+def _user_rows(rng, ids, default_category_ids, user_id, username, start, days, tasks_per_user, completions_per_day):
+    # Per-user activity is log-normal: most users are light, a few are very heavy.
+    activity = rng.lognormvariate(0, 0.75)
+    rows = {name: [] for name in ("categories", "tasks", "completions", "rewards", "redemptions", "ledger")}
+    created = start.strftime("%Y-%m-%d %H:%M:%S")
+    rows["users"] = [(user_id, username, "synthetic", "synthetic", "pbkdf2_sha256", 1, created)]
+
+    category_ids = list(default_category_ids)
+    for i in range(rng.randrange(0, 3)):
+        category_id = _next_id(ids, "categories")
+        rows["categories"].append((category_id, user_id, f"Custom {i + 1}", "📌", "#4A90D9"))
+        category_ids.append(category_id)
+
+    tasks = []
+    for i in range(max(1, int(rng.gauss(tasks_per_user, tasks_per_user / 3)))):
+        task_id = _next_id(ids, "tasks")
+        difficulty = rng.choices(range(1, 6), DIFFICULTY_WEIGHTS)[0]
+        recurring = int(rng.random() < 0.6)
+        tasks.append((task_id, difficulty, recurring))
+        rows["tasks"].append((task_id, user_id, rng.choice(category_ids), f"{rng.choice(TASK_NAMES)} {i + 1}", "",
+                              difficulty, recurring, 1, created, "daily" if recurring else None,
+                              int(start.timestamp())))
+
+    rewards = []
+    for i in range(rng.randrange(1, 6)):
+        reward_id = _next_id(ids, "rewards")
+        value = rng.choices(range(1, 6), VALUE_WEIGHTS)[0]
+        rewards.append((reward_id, models.reward_cost(value)))
+        rows["rewards"].append((reward_id, user_id, f"{rng.choice(REWARD_NAMES)} {i + 1}", "", value,
+                                models.reward_cost(value), created))
+
+    balance = xp = 0
+    done = set()
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        # Users skip some days entirely, which keeps streak lengths realistic.
+        if rng.random() < 0.25:
+            continue
+        for _ in range(min(len(tasks) * 2, int(rng.expovariate(1 / (completions_per_day * activity))))):
+            task_id, difficulty, recurring = rng.choice(tasks)
+            if not recurring and task_id in done:
+                continue
+            done.add(task_id)
+            points = models.calc_points_earned(difficulty, models.level_from_xp(xp))
+            at = _timestamp(day, rng)
+            rows["completions"].append((_next_id(ids, "completions"), task_id, user_id, points, at))
+            rows["ledger"].append((_next_id(ids, "ledger"), user_id, points, db.EARNED, task_id, at))
+            balance += points
+        if balance >= 100 and rng.random() < 0.3:
+            amount = balance // 2
+            balance -= amount
+            xp += amount
+            rows["ledger"].append((_next_id(ids, "ledger"), user_id, -amount, db.SPENT_XP, None,
+                                   _timestamp(day, rng)))
+        reward_id, cost = rng.choice(rewards)
+        if balance >= cost and rng.random() < 0.2:
+            balance -= cost
+            at = _timestamp(day, rng)
+            rows["redemptions"].append((_next_id(ids, "redemptions"), reward_id, user_id, cost, at))
+            rows["ledger"].append((_next_id(ids, "ledger"), user_id, -cost, db.SPENT_REWARD, reward_id, at))
+
+    rows["user_stats"] = [(user_id, xp, models.level_from_xp(xp), balance)]
+    rows["tasks"] = [row[:7] + ((0,) if not row[6] and row[0] in done else (1,)) + row[8:] for row in rows["tasks"]]
+    return rows
+
+
+INSERTS = {
+    "users": "INSERT INTO users (id, username, password_hash, salt, kdf_algorithm, kdf_iterations, created_at) "
+             "VALUES (?, ?, ?, ?, ?, ?, ?)",
+    "user_stats": "INSERT INTO user_stats (user_id, total_xp, level, available_points) VALUES (?, ?, ?, ?)",
+    "categories": "INSERT INTO categories (id, user_id, name, icon, color) VALUES (?, ?, ?, ?, ?)",
+    "tasks": "INSERT INTO tasks (id, user_id, category_id, name, description, difficulty, is_recurring, is_active, "
+             "created_at, schedule, next_due_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+    "completions": "INSERT INTO completions (id, task_id, user_id, points_earned, completed_at) "
+                   "VALUES (?, ?, ?, ?, ?)",
+    "rewards": "INSERT INTO rewards (id, user_id, name, description, value, point_cost, created_at) "
+               "VALUES (?, ?, ?, ?, ?, ?, ?)",
+    "redemptions": "INSERT INTO redemptions (id, reward_id, user_id, points_spent, redeemed_at) "
+                   "VALUES (?, ?, ?, ?, ?)",
+    "ledger": "INSERT INTO ledger (id, user_id, amount, type, reference_id, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+}
+
+
+def generate(users=100, days=90, tasks_per_user=8, completions_per_day=3, seed=0, path=None):
+    """Add synthetic users to the database at path (default db.DB_PATH); returns their ids."""
+    rng = random.Random(seed)
+    path = path or db.DB_PATH
+    db.init_db(path)
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)
+    user_ids = []
+    with db.transaction(path) as conn:
+        ids = {
+            table: conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+            for table in INSERTS if table != "user_stats"
+        }
+        default_category_ids = [r["id"] for r in conn.execute("SELECT id FROM categories WHERE is_default = 1")]
+        prefix = f"synthetic_{seed}_{ids['users']}"
+        for n in range(users):
+            user_id = _next_id(ids, "users")
+            rows = _user_rows(rng, ids, default_category_ids, user_id, f"{prefix}_{n}", start, days, tasks_per_user,
+                              completions_per_day)
+            for table, sql in INSERTS.items():
+                if rows[table]:
+                    conn.executemany(sql, rows[table])
+            user_ids.append(user_id)
+
+        db._rebuild_counters(conn)
+        db._rebuild_daily_stats(conn)
+        _derive_stats(conn, user_ids)
+    db.clear_read_cache()
+    return user_ids
+
+
+def _derive_stats(conn, user_ids):
+    # Streaks and achievements follow from the generated history rather than being random.
+    achievements = db.get_all_achievements()
+    for start in range(0, len(user_ids), db.STREAK_CHUNK_SIZE):
+        db._recompute_streaks(conn, user_ids[start:start + db.STREAK_CHUNK_SIZE], time.time())
+    for user_id in user_ids:
+        stats = conn.execute("SELECT * FROM user_stats WHERE user_id = ?", (user_id,)).fetchone()
+        metrics = {
+            "tasks_completed": stats["total_completions"],
+            "rewards_redeemed": stats["rewards_redeemed"],
+            "level": stats["level"],
+            "streak": stats["longest_streak"],
+            "points_saved": stats["available_points"],
+            "category_tasks": conn.execute(
+                "SELECT COALESCE(MAX(completions), 0) FROM user_category_stats WHERE user_id = ?", (user_id,)
+            ).fetchone()[0],
+        }
+        conn.executemany(
+            "INSERT OR IGNORE INTO user_achievements (user_id, achievement_id) VALUES (?, ?)",
+            [(user_id, a["id"]) for a in achievements
+             if metrics.get(a["requirement_type"], 0) >= a["requirement_value"]],
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill a database with synthetic RPG Life data")
+    parser.add_argument("db", help="database file to create or extend")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--tasks-per-user", type=int, default=8)
+    parser.add_argument("--completions-per-day", type=float, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    db.DB_PATH = args.db
+    user_ids = generate(args.users, args.days, args.tasks_per_user, args.completions_per_day, args.seed)
+    conn = db.get_connection()
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in INSERTS}
+    print(f"Added {len(user_ids)} users to {args.db}: " + ", ".join(f"{n} {t}" for t, n in counts.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""Concurrent write load test for the single-writer queue.
+
+Runs a number of threads that each complete tasks for their own user as fast as
+they can for a fixed time, once with writes queued to the writer thread and once
+with every thread committing on its own connection, and reports throughput,
+latency, "database is locked" failures and the writer's batching as JSON.
+
+    python -m tools.write_load --threads 1,4,16,64 --seconds 5
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import database as db
+import models
+from tools import synthetic
+
+
+def _recurring_task(user_id):
+    db.create_task(user_id, db.get_categories(user_id)[0]["id"], "Load test", "", 1, schedule="daily")
+    return next(t["id"] for t in db.get_active_tasks(user_id) if t["name"] == "Load test")
+
+
+@db.queued_write
+def _complete_again(user_id, task_id):
+    # A completed daily task waits for tomorrow; making it due again in the same write
+    # lets each thread complete its task over and over.
+    with db.transaction(db.shard_path(user_id)) as conn:
+        conn.execute("UPDATE tasks SET next_due_at = 0 WHERE id = ?", (task_id,))
+        return models.complete_task(user_id, task_id, 10)
+
+
+def _worker(user_id, task_id, start, deadline, result):
+    latencies = []
+    locked = 0
+    start.wait()
+    while time.perf_counter() < deadline[0]:
+        started = time.perf_counter()
+        try:
+            _complete_again(user_id, task_id)
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            locked += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    result.append((latencies, locked))
+
+
+def run(threads, seconds, queued, user_ids, tasks):
+    db.SINGLE_WRITER = queued
+    before = db.get_writer_stats()
+    start = threading.Barrier(threads + 1)
+    deadline = [0.0]
+    results = []
+    workers = [
+        threading.Thread(target=_worker, args=(user_ids[i], tasks[user_ids[i]], start, deadline, results))
+        for i in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    deadline[0] = time.perf_counter() + seconds
+    start.wait()
+    for worker in workers:
+        worker.join()
+
+    latencies = sorted(ms for lats, _ in results for ms in lats)
+    after = db.get_writer_stats()
+    batches = after["batches"] - before["batches"]
+    report = {
+        "threads": threads,
+        "writes": len(latencies),
+        "writes_per_s": round(len(latencies) / seconds, 1),
+        "locked_errors": sum(locked for _, locked in results),
+        "median_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2) if latencies else None,
+    }
+    if queued and batches:
+        report["commits"] = batches
+        report["mean_batch"] = round((after["writes"] - before["writes"]) / batches, 2)
+        report["mean_commit_ms"] = round((after["commit_ms"] - before["commit_ms"]) / batches, 3)
+        report["max_queue_depth"] = after["max_queue_depth"]
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare write throughput with and without the writer queue")
+    parser.add_argument("--threads", default="1,4,16,64", help="comma-separated thread counts")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--synchronous", default="NORMAL", help="PRAGMA synchronous for the run (e.g. FULL)")
+    parser.add_argument("--output", help="write the report to this JSON file (default: stdout)")
+    args = parser.parse_args(argv)
+    thread_counts = [int(n) for n in args.threads.split(",")]
+
+    db.PRAGMAS = tuple((name, args.synchronous if name == "synchronous" else value) for name, value in db.PRAGMAS)
+    report = {"synchronous": args.synchronous, "seconds": args.seconds, "queued": [], "direct": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_PATH = os.path.join(tmp, "load.db")
+        user_ids = synthetic.generate(users=max(thread_counts), days=30)
+        tasks = {user_id: _recurring_task(user_id) for user_id in user_ids}
+        try:
+            for threads in thread_counts:
+                for mode in ("queued", "direct"):
+                    result = run(threads, args.seconds, mode == "queued", user_ids, tasks)
+                    report[mode].append(result)
+                    print(f"{mode:>6} {threads:>3} threads: {result['writes_per_s']:>8} writes/s, "
+                          f"{result['locked_errors']} locked", file=sys.stderr)
+        finally:
+            db.close_connections()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import json
+import os
+
+import database as db
+
+FORMAT_VERSION = 1
+
+# Parquet column types per export table, in db.EXPORT_QUERIES column order. Fixed rather
+# than inferred per batch: a nullable column that happens to be all NULL in one batch
+# would otherwise get the null type and clash with the file's schema.
+PARQUET_COLUMNS = {
+    "users": (("id", "int"), ("username", "text"), ("password_hash", "text"), ("salt", "text"),
+              ("kdf_algorithm", "text"), ("kdf_iterations", "int"), ("created_at", "text")),
+    "user_stats": (("total_xp", "int"), ("level", "int"), ("available_points", "int"), ("current_streak", "int"),
+                   ("longest_streak", "int"), ("last_completion_date", "text"), ("time_zone", "text")),
+    "categories": (("id", "int"), ("name", "text"), ("icon", "text"), ("color", "text"), ("is_default", "int")),
+    "tasks": (("id", "int"), ("category_id", "int"), ("name", "text"), ("description", "text"), ("difficulty", "int"),
+              ("is_recurring", "int"), ("is_active", "int"), ("created_at", "text"), ("schedule", "text"),
+              ("next_due_at", "int")),
+    "task_completions": (("id", "int"), ("task_id", "int"), ("points_earned", "int"), ("completed_at", "text")),
+    "rewards": (("id", "int"), ("name", "text"), ("description", "text"), ("value", "int"), ("point_cost", "int"),
+                ("created_at", "text")),
+    "reward_redemptions": (("id", "int"), ("reward_id", "int"), ("points_spent", "int"), ("redeemed_at", "text")),
+    "user_achievements": (("achievement", "text"), ("unlocked_at", "text")),
+    "point_transactions": (("id", "int"), ("amount", "int"), ("transaction_type", "text"), ("reference_id", "int"),
+                           ("created_at", "text")),
+}
+
+
+def export_jsonl(user_id, path, batch_size=db.EXPORT_BATCH_SIZE):
+    # One header line, then one {"table", "row"} object per line, written as rows stream in.
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"format": "rpglife-export", "version": FORMAT_VERSION}) + "\n")
+        for table, row in db.iter_user_export(user_id, batch_size):
+            f.write(json.dumps({"table": table, "row": row}, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def read_jsonl(path):
+    with open(path, encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("format") != "rpglife-export" or header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path} is not an rpglife export")
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield record["table"], record["row"]
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from None
+    return pyarrow
+
+
+def _parquet_schema(pa, table):
+    types = {"int": pa.int64(), "text": pa.string()}
+    return pa.schema([(name, types[kind]) for name, kind in PARQUET_COLUMNS[table]])
+
+
+def export_parquet(user_id, directory, batch_size=db.EXPORT_BATCH_SIZE):
+    # One <table>.parquet file per table, each written a record batch at a time.
+    pa = _require_pyarrow()
+    os.makedirs(directory, exist_ok=True)
+    count = 0
+    writer = None
+    table = None
+    batch = []
+
+    def flush():
+        nonlocal writer
+        if not batch:
+            return
+        if writer is None:
+            schema = _parquet_schema(pa, table)
+            # from_pylist() drops keys the schema lacks, so a new export column must not slip by.
+            if list(batch[0]) != schema.names:
+                raise RuntimeError(f"PARQUET_COLUMNS[{table!r}] does not match the columns exported for it")
+            writer = pa.parquet.ParquetWriter(os.path.join(directory, f"{table}.parquet"), schema)
+        writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=writer.schema))
+        batch.clear()
+
+    try:
+        for row_table, row in db.iter_user_export(user_id, batch_size):
+            if row_table != table:
+                flush()
+                if writer is not None:
+                    writer.close()
+                    writer = None
+                table = row_table
+            batch.append(row)
+            count += 1
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def read_parquet(directory, batch_size=db.EXPORT_BATCH_SIZE):
+    pa = _require_pyarrow()
+    for table, _ in db.EXPORT_QUERIES:
+        path = os.path.join(directory, f"{table}.parquet")
+        if not os.path.exists(path):
+            continue
+        for record_batch in pa.parquet.ParquetFile(path).iter_batches(batch_size=batch_size):
+            for row in record_batch.to_pylist():
+                yield table, row
+
+
+def export_user(user_id, path, fmt="jsonl"):
+    if fmt == "parquet":
+        return export_parquet(user_id, path)
+    return export_jsonl(user_id, path)
+
+
+def import_user(path, username=None):
+    records = read_parquet(path) if os.path.isdir(path) else read_jsonl(path)
+    return db.import_user(records, username)
@@ -5,7 +5,7 @@ import models
 
 def render(user_id):
     stats = db.get_user_stats(user_id)
-    level = stats["level"]
+    level = stats.level
 
     st.header("📁 Categories")
 
@@ -41,7 +41,7 @@ def render(user_id):
                     )
                 with col3:
                     if st.button("🗑️", key=f"del_cat_{cat['id']}"):
-                        db.delete_category(cat["id"])
+                        db.delete_category(cat["id"], user_id)
                         st.rerun()
     else:
         st.info("No custom categories yet.")
@@ -3,6 +3,8 @@ import database as db
 import models
 from components.charts import xp_over_time_chart, category_distribution_chart, weekly_completions_chart
 
+ACTIVITY_PAGE_SIZE = 10
+
 
 def render(user_id):
     stats = db.get_user_stats(user_id)
@@ -11,29 +13,29 @@ def render(user_id):
 
     # Top metrics
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("Level", stats["level"])
-    col2.metric("Total XP", f"{stats['total_xp']:,}")
-    col3.metric("Available Points", f"{stats['available_points']:,}")
-    col4.metric("Current Streak", f"{stats['current_streak']} days")
+    col1.metric("Level", stats.level)
+    col2.metric("Total XP", f"{stats.total_xp:,}")
+    col3.metric("Available Points", f"{stats.available_points:,}")
+    col4.metric("Current Streak", f"{stats.current_streak} days")
 
     # XP Progress
-    progress = models.xp_progress(stats["total_xp"], stats["level"])
-    next_xp = models.xp_for_level(stats["level"] + 1)
-    st.subheader(f"Level {stats['level']} → {stats['level'] + 1}")
-    st.progress(progress, text=f"{stats['total_xp']:,} / {next_xp:,} XP")
+    progress = models.xp_progress(stats.total_xp, stats.level)
+    next_xp = models.xp_for_level(stats.level + 1)
+    st.subheader(f"Level {stats.level} → {stats.level + 1}")
+    st.progress(progress, text=f"{stats.total_xp:,} / {next_xp:,} XP")
 
     # Streak info
-    st.markdown(f"**Longest Streak:** {stats['longest_streak']} days")
+    st.markdown(f"**Longest Streak:** {stats.longest_streak} days")
 
     # Convert points to XP
-    if stats["available_points"] > 0:
+    if stats.available_points > 0:
         st.divider()
         st.subheader("Convert Points to XP")
-        max_pts = stats["available_points"]
+        max_pts = stats.available_points
         amount = st.number_input("Points to convert (1 point = 1 XP)", min_value=1, max_value=max_pts, value=min(10, max_pts))
         if st.button("Convert to XP", type="primary"):
-            if models.spend_points_on_xp(user_id, amount):
-                newly_unlocked = models.check_achievements(user_id)
+            converted, newly_unlocked = models.convert_points_to_xp(user_id, amount)
+            if converted:
                 st.success(f"Converted {amount} points to {amount} XP!")
                 for ach in newly_unlocked:
                     st.toast(f"🏆 Achievement unlocked: {ach['name']}")
@@ -64,12 +66,22 @@ def render(user_id):
     # Recent activity
     st.divider()
     st.subheader("Recent Activity")
-    completions = db.get_task_completions(user_id, limit=10)
-    if completions:
+    # Each loaded page continues from the one before it, so deep pages cost the same as the first.
+    pages = st.session_state.setdefault("activity_pages", 1)
+    cursor = None
+    shown = 0
+    for _ in range(pages):
+        completions, cursor = db.get_task_completions_page(user_id, ACTIVITY_PAGE_SIZE, cursor)
         for c in completions:
             st.markdown(
-                f"{c['category_icon']} **{c['task_name']}** — "
-                f"+{c['points_earned']} pts — {c['completed_at'][:16]}"
+                f"{c.category_icon} **{c.task_name}** — "
+                f"+{c.points_earned} pts — {c.completed_at[:16]}"
             )
-    else:
+        shown += len(completions)
+        if cursor is None:
+            break
+    if not shown:
         st.info("No activity yet. Go complete some tasks!")
+    elif cursor is not None and st.button("Load more", key="activity_load_more"):
+        st.session_state["activity_pages"] = pages + 1
+        st.rerun()
@@ -0,0 +1,44 @@
+import streamlit as st
+import models
+
+
+def render(user_id):
+    st.header("🥇 Leaderboard")
+
+    all_time, weekly, monthly = st.tabs(["All Time", "This Week", "This Month"])
+
+    with all_time:
+        rank, total = models.get_rank(user_id)
+        st.metric("Your Rank", f"#{rank:,}", help=f"Out of {total:,} adventurers, by total XP")
+        st.subheader("Top 10")
+        _render_board(models.get_top_players(10), user_id, "total_xp", "Total XP", levels=True)
+        st.subheader("Around You")
+        _render_board(models.get_neighbors(user_id, 2), user_id, "total_xp", "Total XP", levels=True)
+
+    for tab, board, period in ((weekly, "weekly", "week"), (monthly, "monthly", "month")):
+        with tab:
+            entries = models.get_period_leaderboard(board, 10)
+            if not entries:
+                st.info(f"No XP gained this {period} yet. Boards update every few minutes.")
+                continue
+            _render_board(entries, user_id, "xp", "XP Gained")
+            st.caption(f"Since {entries[0]['period_start']} (UTC), updated {entries[0]['refreshed_at']} UTC.")
+
+
+def _render_board(entries, user_id, xp_key, xp_label, levels=False):
+    rows = [
+        {
+            "Rank": f"#{e['rank']}",
+            "Adventurer": e["username"] + (" (you)" if e["user_id"] == user_id else ""),
+            xp_label: e[xp_key],
+        }
+        for e in entries
+    ]
+    column_config = None
+    if levels:
+        # All-time rows carry each player's level and progress to the next one.
+        for row, e in zip(rows, entries):
+            row["Level"] = e["level"]
+            row["Progress"] = e["progress"]
+        column_config = {"Progress": st.column_config.ProgressColumn("Next Level", min_value=0.0, max_value=1.0)}
+    st.dataframe(rows, hide_index=True, use_container_width=True, column_config=column_config)
@@ -2,11 +2,13 @@ import streamlit as st
 import database as db
 import models
 
+HISTORY_PAGE_SIZE = 20
+
 
 def render(user_id):
     stats = db.get_user_stats(user_id)
     st.header("🎁 Rewards")
-    st.metric("Available Points", f"{stats['available_points']:,}")
+    st.metric("Available Points", f"{stats.available_points:,}")
 
     # Form reset counter
     if "reward_form_counter" not in st.session_state:
@@ -49,40 +51,49 @@ def render(user_id):
             with st.container(border=True):
                 col1, col2, col3 = st.columns([4, 2, 2])
                 with col1:
-                    st.markdown(f"**{reward['name']}**")
-                    if reward["description"]:
-                        st.caption(reward["description"])
-                    stars = "⭐" * reward["value"]
-                    st.markdown(f"Tier {reward['value']} {stars}")
+                    st.markdown(f"**{reward.name}**")
+                    if reward.description:
+                        st.caption(reward.description)
+                    stars = "⭐" * reward.value
+                    st.markdown(f"Tier {reward.value} {stars}")
                 with col2:
-                    st.markdown(f"**{reward['point_cost']:,} pts**")
-                    can_afford = stats["available_points"] >= reward["point_cost"]
+                    st.markdown(f"**{reward.point_cost:,} pts**")
+                    can_afford = stats.available_points >= reward.point_cost
                     if can_afford:
                         st.caption("✅ Affordable")
                     else:
-                        needed = reward["point_cost"] - stats["available_points"]
+                        needed = reward.point_cost - stats.available_points
                         st.caption(f"Need {needed:,} more")
                 with col3:
-                    if st.button("🛒 Redeem", key=f"redeem_{reward['id']}",
+                    if st.button("🛒 Redeem", key=f"redeem_{reward.id}",
                                  disabled=not can_afford, use_container_width=True):
-                        if models.spend_points_on_reward(user_id, reward["id"], reward["point_cost"]):
-                            newly_unlocked = models.check_achievements(user_id)
-                            st.success(f"Redeemed: {reward['name']}!")
+                        redeemed, newly_unlocked = models.redeem_reward(user_id, reward.id, reward.point_cost)
+                        if redeemed:
+                            st.success(f"Redeemed: {reward.name}!")
                             for ach in newly_unlocked:
                                 st.toast(f"🏆 Achievement unlocked: {ach['name']}")
                             st.rerun()
-                    if st.button("🗑️", key=f"del_reward_{reward['id']}", use_container_width=True):
-                        db.delete_reward(reward["id"], user_id)
+                    if st.button("🗑️", key=f"del_reward_{reward.id}", use_container_width=True):
+                        db.delete_reward(reward.id, user_id)
                         st.rerun()
 
     # Redemption history
     st.divider()
     st.subheader("Redemption History")
-    history = db.get_redemption_history(user_id)
-    if history:
+    pages = st.session_state.setdefault("redemption_pages", 1)
+    cursor = None
+    shown = 0
+    for _ in range(pages):
+        history, cursor = db.get_redemption_history_page(user_id, HISTORY_PAGE_SIZE, cursor)
         for h in history:
             st.markdown(
                 f"⭐ **{h['reward_name']}** — {h['points_spent']:,} pts — {h['redeemed_at'][:16]}"
             )
-    else:
+        shown += len(history)
+        if cursor is None:
+            break
+    if not shown:
         st.info("No redemptions yet.")
+    elif cursor is not None and st.button("Load more", key="redemptions_load_more"):
+        st.session_state["redemption_pages"] = pages + 1
+        st.rerun()
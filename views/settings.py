@@ -1,7 +1,12 @@
+import zoneinfo
+from functools import lru_cache
+
 import streamlit as st
 import database as db
 import models
 
+SERVER_TIME_ZONE = "Server default"
+
 
 def render(user_id):
     stats = db.get_user_stats(user_id)
@@ -13,39 +18,50 @@ def render(user_id):
     st.markdown(f"**Username:** {username}")
     st.markdown(f"**Account created:** {_get_created_at(user_id)}")
 
+    zones = _time_zone_names()
+    current = stats.time_zone or SERVER_TIME_ZONE
+    with st.form("time_zone"):
+        choice = st.selectbox("Time zone", zones, index=zones.index(current) if current in zones else 0,
+                              help="Streaks count days in this time zone.")
+        if st.form_submit_button("Save time zone") and choice != current:
+            models.set_time_zone(user_id, None if choice == SERVER_TIME_ZONE else choice)
+            st.rerun()
+
     st.divider()
     st.subheader("Stats Overview")
-    total_completions = db.get_total_completions(user_id)
-    redemptions = db.get_redemption_count(user_id)
-
     col1, col2, col3 = st.columns(3)
-    col1.metric("Tasks Completed", total_completions)
-    col2.metric("Rewards Redeemed", redemptions)
-    col3.metric("Longest Streak", f"{stats['longest_streak']} days")
+    col1.metric("Tasks Completed", stats.total_completions)
+    col2.metric("Rewards Redeemed", stats.rewards_redeemed)
+    col3.metric("Longest Streak", f"{stats.longest_streak} days")
 
     st.divider()
     st.subheader("Feature Unlocks")
     for feature, req_level in sorted(models.FEATURE_UNLOCKS.items(), key=lambda x: x[1]):
         label = feature.replace("_", " ").title()
-        unlocked = stats["level"] >= req_level
+        unlocked = stats.level >= req_level
         icon = "✅" if unlocked else "🔒"
         st.markdown(f"{icon} **{label}** — Level {req_level}")
 
     st.divider()
     st.subheader("Point Multiplier")
-    mult = models.level_multiplier(stats["level"])
-    st.markdown(f"Current multiplier: **{mult:.1f}x** (Level {stats['level']})")
+    mult = models.level_multiplier(stats.level)
+    st.markdown(f"Current multiplier: **{mult:.1f}x** (Level {stats.level})")
     st.caption("Earn 10% more base points per level.")
 
     st.divider()
     st.subheader("Level Progression")
-    for lvl in range(stats["level"], min(stats["level"] + 5, 51)):
-        xp_needed = models.xp_for_level(lvl + 1)
+    shown = max(0, min(stats.level + 5, 51) - stats.level)
+    for lvl, xp_needed in models.level_thresholds(stats.level, shown):
         st.caption(f"Level {lvl} → {lvl + 1}: {xp_needed:,} XP")
 
 
+@lru_cache(maxsize=1)
+def _time_zone_names():
+    # Reads the zone database from disk, so only once per process.
+    return [SERVER_TIME_ZONE] + sorted(zoneinfo.available_timezones())
+
+
 def _get_created_at(user_id):
     conn = db.get_connection()
     row = conn.execute("SELECT created_at FROM users WHERE id = ?", (user_id,)).fetchone()
-    conn.close()
     return row["created_at"][:10] if row else "Unknown"
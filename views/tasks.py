@@ -5,14 +5,17 @@ import models
 
 def render(user_id):
     stats = db.get_user_stats(user_id)
-    level = stats["level"]
+    level = stats.level
 
     st.header("📋 Tasks")
 
-    active_tasks = db.get_active_tasks(user_id)
+    # Only due tasks are listed; scheduled ones waiting for their next day still hold a slot.
+    due_tasks = db.get_due_tasks(user_id)
+    active_count = db.get_active_task_count(user_id)
     max_slots = models.get_task_slots(level)
-    slots_text = "Unlimited" if max_slots == -1 else f"{len(active_tasks)} / {max_slots}"
-    st.caption(f"Active task slots: {slots_text}")
+    slots_text = "Unlimited" if max_slots == -1 else f"{active_count} / {max_slots}"
+    waiting = active_count - len(due_tasks)
+    st.caption(f"Active task slots: {slots_text}" + (f" · {waiting} scheduled for later" if waiting else ""))
 
     # Form reset counter
     if "task_form_counter" not in st.session_state:
@@ -20,9 +23,9 @@ def render(user_id):
     tc = st.session_state.task_form_counter
 
     # Create task form
-    can_create = max_slots == -1 or len(active_tasks) < max_slots
+    can_create = max_slots == -1 or active_count < max_slots
     if can_create:
-        with st.expander("➕ Create New Task", expanded=len(active_tasks) == 0):
+        with st.expander("➕ Create New Task", expanded=active_count == 0):
             categories = db.get_categories(user_id)
             cat_options = {f"{c['icon']} {c['name']}": c["id"] for c in categories}
 
@@ -40,9 +43,9 @@ def render(user_id):
                     key=f"new_task_diff_{tc}",
                 )
 
-            is_recurring = False
+            schedule = None
             if models.is_feature_unlocked(level, "recurring_tasks"):
-                is_recurring = st.checkbox("Recurring (reappears after completion)", key=f"new_task_recur_{tc}")
+                schedule = _schedule_input(tc)
 
             preview_pts = models.calc_points_earned(difficulty, level)
             st.info(f"Completing this will earn **{preview_pts} points**")
@@ -50,53 +53,86 @@ def render(user_id):
             if st.button("Create Task", use_container_width=True, key=f"create_task_btn_{tc}"):
                 if not name.strip():
                     st.error("Task name is required.")
+                elif schedule == "":
+                    st.error("Pick at least one weekday.")
                 else:
-                    db.create_task(user_id, cat_options[cat_label], name.strip(),
-                                   description.strip(), difficulty, is_recurring)
+                    models.create_task(user_id, cat_options[cat_label], name.strip(),
+                                       description.strip(), difficulty, schedule)
                     st.success("Task created!")
                     st.session_state.task_form_counter += 1
                     st.rerun()
     else:
         st.warning(f"You've reached your task slot limit ({max_slots}). Level up to unlock more!")
 
-    # Active tasks list
+    # Due tasks list
     st.divider()
-    if not active_tasks:
-        st.info("No active tasks. Create one above!")
+    if not due_tasks:
+        st.info("Nothing due right now." if active_count else "No active tasks. Create one above!")
         return
 
-    for task in active_tasks:
-        diff_label = models.DIFFICULTY_LABELS[task["difficulty"]]
-        diff_color = models.DIFFICULTY_COLORS[task["difficulty"]]
-        pts = models.calc_points_earned(task["difficulty"], level)
+    task_labels = {task.id: f"{task.category_icon} {task.name}" for task in due_tasks}
+    col1, col2 = st.columns([6, 2])
+    with col1:
+        selected = st.multiselect("Complete several at once", list(task_labels), format_func=task_labels.get,
+                                  placeholder="Select tasks", key="complete_selected_tasks")
+    with col2:
+        st.write("")
+        if st.button("✅ Complete selected", disabled=not selected, use_container_width=True):
+            completed, total, newly_unlocked = models.complete_tasks(user_id, selected)
+            st.session_state.pop("complete_selected_tasks", None)
+            st.success(f"Completed {len(completed)} tasks: +{total} points earned!")
+            for ach in newly_unlocked:
+                st.toast(f"🏆 Achievement unlocked: {ach['name']}")
+            st.rerun()
+
+    for task in due_tasks:
+        diff_label = models.DIFFICULTY_LABELS[task.difficulty]
+        diff_color = models.DIFFICULTY_COLORS[task.difficulty]
+        pts = models.calc_points_earned(task.difficulty, level)
 
         with st.container(border=True):
             col1, col2, col3 = st.columns([4, 2, 2])
             with col1:
                 st.markdown(
-                    f"**{task['category_icon']} {task['name']}**"
+                    f"**{task.category_icon} {task.name}**"
                 )
-                if task["description"]:
-                    st.caption(task["description"])
+                if task.description:
+                    st.caption(task.description)
                 st.markdown(
                     f"<span style='color:{diff_color};font-weight:bold;'>"
-                    f"{'★' * task['difficulty']}{'☆' * (5 - task['difficulty'])} {diff_label}</span>",
+                    f"{'★' * task.difficulty}{'☆' * (5 - task.difficulty)} {diff_label}</span>",
                     unsafe_allow_html=True,
                 )
             with col2:
                 st.markdown(f"**+{pts} pts**")
-                if task["is_recurring"]:
-                    st.caption("🔄 Recurring")
+                if task.schedule:
+                    st.caption(f"🔄 {models.describe_schedule(task.schedule)}")
             with col3:
-                if st.button("✅ Complete", key=f"complete_{task['id']}", use_container_width=True):
-                    db.complete_task(task["id"], user_id, pts)
-                    models.add_points(user_id, pts)
-                    models.update_streak(user_id)
-                    newly_unlocked = models.check_achievements(user_id)
-                    st.success(f"+{pts} points earned!")
-                    for ach in newly_unlocked:
-                        st.toast(f"🏆 Achievement unlocked: {ach['name']}")
+                if st.button("✅ Complete", key=f"complete_{task.id}", use_container_width=True):
+                    newly_unlocked = models.complete_task(user_id, task.id, pts)
+                    if newly_unlocked is None:
+                        st.warning("Already completed.")
+                    else:
+                        st.success(f"+{pts} points earned!")
+                        for ach in newly_unlocked:
+                            st.toast(f"🏆 Achievement unlocked: {ach['name']}")
                     st.rerun()
-                if st.button("🗑️", key=f"delete_{task['id']}", use_container_width=True):
-                    db.delete_task(task["id"], user_id)
+                if st.button("🗑️", key=f"delete_{task.id}", use_container_width=True):
+                    db.delete_task(task.id, user_id)
                     st.rerun()
+
+
+def _schedule_input(tc):
+    # Returns a schedule string, None for a one-off task, or "" for a weekly schedule
+    # without weekdays.
+    repeat = st.selectbox("Repeat", ["Never", "Daily", "Weekly", "Every N days"], key=f"new_task_repeat_{tc}")
+    if repeat == "Daily":
+        return "daily"
+    if repeat == "Weekly":
+        weekdays = st.multiselect("On", range(7), format_func=models.WEEKDAY_LABELS.__getitem__,
+                                  key=f"new_task_weekdays_{tc}")
+        return models.make_schedule("weekly", weekdays) if weekdays else ""
+    if repeat == "Every N days":
+        days = st.number_input("Every how many days", min_value=1, max_value=365, value=2, key=f"new_task_days_{tc}")
+        return models.make_schedule("every", days=int(days))
+    return None